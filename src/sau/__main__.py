@@ -12,41 +12,164 @@ import time
 import logging
 from logging import handlers
 import sys
-from prometheus_client.core import GaugeMetricFamily, REGISTRY
-from prometheus_client import start_http_server
+from prometheus_client.core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    HistogramMetricFamily,
+    REGISTRY,
+)
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.openmetrics import exposition as openmetrics
 import prometheus_client
 from argparse import ArgumentParser
 import yaml
 import boto3
-import multiprocessing
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from botocore.exceptions import ClientError
 import sys
 import platform
 import json
-from multiprocessing_logging import install_mp_handler
-from typing import Any, Callable, Dict
+import threading
+import random
+import collections
+import queue
+import multiprocessing
+import os
+import re
+import fnmatch
+import asyncio
+import functools
+import itertools
+import hashlib
+import heapq
+import bisect
+from array import array
+import gzip
+import types
+import abc
+import signal
+from http import HTTPStatus
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
 
 VERSION = "0.1.0"
 BUILD_DATE = "2025-02-16 21:27"
 AUTHOR = "Emeka Ugwuanyi"
 
 
+class JSONFormatter(logging.Formatter):
+    """
+    Formats log records as one JSON object per line for log shippers.
+
+    The keys mirror the fields of the text format: time, pid, level and message, plus the
+    logger name. Tracebacks are already part of the message, as the QueueHandler formats them in.
+
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "pid": record.process,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        return json.dumps(entry)
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Rate limits repeated warnings and errors.
+
+    A warning or error with the same level and message is passed at most once per interval.
+    The suppressed repeats are counted and reported on the next record that passes.
+    Records below WARNING are never suppressed. The filter is shared by the listener threads, so
+    its state is guarded by a lock.
+
+    Attributes:
+    - interval (float): Seconds an identical warning or error is suppressed for. 0 disables it.
+
+    """
+
+    def __init__(self, interval: float) -> None:
+        super().__init__()
+        self.interval = interval
+        self.seen: dict = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0 or record.levelno < logging.WARNING:
+            return True
+        key = (record.levelno, record.getMessage())
+        with self.lock:
+            last, suppressed = self.seen.get(key, (None, 0))
+            if last is not None and record.created - last < self.interval:
+                self.seen[key] = (last, suppressed + 1)
+                return False
+            self.seen[key] = (record.created, 0)
+            if len(self.seen) > 10000:
+                cutoff = record.created - self.interval
+                self.seen = {k: v for k, v in self.seen.items() if v[0] >= cutoff}
+        if suppressed:
+            record.msg = f"{record.getMessage()} (suppressed {suppressed} repeats)"
+            record.args = None
+        return True
+
+
+class LogListener(handlers.QueueListener):
+    """
+    A QueueListener that runs every dequeued record through a RepeatFilter before its handlers.
+    """
+
+    def __init__(
+        self, log_queue: Any, *log_handlers: logging.Handler, repeat_filter: RepeatFilter
+    ) -> None:
+        super().__init__(log_queue, *log_handlers, respect_handler_level=True)
+        self.repeat_filter = repeat_filter
+
+    def handle(self, record: logging.LogRecord) -> None:
+        if self.repeat_filter.filter(record):
+            super().handle(record)
+
+
 class Log:
     file_handler = None
+    listener = None
+    process_listener = None
+    process_queue = None
     """
     A class for configuring and managing logging in the SAU Exporter.
 
+    Records are never written on the logging thread. The root logger only has a QueueHandler;
+    a single LogListener thread in the parent owns the stdout and file handlers and writes
+    every record. Process workers get a QueueHandler onto a multiprocessing queue drained by a
+    second listener in the parent, so only the parent ever touches the rotating log file.
+
     Attributes:
     - level (str): The logging level (default: "info").
     - path (str): The directory where the log file will be stored (default: current directory).
     - retention (int): Number of backup log files to keep (default: 7).
+    - log_format (str): Either "text" or "json" (default: "text").
+    - repeat_interval (float): Seconds identical warnings and errors are suppressed for. 0 disables it (default: 0).
 
     Methods:
-    - setlogger(): Configures and sets up the logger with specified settings.
+    - setlogger(): Configures and sets up the logger with specified settings, once per process.
+    - worker_queue(): Returns the queue process workers log to.
+    - init_worker(log_queue, level): Process pool initializer routing a worker's records to the parent.
+    - stop_logging(): Flushes and stops the listeners.
 
     """
 
     def __init__(
-        self, level: str = "info", path: str = ".", retention: int = 7, handler: str = "both",
+        self,
+        level: str = "info",
+        path: str = ".",
+        retention: int = 7,
+        handler: str = "both",
+        log_format: str = "text",
+        repeat_interval: float = 0,
     ) -> None:
         """
         Initializes a new Log instance.
@@ -56,6 +179,8 @@ class Log:
         - level (str): The logging level (default: "info").
         - path (str): The directory where the log file will be stored (default: current directory).
         - retention (int): Number of backup log files to keep (default: 7).
+        - log_format (str): Either "text" or "json" (default: "text").
+        - repeat_interval (float): Seconds identical warnings and errors are suppressed for (default: 0).
 
         Returns:
         None
@@ -71,10 +196,17 @@ class Log:
             "error": logging.ERROR,
         }
         self.handler = handler
+        self.log_format = log_format
+        self.repeat_interval = repeat_interval
 
         self.log_level = self.levels.get(self.level.lower(), logging.INFO)
         self.format = 'time=%(asctime)s pid=%(process)d level=%(levelname)-2s message="%(message)s"'
 
+    def create_formatter(self) -> logging.Formatter:
+        if self.log_format == "json":
+            return JSONFormatter()
+        return logging.Formatter(self.format)
+
     def create_file_handler(self):
         if Log.file_handler is None:
             logfile = f"{self.path}/sau_exporter.log"
@@ -82,354 +214,3814 @@ class Log:
                 logfile, when="midnight", backupCount=self.retention
             )
             file_handler.setLevel(self.log_level)
-            formatter = logging.Formatter(self.format)
-            file_handler.setFormatter(formatter)
+            file_handler.setFormatter(self.create_formatter())
             Log.file_handler = file_handler
 
-    def setlogger(self) -> None:
+    def setlogger(self) -> None:
+        """
+        Configures and sets up the logger with the specified settings.
+
+        The first call replaces the root handlers with a QueueHandler and starts the listener.
+        Later calls are no-ops, so no handler is set up per AWS call.
+
+        Args:
+        - self: The current instance.
+
+        Returns:
+        None
+
+        """
+        if self.handler not in {"both", "stdout", "file"}:
+            raise ValueError("logging.handler must be either 'file', 'both' or 'stdout'.")
+        if self.log_format not in {"text", "json"}:
+            raise ValueError("logging.format must be either 'text' or 'json'.")
+        if Log.listener is not None:
+            return
+
+        log_handlers = []
+
+        if self.handler in {"both", "stdout"}:
+            stdout_handler = logging.StreamHandler(sys.stdout)
+            stdout_handler.setLevel(self.log_level)
+            stdout_handler.setFormatter(self.create_formatter())
+            log_handlers.append(stdout_handler)
+
+        if self.handler in {"both", "file"}:
+            self.create_file_handler()
+            log_handlers.append(Log.file_handler)
+
+        log_queue = queue.SimpleQueue()
+        Log.listener = LogListener(
+            log_queue, *log_handlers, repeat_filter=RepeatFilter(self.repeat_interval)
+        )
+        Log.listener.start()
+        logging.basicConfig(
+            level=self.log_level, handlers=[Log.queue_handler(log_queue)], force=True
+        )
+
+    def update_logger(self, level: str, repeat_interval: float) -> None:
+        """
+        Applies a new logging level and repeat interval to the running logger.
+
+        The handler, format and directory are only read by setlogger() and need a restart.
+        Process workers keep the level they were started with.
+
+        Args:
+        - self: The current instance.
+        - level (str): The logging level.
+        - repeat_interval (float): Seconds identical warnings and errors are suppressed for.
+
+        Returns:
+        None
+
+        """
+        self.level = level
+        self.log_level = self.levels.get(level.lower(), logging.INFO)
+        self.repeat_interval = repeat_interval
+        logging.getLogger().setLevel(self.log_level)
+        if Log.listener is not None:
+            for handler in Log.listener.handlers:
+                handler.setLevel(self.log_level)
+            Log.listener.repeat_filter.interval = repeat_interval
+
+    @staticmethod
+    def queue_handler(log_queue: Any) -> handlers.QueueHandler:
+        """
+        Returns a QueueHandler that enqueues the bare message, leaving the layout to the listener.
+        """
+        queue_handler = handlers.QueueHandler(log_queue)
+        queue_handler.setFormatter(logging.Formatter("%(message)s"))
+        return queue_handler
+
+    @staticmethod
+    def worker_queue() -> Any:
+        """
+        Returns the multiprocessing queue process workers log to, starting its listener on first use.
+
+        Returns:
+        multiprocessing.Queue: The queue, or None if setlogger has not been called.
+
+        """
+        if Log.listener is None:
+            return None
+        if Log.process_queue is None:
+            Log.process_queue = multiprocessing.Queue()
+            Log.process_listener = LogListener(
+                Log.process_queue,
+                *Log.listener.handlers,
+                repeat_filter=Log.listener.repeat_filter,
+            )
+            Log.process_listener.start()
+        return Log.process_queue
+
+    @staticmethod
+    def init_worker(log_queue: Any, level: int) -> None:
+        """
+        Process pool initializer routing every record of the worker to the parent's listener.
+
+        Args:
+        log_queue (multiprocessing.Queue): The queue returned by worker_queue.
+        level (int): The root logging level.
+
+        Returns:
+        None
+
+        """
+        logging.basicConfig(level=level, handlers=[Log.queue_handler(log_queue)], force=True)
+
+    @staticmethod
+    def stop_logging() -> None:
+        """
+        Flushes the queued records and stops the listeners.
+
+        Returns:
+        None
+
+        """
+        for listener in (Log.process_listener, Log.listener):
+            if listener is not None:
+                listener.stop()
+        if Log.listener is not None:
+            # later records are written directly, as nothing drains the queue anymore
+            logging.basicConfig(handlers=Log.listener.handlers, force=True)
+        Log.listener = Log.process_listener = Log.process_queue = None
+
+
+class TagMatcher:
+    """
+    Case insensitive matcher for a tag config such as exclude_tags, compiled once.
+
+    Values are lowercased into frozen sets. Values containing glob characters (*, ?, [)
+    and values prefixed with "regex:" are compiled into a single regular expression per key.
+
+    Attributes:
+    - tags (dict): The tag config, mapping tag keys to lists of values.
+
+    Methods:
+    - any(tags: dict) -> bool: True if any configured key matches one of its values.
+    - all(tags: dict) -> bool: True if every configured key matches one of its values.
+
+    """
+
+    regex_prefix = "regex:"
+    glob_chars = frozenset("*?[")
+
+    def __init__(self, tags: dict) -> None:
+        self.tags = tags
+        matchers = []
+        for key, values in tags.items():
+            exact, patterns = set(), []
+            for item in values:
+                value = f"{item}"
+                if value.startswith(self.regex_prefix):
+                    patterns.append(f"(?:{value[len(self.regex_prefix):]})\\Z")
+                elif self.glob_chars.intersection(value):
+                    patterns.append(fnmatch.translate(value.lower()))
+                else:
+                    exact.add(value.lower())
+            pattern = re.compile("|".join(patterns), re.IGNORECASE) if patterns else None
+            matchers.append((key, frozenset(exact), pattern))
+        self.matchers = tuple(matchers)
+
+    def any(self, tags: Dict[str, str]) -> bool:
+        for key, values, pattern in self.matchers:
+            value = tags.get(key, "").lower()
+            if value in values or (pattern is not None and pattern.match(value)):
+                return True
+        return False
+
+    def all(self, tags: Dict[str, str]) -> bool:
+        for key, values, pattern in self.matchers:
+            value = tags.get(key, "").lower()
+            if value not in values and (pattern is None or not pattern.match(value)):
+                return False
+        return True
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter with one bucket per key, e.g. (account, region, API).
+
+    Each bucket holds up to burst tokens and refills at rate tokens per second. acquire()
+    takes a token, sleeping until one is available. Buckets are local to the process until
+    share() moves them into a manager process, after which the copies pickled into process
+    pool workers take their tokens from the same buckets.
+
+    Attributes:
+    - rate (float): Tokens added per second. 0 disables rate limiting.
+    - burst (int): Bucket size.
+
+    Methods:
+    - acquire(key: tuple) -> float: Takes a token, returning the seconds spent waiting.
+    - share() -> None: Shares the buckets with process pool workers.
+    - unshare() -> None: Takes the buckets back from the manager process and stops it.
+
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.buckets: Any = {}
+        self.lock: Any = threading.Lock()
+        self.manager: Any = None
+
+    def __getstate__(self) -> dict:
+        state = {"rate": self.rate, "burst": self.burst}
+        if self.manager is not None:
+            # proxies of the shared buckets, they reconnect to the manager from the worker
+            state.update(buckets=self.buckets, lock=self.lock)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(rate=state["rate"], burst=state["burst"])
+        if "buckets" in state:
+            self.buckets, self.lock = state["buckets"], state["lock"]
+
+    def share(self) -> None:
+        """
+        Moves the buckets into a manager process, so process pool workers share them.
+
+        Returns:
+        None
+
+        """
+        if self.rate <= 0 or self.manager is not None:
+            return
+        self.manager = multiprocessing.Manager()
+        self.buckets = self.manager.dict(self.buckets)
+        self.lock = self.manager.Lock()
+
+    def unshare(self) -> None:
+        if self.manager is None:
+            return
+        self.buckets = dict(self.buckets)
+        self.lock = threading.Lock()
+        self.manager.shutdown()
+        self.manager = None
+
+    def acquire(self, key: tuple) -> float:
+        """
+        Takes a token from the bucket of key, waiting for one if the bucket is empty.
+
+        Args:
+        - key (tuple): The bucket key.
+
+        Returns:
+        float: Seconds spent waiting.
+
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate) - 1
+            self.buckets[key] = (tokens, now)
+        wait = -tokens / self.rate if tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class HashRing:
+    """
+    Consistent hash ring assigning (account, region) work units to shards.
+
+    Every shard owns points on a ring of 64 bit hashes, and a unit belongs to the shard owning
+    the first point at or after the unit's hash. Hashes come from md5, so every replica computes
+    the same assignment. Growing from n to n + 1 shards only moves about 1 / (n + 1) of the
+    units, so the other replicas keep their warm clients and cached data.
+
+    Attributes:
+    - shard_count (int): Number of shards.
+
+    Methods:
+    - shard(key: tuple) -> int: Returns the shard owning a work unit.
+
+    """
+
+    points_per_shard = 100
+
+    def __init__(self, shard_count: int) -> None:
+        self.shard_count = shard_count
+        ring = sorted(
+            (self.hash(f"shard-{shard}-{point}"), shard)
+            for shard in range(shard_count)
+            for point in range(self.points_per_shard)
+        )
+        self.points = [point for point, _ in ring]
+        self.shards = [shard for _, shard in ring]
+        self.assignments: Dict[tuple, int] = {}
+
+    @staticmethod
+    def hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def shard(self, key: tuple) -> int:
+        if self.shard_count == 1:
+            return 0
+        shard = self.assignments.get(key)
+        if shard is None:
+            position = bisect.bisect_left(self.points, self.hash("/".join(key)))
+            shard = self.assignments[key] = self.shards[position % len(self.points)]
+        return shard
+
+
+class RefreshScheduler:
+    """
+    Priority queue of recurring work keyed by due time, e.g. (account, region, "volume").
+
+    Every key has its own interval. Keys added together are spread evenly across their
+    interval instead of all being due at once, and every run is rescheduled an interval
+    after it finished, stretched or shrunk at random by up to jitter, so the work does not
+    synchronize into bursts again.
+
+    Attributes:
+    - jitter (float): Largest random change of an interval, as a fraction of it (default: 0.1).
+
+    Methods:
+    - add(intervals: dict, now: float, spread: bool) -> None: Schedules new keys.
+    - remove(keys: Iterable) -> None: Stops scheduling keys.
+    - pop_due(now: float) -> list: Removes and returns the keys that are due.
+    - reschedule(key: tuple, now: float) -> None: Schedules the next run of a key.
+    - wait(stop: threading.Event) -> None: Blocks until a key is due or stop is set.
+
+    """
+
+    def __init__(self, jitter: float = 0.1) -> None:
+        self.jitter = jitter
+        # key -> (interval, generation), heap entries of an older generation are skipped
+        self.intervals: Dict[tuple, tuple] = {}
+        self.heap: List[tuple] = []
+        self.generation = itertools.count()
+        self.condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.intervals)
+
+    def add(self, intervals: dict, now: float, spread: bool = True) -> None:
+        """
+        Schedules keys that are not scheduled yet.
+
+        Args:
+        - intervals (dict): Interval in seconds by key.
+        - now (float): The current time.
+        - spread (bool): Spread the first runs across the intervals, otherwise they are due now.
+
+        Returns:
+        None
+
+        """
+        with self.condition:
+            keys = [key for key in intervals if key not in self.intervals]
+            for position, key in enumerate(keys):
+                delay = intervals[key] * (position + 1) / len(keys) if spread else 0.0
+                generation = next(self.generation)
+                self.intervals[key] = (intervals[key], generation)
+                heapq.heappush(self.heap, (now + delay, generation, key))
+            self.condition.notify_all()
+
+    def remove(self, keys: Iterable) -> None:
+        with self.condition:
+            for key in keys:
+                self.intervals.pop(key, None)
+
+    def pop_due(self, now: float) -> list:
+        with self.condition:
+            due = []
+            while self.heap and self.heap[0][0] <= now:
+                _, generation, key = heapq.heappop(self.heap)
+                if self.intervals.get(key, (0, None))[1] == generation:
+                    due.append(key)
+            return due
+
+    def reschedule(self, key: tuple, now: float) -> None:
+        with self.condition:
+            if key not in self.intervals:
+                return
+            interval, generation = self.intervals[key]
+            delay = interval * (1 + random.uniform(-self.jitter, self.jitter))
+            heapq.heappush(self.heap, (now + delay, generation, key))
+            self.condition.notify_all()
+
+    def wait(self, stop: threading.Event) -> None:
+        """
+        Blocks until a key is due or stop is set. Call wake() after setting stop.
+        """
+        with self.condition:
+            while not stop.is_set():
+                if self.heap and self.heap[0][0] <= time.time():
+                    return
+                timeout = self.heap[0][0] - time.time() if self.heap else None
+                self.condition.wait(timeout)
+
+    def wake(self) -> None:
+        with self.condition:
+            self.condition.notify_all()
+
+
+class ResourceTable:
+    """
+    Columnar store of per-resource label rows.
+
+    Every distinct label name and value is interned and stored once in strings; each
+    column is an array of 4 byte indexes into it, 0 meaning the row has no such label.
+    A resource costs a few bytes per label instead of a dictionary, and pickling only
+    ships the arrays and the distinct strings, keeping process worker responses small.
+    Iterating yields the rows back as dictionaries. compact() drops the index used to
+    encode new values once a table is complete.
+
+    Attributes:
+    - columns (list): Label names in order of first appearance.
+
+    """
+
+    __slots__ = ("columns", "positions", "codes", "strings", "index", "size")
+
+    def __init__(self, rows: Iterable[dict] = ()) -> None:
+        self.columns: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.codes: List[array] = []
+        self.strings: List[Optional[str]] = [None]
+        self.index: Optional[Dict[str, int]] = {}
+        self.size = 0
+        self.extend(rows)
+
+    def __getstate__(self) -> tuple:
+        return self.columns, self.codes, self.strings, self.size
+
+    def __setstate__(self, state: tuple) -> None:
+        self.columns, self.codes, self.strings, self.size = state
+        self.positions = {column: position for position, column in enumerate(self.columns)}
+        self.index = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[dict]:
+        strings, columns = self.strings, self.columns
+        for codes in zip(*self.codes):
+            yield {column: strings[code] for column, code in zip(columns, codes) if code}
+
+    def __getitem__(self, item: Any) -> Any:
+        if not isinstance(item, slice):
+            if not -self.size <= item < self.size:
+                raise IndexError("ResourceTable index out of range")
+            strings, position = self.strings, item % self.size
+            return {
+                column: strings[codes[position]]
+                for column, codes in zip(self.columns, self.codes)
+                if codes[position]
+            }
+        table = ResourceTable()
+        table.__setstate__((list(self.columns), [codes[item] for codes in self.codes], list(self.strings), 0))
+        table.size = len(range(self.size)[item])
+        return table
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (list, ResourceTable)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"ResourceTable({list(self)!r})"
+
+    def lookup(self) -> Dict[str, int]:
+        if self.index is None:
+            self.index = {string: code for code, string in enumerate(self.strings) if code}
+        return self.index
+
+    def encode(self, value: str) -> int:
+        index = self.lookup()
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(self.strings)
+            self.strings.append(sys.intern(value))
+        return code
+
+    def compact(self) -> "ResourceTable":
+        """
+        Drops the string index, which is rebuilt if rows are added again. Returns the table.
+        """
+        self.index = None
+        return self
+
+    def position(self, column: str) -> int:
+        position = self.positions.get(column)
+        if position is None:
+            position = self.positions[column] = len(self.columns)
+            self.columns.append(sys.intern(column))
+            self.codes.append(array("I", [0]) * self.size)
+        return position
+
+    def append(self, row: dict) -> None:
+        positions = self.positions
+        if not positions.keys() >= row.keys():
+            for key in row:
+                self.position(key)
+        index = self.lookup()
+        values = [0] * len(self.columns)
+        for key, value in row.items():
+            values[positions[key]] = index.get(value) or self.encode(value)
+        for codes, code in zip(self.codes, values):
+            codes.append(code)
+        self.size += 1
+
+    def extend(self, rows: Iterable[dict]) -> None:
+        """
+        Appends rows, either dictionaries or another table whose codes are translated.
+        """
+        if not isinstance(rows, ResourceTable):
+            for row in rows:
+                self.append(row)
+            return
+        translate = [0] + [self.encode(value) for value in rows.strings[1:]]
+        extended = set()
+        for column, codes in zip(rows.columns, rows.codes):
+            position = self.position(column)
+            self.codes[position].extend(array("I", map(translate.__getitem__, codes)))
+            extended.add(position)
+        padding = array("I", [0]) * rows.size
+        for position, codes in enumerate(self.codes):
+            if position not in extended:
+                codes.extend(padding)
+        self.size += rows.size
+
+    def schema(self, columns: Optional[Iterable[str]] = None) -> tuple:
+        """
+        Returns the rows as value tuples, missing labels filled with empty strings.
+
+        Args:
+            columns (Iterable): The labels to project (default: every column).
+
+        Returns:
+        tuple: (columns, values), a tuple of label names and a list of tuples in column order.
+
+        """
+        columns = tuple(self.columns if columns is None else columns)
+        if not columns:
+            return columns, [()] * self.size
+        strings = [""] + self.strings[1:]
+        missing = array("I", [0]) * self.size
+        arrays = [
+            self.codes[self.positions[column]] if column in self.positions else missing
+            for column in columns
+        ]
+        return columns, list(zip(*(map(strings.__getitem__, codes) for codes in arrays)))
+
+
+class Pricing:
+    """
+    Offline EBS price list used to estimate what unattached and idle storage costs.
+
+    Prices are USD per GB-month of provisioned storage by region and volume type; the "*"
+    region applies to regions without their own prices. The bundled list holds on-demand
+    storage prices only: provisioned IOPS and throughput are not included, so io1, io2 and
+    gp3 volumes with extra performance are underestimated.
+
+    Attributes:
+    - prices (dict): Prices merged over the bundled ones, {region: {volumetype: price}} (default: None).
+
+    """
+
+    volume_types = ("gp2", "gp3", "io1", "io2", "st1", "sc1", "standard")
+    # USD per GB-month, in volume_types order
+    default_prices = {
+        "*": (0.10, 0.08, 0.125, 0.125, 0.045, 0.015, 0.05),
+        "us-west-1": (0.12, 0.096, 0.138, 0.138, 0.054, 0.018, 0.08),
+        "eu-west-1": (0.11, 0.088, 0.138, 0.138, 0.05, 0.0168, 0.055),
+        "eu-west-2": (0.116, 0.0928, 0.145, 0.145, 0.053, 0.0174, 0.058),
+        "eu-central-1": (0.119, 0.0952, 0.149, 0.149, 0.054, 0.018, 0.059),
+        "ap-southeast-1": (0.12, 0.096, 0.138, 0.138, 0.054, 0.018, 0.08),
+        "ap-southeast-2": (0.12, 0.096, 0.138, 0.138, 0.054, 0.018, 0.08),
+        "ap-northeast-1": (0.12, 0.096, 0.142, 0.142, 0.054, 0.018, 0.08),
+        "sa-east-1": (0.19, 0.152, 0.238, 0.238, 0.086, 0.0285, 0.12),
+    }
+
+    def __init__(self, prices: Optional[dict] = None) -> None:
+        merged = {
+            region: dict(zip(self.volume_types, region_prices))
+            for region, region_prices in self.default_prices.items()
+        }
+        for region, region_prices in (prices or {}).items():
+            merged.setdefault(region, {}).update(region_prices)
+        self.index = {
+            (region, volumetype): float(price)
+            for region, region_types in merged.items()
+            for volumetype, price in region_types.items()
+        }
+
+    def price(self, region: str, volumetype: str) -> float:
+        """
+        Returns the USD price per GB-month of a volume type in a region, 0 if unknown.
+        """
+        price = self.index.get((region, volumetype))
+        if price is None:
+            price = self.index.get(("*", volumetype), 0.0)
+        return price
+
+    def monthly_costs(self, table: ResourceTable) -> List[float]:
+        """
+        Estimates the monthly cost of every volume row of a table.
+
+        The rows are joined on their region, volumetype and size codes, so the price is
+        looked up once per distinct combination rather than once per volume.
+
+        Args:
+            table (ResourceTable): Rows with region, volumetype and size ("<n>GB") labels.
+
+        Returns:
+        list: The USD cost per month of every row, in order.
+
+        """
+        if not table or not {"region", "volumetype", "size"} <= table.positions.keys():
+            return [0.0] * len(table)
+        strings = table.strings
+        columns = [table.codes[table.positions[name]] for name in ("region", "volumetype", "size")]
+        costs: Dict[tuple, float] = {}
+        result = []
+        for key in zip(*columns):
+            cost = costs.get(key)
+            if cost is None:
+                region, volumetype, size = (strings[code] or "" for code in key)
+                gigabytes = float(size[:-2]) if size.endswith("GB") else 0.0
+                cost = costs[key] = gigabytes * self.price(region, volumetype)
+            result.append(cost)
+        return result
+
+
+class Histogram:
+    """
+    Plain bucket counters for the self-metrics, filled from stats returned by worker calls.
+
+    Unlike prometheus_client histograms these are not registered anywhere and can be pickled,
+    so observations made in process workers are merged by the collector.
+
+    Attributes:
+    - buckets (tuple): Sorted upper bounds, without +Inf.
+
+    """
+
+    def __init__(self, buckets: tuple) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def add_to(self, family: HistogramMetricFamily, labels: list) -> None:
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        family.add_metric(
+            labels=labels,
+            buckets=list(zip(bounds, itertools.accumulate(self.counts))),
+            sum_value=self.sum,
+        )
+
+
+class AWSClientCache:
+    """
+    Caches boto3 sessions and clients so connections are reused across collections.
+
+    Instances are callable with the same signature as Util.get_aws_client and are passed to
+    EC2SAUCollector as its client_getter. Clients are keyed by (service, region, account) and
+    recreated once they are older than ttl seconds, which also re-resolves the credentials.
+    The cache is a prometheus collector exposing how many clients were created.
+
+    Accounts other than "" use temporary credentials from STS AssumeRole, which botocore
+    refreshes shortly before they expire.
+
+    Process pool workers unpickle a copy of the cache with every task. The copies of one
+    cache share their sessions and clients within a worker process, so a worker only
+    creates a client, or assumes a role, once per ttl like the parent.
+
+    Attributes:
+    - ttl (int): Seconds a cached client is reused before it is recreated (default: 3600).
+    - max_pool_connections (int): Size of the botocore connection pool of each client (default: 10).
+    - accounts (list): Account configs with 'name', 'role_arn' and optional 'external_id' (default: None).
+    - retry_mode (str): botocore retry mode, "legacy", "standard" or "adaptive" (default: "standard").
+    - max_attempts (int): botocore maximum attempts per request, including the first one (default: 3).
+
+    Methods:
+    - get_session(account: str) -> boto3.Session: Returns the session used for an account.
+    - assume_role(account: str) -> dict: Returns temporary credentials for an account.
+    - clear() -> None: Drops every cached session and client.
+
+    """
+
+    session_name = "sau-exporter"
+    # (sessions, clients, lock) shared by the unpickled copies of a cache, by cache token
+    process_caches: Dict[str, tuple] = {}
+
+    def __init__(
+        self,
+        ttl: int = 3600,
+        max_pool_connections: int = 10,
+        accounts: Optional[list] = None,
+        retry_mode: str = "standard",
+        max_attempts: int = 3,
+    ) -> None:
+        self.ttl = ttl
+        self.config = Config(
+            max_pool_connections=max_pool_connections,
+            retries={"mode": retry_mode, "max_attempts": max_attempts},
+        )
+        self.roles: Dict[str, dict] = {account["name"]: account for account in accounts or []}
+        self.sessions: Dict[str, boto3.Session] = {}
+        self.clients: Dict[tuple, tuple] = {}
+        self.created: Dict[tuple, int] = {}
+        self.lock = threading.Lock()
+        self.token = f"{os.getpid()}-{id(self)}"
+
+    def __call__(self, module: str, region_name: str, account: str = "") -> Any:
+        key = (module, region_name, account)
+        with self.lock:
+            cached = self.clients.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                return cached[0]
+            if cached is not None:
+                # expired: resolve credentials again through a fresh session
+                self.sessions.pop(account, None)
+            client = self.get_session(account).client(
+                module, region_name=region_name, config=self.config
+            )
+            self.clients[key] = (client, time.monotonic())
+            self.created[key] = self.created.get(key, 0) + 1
+            logging.debug("created %s client for region %s", module, region_name)
+            return client
+
+    def __getstate__(self) -> dict:
+        # sessions and clients are process local, workers build their own
+        state = self.__dict__.copy()
+        state.update(sessions={}, clients={}, lock=None)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        shared = self.process_caches.get(self.token)
+        if shared is None:
+            shared = self.process_caches[self.token] = ({}, {}, threading.Lock())
+        self.sessions, self.clients, self.lock = shared
+
+    def get_session(self, account: str) -> boto3.Session:
+        """
+        Returns the boto3 session used to create clients for an account, creating it if needed.
+
+        Must be called with the lock held.
+
+        Args:
+        - account (str): The account key, "" for the default credentials chain.
+
+        Returns:
+        boto3.Session: The cached session.
+
+        """
+        session = self.sessions.get(account)
+        if session is None:
+            if account:
+                if account not in self.roles:
+                    raise ValueError(f"account {account} is not configured")
+                core = botocore.session.get_session()
+                core._credentials = RefreshableCredentials.create_from_metadata(
+                    metadata=self.assume_role(account),
+                    refresh_using=functools.partial(self.assume_role, account),
+                    method="sts-assume-role",
+                )
+                session = boto3.Session(botocore_session=core)
+            else:
+                session = boto3.Session()
+            self.sessions[account] = session
+        return session
+
+    def assume_role(self, account: str) -> dict:
+        """
+        Assumes the role configured for an account.
+
+        Args:
+        - account (str): The account name.
+
+        Returns:
+        dict: Temporary credentials in the metadata format of RefreshableCredentials.
+
+        """
+        role = self.roles[account]
+        kwargs = {"RoleArn": role["role_arn"], "RoleSessionName": self.session_name}
+        if role.get("external_id"):
+            kwargs["ExternalId"] = role["external_id"]
+        credentials = boto3.client("sts", config=self.config).assume_role(**kwargs)["Credentials"]
+        logging.debug("assumed role %s for account %s", role["role_arn"], account)
+        return {
+            "access_key": credentials["AccessKeyId"],
+            "secret_key": credentials["SecretAccessKey"],
+            "token": credentials["SessionToken"],
+            "expiry_time": credentials["Expiration"].isoformat(),
+        }
+
+    def clear(self) -> None:
+        with self.lock:
+            self.sessions.clear()
+            self.clients.clear()
+
+    def collect(self):
+        counter = CounterMetricFamily(
+            name="sau_aws_clients_created",
+            documentation="Number of boto3 clients created by the exporter",
+            labels=["service", "region", "account"],
+        )
+        with self.lock:
+            for key, count in self.created.items():
+                counter.add_metric(labels=list(key), value=count)
+        yield counter
+
+
+class EventSource(abc.ABC):
+    """
+    Base class for change feeds used by the incremental collection mode.
+
+    A change event only names a resource that changed, as a dictionary with the keys
+    'resource' ("ec2" or "volume"), 'region', 'id' and 'account' (the AWS account id, or "").
+    The collector describes the resource again to learn its current state, so events may be
+    duplicated or arrive out of order.
+
+    Methods:
+    - poll() -> list: Returns the change events received since the last poll.
+    - parse(message: dict) -> dict: Normalizes an EventBridge event or a change event.
+
+    """
+
+    resources = ("ec2", "volume")
+    volume_events = {"createVolume", "attachVolume", "detachVolume", "deleteVolume", "modifyVolume"}
+
+    @abc.abstractmethod
+    def poll(self) -> List[dict]:
+        """
+        Returns the change events received since the last poll.
+        """
+
+    @classmethod
+    def parse(cls, message: dict) -> Optional[dict]:
+        """
+        Normalizes a message into a change event.
+
+        Args:
+        - message (dict): An EventBridge "EC2 Instance State-change Notification" or
+          "EBS Volume Notification" event, or an already normalized change event.
+
+        Returns:
+        dict: The change event, or None if the message is not relevant.
+
+        """
+        account = f'{message.get("account", "")}'
+        if {"resource", "region", "id"}.issubset(message):
+            if message["resource"] not in cls.resources:
+                logging.warning("ignoring change event of unknown resource %s", message["resource"])
+                return None
+            return {
+                "resource": message["resource"],
+                "region": message["region"],
+                "id": message["id"],
+                "account": account,
+            }
+        detail = message.get("detail", {})
+        kind = message.get("detail-type")
+        if kind == "EC2 Instance State-change Notification" and "instance-id" in detail:
+            return {
+                "resource": "ec2",
+                "region": message["region"],
+                "id": detail["instance-id"],
+                "account": account,
+            }
+        if kind == "EBS Volume Notification" and detail.get("event") in cls.volume_events:
+            resources = message.get("resources", [])
+            if resources:
+                return {
+                    "resource": "volume",
+                    "region": message["region"],
+                    "id": resources[0].split("/")[-1],
+                    "account": account,
+                }
+        return None
+
+
+class QueueEventSource(EventSource):
+    """
+    In-process change feed, fed with put(). Useful for tests and embedding.
+    """
+
+    def __init__(self) -> None:
+        self.queue: queue.Queue = queue.Queue()
+
+    def put(self, message: dict) -> None:
+        self.queue.put(message)
+
+    def poll(self) -> List[dict]:
+        events = []
+        while True:
+            try:
+                event = self.parse(self.queue.get_nowait())
+            except queue.Empty:
+                return events
+            if event is not None:
+                events.append(event)
+
+
+class FileEventSource(EventSource):
+    """
+    Change feed read from a local file with one JSON message per line.
+
+    Lines appended since the last poll are read; the file is read from the start again
+    if it was truncated or replaced.
+
+    Attributes:
+    - path (str): The path of the file.
+
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.offset = 0
+
+    def poll(self) -> List[dict]:
+        events: List[dict] = []
+        if not os.path.exists(self.path):
+            return events
+        if os.path.getsize(self.path) < self.offset:
+            self.offset = 0
+        with open(self.path, "r") as stream:
+            stream.seek(self.offset)
+            for line in iter(stream.readline, ""):
+                if not line.endswith("\n"):
+                    # partially written line, read it on the next poll
+                    break
+                self.offset = stream.tell()
+                try:
+                    event = self.parse(json.loads(line))
+                except ValueError:
+                    logging.error("invalid change event in %s: %s", self.path, line.strip())
+                    continue
+                if event is not None:
+                    events.append(event)
+        return events
+
+
+class SQSEventSource(EventSource):
+    """
+    Change feed read from an SQS queue receiving EC2 and EBS EventBridge events.
+
+    Attributes:
+    - queue_url (str): The URL of the queue.
+    - region (str): The region of the queue.
+    - client_getter (Callable): Returns boto3 clients, see Util.get_aws_client.
+    - max_messages (int): Maximum number of messages received per poll (default: 1000).
+
+    """
+
+    def __init__(
+        self,
+        queue_url: str,
+        region: str,
+        client_getter: Callable[[str, str], Any],
+        max_messages: int = 1000,
+    ) -> None:
+        self.queue_url = queue_url
+        self.region = region
+        self.get_client = client_getter
+        self.max_messages = max_messages
+
+    def poll(self) -> List[dict]:
+        client = self.get_client("sqs", region_name=self.region)
+        events: List[dict] = []
+        received = 0
+        while received < self.max_messages:
+            messages = client.receive_message(
+                QueueUrl=self.queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=0
+            ).get("Messages", [])
+            if not messages:
+                break
+            received += len(messages)
+            for message in messages:
+                try:
+                    event = self.parse(json.loads(message["Body"]))
+                except ValueError:
+                    logging.error("invalid change event in %s", self.queue_url)
+                    continue
+                if event is not None:
+                    events.append(event)
+            client.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(index), "ReceiptHandle": message["ReceiptHandle"]}
+                    for index, message in enumerate(messages)
+                ],
+            )
+        return events
+
+
+class ResourceCollector(abc.ABC):
+    """
+    Base class for additional waste sources, registered by name when subclassed.
+
+    Each source is described per account and region through the collector's worker pool,
+    on its own interval since some, like snapshots, are far costlier to list than instances.
+    Subclasses set name, metric, documentation and default_interval and implement describe().
+
+    Attributes:
+    - interval (int): Seconds between two descriptions of the source (default: default_interval).
+
+    Methods:
+    - describe(collector, client, region, stats) -> Iterator[dict]: Streams the wasted
+      resources of a region as dictionaries of raw values and AWS tags.
+
+    """
+
+    registry: Dict[str, type] = {}
+    name = ""
+    metric = ""
+    documentation = ""
+    default_interval = 3600
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if cls.name:
+            ResourceCollector.registry[cls.name] = cls
+
+    def __init__(self, interval: Optional[int] = None) -> None:
+        self.interval = self.default_interval if interval is None else interval
+
+    @abc.abstractmethod
+    def describe(
+        self, collector: "EC2SAUCollector", client: Any, region: str, stats: dict
+    ) -> Iterator[tuple]:
+        """
+        Streams (labels, tags) pairs, one per wasted resource of the region.
+        """
+
+    @staticmethod
+    def tags(item: dict) -> Dict[str, str]:
+        return {tag["Key"]: tag["Value"] for tag in item.get("Tags", item.get("TagSet", []))}
+
+
+class SnapshotCollector(ResourceCollector):
+    """
+    EBS snapshots owned by the account whose source volume no longer exists.
+    """
+
+    name = "snapshots"
+    metric = "sau_ebs_orphaned_snapshots"
+    documentation = "EBS snapshots whose source volume was deleted"
+    default_interval = 21600
+
+    def describe(
+        self, collector: "EC2SAUCollector", client: Any, region: str, stats: dict
+    ) -> Iterator[tuple]:
+        snapshots = list(
+            collector.paginate(client, "describe_snapshots", "Snapshots", stats, OwnerIds=["self"])
+        )
+        volume_ids = sorted({snapshot.get("VolumeId", "") for snapshot in snapshots} - {""})
+        existing = set()
+        # AWS accepts at most 200 values per filter
+        for start in range(0, len(volume_ids), 200):
+            filters = [{"Name": "volume-id", "Values": volume_ids[start:start + 200]}]
+            volumes = collector.paginate(client, "describe_volumes", "Volumes", stats, Filters=filters)
+            existing.update(volume["VolumeId"] for volume in volumes)
+        for snapshot in snapshots:
+            if snapshot.get("VolumeId", "") not in existing:
+                tags = self.tags(snapshot)
+                labels = {
+                    "name": tags.get("Name", ""),
+                    "snapshotid": snapshot["SnapshotId"],
+                    "volumeid": snapshot.get("VolumeId", ""),
+                    "size": f'{snapshot.get("VolumeSize", 0)}GB',
+                }
+                yield labels, tags
+
+
+class ElasticIPCollector(ResourceCollector):
+    """
+    Elastic IPs not associated with an instance or network interface.
+    """
+
+    name = "elastic_ips"
+    metric = "sau_ec2_unassociated_elastic_ips"
+    documentation = "Elastic IP addresses not associated with any instance or network interface"
+
+    def describe(
+        self, collector: "EC2SAUCollector", client: Any, region: str, stats: dict
+    ) -> Iterator[tuple]:
+        for address in collector.paginate(client, "describe_addresses", "Addresses", stats):
+            if not address.get("AssociationId"):
+                tags = self.tags(address)
+                labels = {
+                    "name": tags.get("Name", ""),
+                    "allocationid": address.get("AllocationId", ""),
+                    "publicip": address.get("PublicIp", ""),
+                }
+                yield labels, tags
+
+
+class NetworkInterfaceCollector(ResourceCollector):
+    """
+    Network interfaces in the available state, i.e. attached to nothing.
+    """
+
+    name = "network_interfaces"
+    metric = "sau_ec2_available_network_interfaces"
+    documentation = "EC2 network interfaces not attached to any instance"
+
+    def describe(
+        self, collector: "EC2SAUCollector", client: Any, region: str, stats: dict
+    ) -> Iterator[tuple]:
+        filters = [{"Name": "status", "Values": ["available"]}]
+        interfaces = collector.paginate(
+            client, "describe_network_interfaces", "NetworkInterfaces", stats, Filters=filters
+        )
+        for interface in interfaces:
+            tags = self.tags(interface)
+            labels = {
+                "name": tags.get("Name", ""),
+                "networkinterfaceid": interface["NetworkInterfaceId"],
+                "interfacetype": interface.get("InterfaceType", ""),
+                "availabilityzone": interface.get("AvailabilityZone", ""),
+            }
+            yield labels, tags
+
+
+class ImageCollector(ResourceCollector):
+    """
+    AMIs owned by the account that are older than max_age_days.
+    """
+
+    name = "images"
+    metric = "sau_ec2_old_images"
+    documentation = "AMIs owned by the account older than the configured age"
+    default_interval = 86400
+
+    def __init__(self, interval: Optional[int] = None, max_age_days: int = 180) -> None:
+        super().__init__(interval=interval)
+        self.max_age_days = max_age_days
+
+    def describe(
+        self, collector: "EC2SAUCollector", client: Any, region: str, stats: dict
+    ) -> Iterator[tuple]:
+        cutoff = time.strftime(
+            "%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - self.max_age_days * 86400)
+        )
+        images = collector.paginate(client, "describe_images", "Images", stats, Owners=["self"])
+        for image in images:
+            created = image.get("CreationDate", "")
+            # ISO 8601 timestamps compare in time order
+            if created and created < cutoff:
+                tags = self.tags(image)
+                labels = {
+                    "name": image.get("Name", ""),
+                    "imageid": image["ImageId"],
+                    "created": created[:10],
+                }
+                yield labels, tags
+
+
+class EC2SAUCollector(Log):
+    """
+    Collector class used to scrape EC2 and EBS volume data.
+
+    Attributes:
+    - regions (list): List of AWS regions to collect metrics from.
+    - level (str): The logging level (default: "info").
+    - path (str): The directory where the log file will be stored (default: current directory).
+    - retention (int): Number of backup log files to keep (default: 7).
+
+    Methods:
+    - get_stopped_ec2(region: str) -> list: Retrieves stopped EC2 instances for a given region.
+    - get_unattached_volumes(region: str) -> dict: Retrieves unattached EBS volumes in the specified AWS region.
+    - get_instance_metrics() -> dict: Retrieves metrics related to instances and volumes in different regions.
+    - refresh() -> dict: Collects fresh metrics and stores them as the current snapshot.
+    - start_refresher() -> None: Starts the background thread that refreshes the snapshot on an interval.
+    - stop_refresher() -> None: Stops the background refresher thread.
+    - get_executor() -> Executor: Returns the long-lived worker pool, creating it on first use.
+    - shutdown() -> None: Stops the refresher and shuts down the worker pool.
+    - get_instance_metrics_async() -> dict: Coroutine equivalent of get_instance_metrics() used by the async engine.
+    - get_incremental_metrics() -> dict: Applies change events to the in-memory inventory, reconciling periodically.
+    - targets() -> list: Returns the (account, region) work units of a collection.
+
+    """
+
+    # attributes that are process local and must not be pickled into pool workers
+    unpicklable = (
+        "snapshot_lock",
+        "refresher",
+        "stop_event",
+        "executor",
+        "executor_lock",
+        "event_source",
+        "inventory",
+        "pending",
+        "region_cache",
+        "rendered",
+        "fragments",
+        "flight",
+        "flight_lock",
+        "collection_lock",
+        "scheduler",
+    )
+    # collected data and statistics, kept by the parent and never read by pool workers
+    collected = (
+        "snapshot",
+        "resource_data",
+        "api_stats",
+        "region_freshness",
+        "error_types",
+    )
+    executors = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+    engines = {"pool", "async"}
+    schedules = {"batch", "staggered"}
+    default_aggregate_by = ("region", "availabilityzone", "volumetype", "state")
+    exposition_formats = {"text": generate_latest, "openmetrics": openmetrics.generate_latest}
+    # source whose refresh changes a metric family, by family name without "_total"
+    family_sources = {
+        "sau_ec2_stopped_instances": "ec2",
+        "sau_ec2_stopped_instance_attached_storage_cost_dollars": "ec2",
+        "sau_ebs_volumes": "volume",
+        "sau_ebs_volume_monthly_cost_dollars": "volume",
+    }
+    max_workers = 32
+    request_buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    collection_buckets = (1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+    max_backoff = 20.0
+    throttling_errors = frozenset(
+        {"RequestLimitExceeded", "Throttling", "ThrottlingException", "TooManyRequestsException"}
+    )
+
+    def __init__(
+        self,
+        exclude_tags: dict,
+        regions: list,
+        client_getter: Callable[[str, str], Any],
+        level: str = "info",
+        path: str = ".",
+        retention: int = 7,
+        handler: str = "both",
+        refresh_interval: int = 0,
+        executor: str = "thread",
+        workers: int = 0,
+        engine: str = "pool",
+        concurrency: int = 0,
+        region_concurrency: int = 2,
+        page_size: int = 500,
+        include_tags: Optional[dict] = None,
+        tag_values_server_side: bool = False,
+        event_source: Optional["EventSource"] = None,
+        reconcile_interval: int = 3600,
+        label_tags: Optional[list] = None,
+        max_series: int = 0,
+        aggregate: bool = False,
+        aggregate_by: Optional[list] = None,
+        accounts: Optional[list] = None,
+        rate_limit: float = 0,
+        burst: int = 100,
+        backoff_retries: int = 3,
+        backoff_base: float = 1.0,
+        max_stale_age: int = 3600,
+        snapshot_path: str = "",
+        pricing: Optional[Pricing] = None,
+        resources: Optional[dict] = None,
+        schedule: str = "batch",
+        jitter: float = 0.1,
+        region_intervals: Optional[dict] = None,
+        type_intervals: Optional[dict] = None,
+        shard_index: int = 0,
+        shard_count: int = 1,
+    ) -> None:
+        """
+        Initializes a new EC2SAUCollector instance.
+
+        Args:
+        - self: The current instance.
+        - regions (list): List of AWS regions to collect metrics from.
+        - level (str): The logging level (default: "info").
+        - path (str): The directory where the log file will be stored (default: current directory).
+        - retention (int): Number of backup log files to keep (default: 7).
+        - refresh_interval (int): Seconds between background refreshes. 0 collects on every scrape (default: 0).
+        - executor (str): Worker pool kind, either "thread" or "process" (default: "thread").
+        - workers (int): Worker pool size. 0 sizes it to the number of AWS calls per collection (default: 0).
+        - engine (str): Collection engine, either "pool" or "async" (default: "pool").
+        - concurrency (int): Async engine limit on in-flight AWS calls, growing the worker pool to match. 0
+            uses the worker pool size (default: 0).
+        - region_concurrency (int): Async engine limit on in-flight AWS calls per region (default: 2).
+        - page_size (int): MaxResults requested per describe_* page (default: 500).
+        - include_tags (dict): Tag allow-list. Resources must match every key with one of its values (default: None).
+        - tag_values_server_side (bool): Push include_tags values into the AWS filters, making them case
+            sensitive (default: False).
+        - event_source (EventSource): Change feed enabling incremental collection (default: None).
+        - reconcile_interval (int): Seconds between full collections in incremental mode (default: 3600).
+        - label_tags (list): Tag keys exposed as tag_* labels. None or empty exposes every tag (default: None).
+        - max_series (int): Maximum series per per-resource metric. 0 is unlimited (default: 0).
+        - aggregate (bool): Emit counts grouped by aggregate_by instead of per-resource series (default: False).
+        - aggregate_by (list): Labels the aggregated counts are grouped by (default: region, availabilityzone,
+            volumetype, state).
+        - accounts (list): Account configs with 'name' and 'role_arn'. None collects with the default
+            credentials (default: None).
+        - rate_limit (float): Requests per second per (account, region, API). 0 is unlimited (default: 0).
+        - burst (int): Requests allowed in a burst above rate_limit (default: 100).
+        - backoff_retries (int): Retries of a throttled page after botocore gave up (default: 3).
+        - backoff_base (float): Base in seconds of the jittered exponential backoff (default: 1.0).
+        - max_stale_age (int): Seconds the last successful region data is served when a refresh fails. 0
+            disables it (default: 3600).
+        - snapshot_path (str): File the snapshot is persisted to and restored from at startup. "" disables it (default: "").
+        - pricing (Pricing): Price list enabling the cost metrics. None disables them (default: None).
+        - resources (dict): Options of the additional waste sources to collect, keyed by ResourceCollector
+            name (default: None).
+        - schedule (str): "batch" refreshes every region at once, "staggered" spreads region refreshes across
+            their intervals (default: "batch").
+        - jitter (float): Largest random change of a staggered interval, as a fraction of it (default: 0.1).
+        - region_intervals (dict): Staggered refresh interval in seconds by region, instead of
+            refresh_interval (default: None).
+        - type_intervals (dict): Staggered refresh interval in seconds of "ec2" and "volume", instead of
+            refresh_interval (default: None).
+        - shard_index (int): The shard of this replica, owning the (account, region) pairs assigned to it (default: 0).
+        - shard_count (int): Number of replicas sharing the (account, region) pairs (default: 1).
+
+        Returns:
+        None
+
+        """
+        Log.__init__(self, level=level, path=path, retention=retention, handler=handler)
+        if executor not in self.executors:
+            raise ValueError("collection.executor must be either 'thread' or 'process'.")
+        if engine not in self.engines:
+            raise ValueError("collection.engine must be either 'pool' or 'async'.")
+        if schedule not in self.schedules:
+            raise ValueError("collection.schedule must be either 'batch' or 'staggered'.")
+        if schedule == "staggered" and event_source is not None:
+            raise ValueError("collection.schedule 'staggered' cannot be combined with events.")
+        if not 0 <= shard_index < shard_count:
+            raise ValueError("sharding.shard_index must be at least 0 and below sharding.shard_count")
+        self.regions = regions
+        self.errors = 0
+        self.exclude_tags = exclude_tags
+        self.exclude_matcher = TagMatcher(exclude_tags)
+        self.get_client = client_getter
+        self.refresh_interval = refresh_interval
+        self.snapshot: Optional[dict] = None
+        self.snapshot_time = 0.0
+        self.rendered: Optional[dict] = None
+        # staggered mode: rendered metric fragments by (account, region), see render_targets()
+        self.fragments: Dict[tuple, dict] = {}
+        self.snapshot_path = snapshot_path
+        self.restored = False
+        self.snapshot_lock = threading.Lock()
+        self.flight: Optional[Future] = None
+        self.flight_lock = threading.Lock()
+        self.collection_lock = threading.RLock()
+        self.refresher: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.executor_kind = executor
+        self.workers = workers
+        self.executor: Optional[Executor] = None
+        self.executor_lock = threading.Lock()
+        self.engine = engine
+        self.concurrency = concurrency
+        self.region_concurrency = region_concurrency
+        self.page_size = page_size
+        self.include_tags = include_tags or {}
+        self.include_matcher = TagMatcher(self.include_tags)
+        self.tag_values_server_side = tag_values_server_side
+        self.resources: Dict[str, ResourceCollector] = {}
+        for name, options in (resources or {}).items():
+            if name not in ResourceCollector.registry:
+                raise ValueError(f"unknown resource collector '{name}'")
+            self.resources[name] = ResourceCollector.registry[name](**options)
+        self.resource_data: Dict[str, dict] = {name: {} for name in self.resources}
+        self.resource_collected: Dict[str, float] = {name: 0.0 for name in self.resources}
+        self.filtered = {
+            name: {"fetched": 0, "include": 0, "exclude": 0}
+            for name in [*self.get_funcs(), *self.resources]
+        }
+        self.event_source = event_source
+        self.reconcile_interval = reconcile_interval
+        self.inventory: Optional[dict] = None
+        self.reconciled = 0.0
+        self.pending: Dict[tuple, set] = {}
+        self.label_tags = frozenset(key.lower() for key in label_tags) if label_tags else None
+        self.max_series = max_series
+        self.aggregate = aggregate
+        self.aggregate_by = aggregate_by or list(self.default_aggregate_by)
+        self.series_dropped = {"sau_ec2_stopped_instances": 0, "sau_ebs_volumes": 0}
+        for resource in self.resources.values():
+            self.series_dropped[resource.metric] = 0
+        self.pricing = pricing
+        if pricing is not None:
+            self.series_dropped["sau_ec2_stopped_instance_attached_storage_cost_dollars"] = 0
+            self.series_dropped["sau_ebs_volume_monthly_cost_dollars"] = 0
+        self.accounts = [account["name"] for account in accounts or []] or [""]
+        # EventBridge events carry the account id, found in the role ARN
+        self.account_ids = {
+            account["role_arn"].split(":")[4]: account["name"] for account in accounts or []
+        }
+        self.rate_limiter = RateLimiter(rate=rate_limit, burst=burst)
+        self.backoff_retries = backoff_retries
+        self.backoff_base = backoff_base
+        self.api_stats: Dict[tuple, dict] = {}
+        self.max_stale_age = max_stale_age
+        self.region_cache: Dict[tuple, tuple] = {}
+        self.region_freshness: Dict[tuple, tuple] = {}
+        self.error_types: Dict[tuple, int] = collections.Counter()
+        self.collection_duration = Histogram(self.collection_buckets)
+        self.queued = 0
+        self.schedule = schedule
+        self.region_intervals = region_intervals or {}
+        self.type_intervals = type_intervals or {}
+        self.scheduler = RefreshScheduler(jitter=jitter)
+        self.shard_index = shard_index
+        self.ring = HashRing(shard_count)
+        if not self.targets():
+            logging.warning("shard %s of %s owns no account and region", shard_index, shard_count)
+
+    def __getstate__(self) -> dict:
+        # every task submitted to a process pool pickles the collector, keep it to the settings
+        state = self.__dict__.copy()
+        for name in self.unpicklable + self.collected:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.snapshot_lock = threading.Lock()
+        self.refresher = None
+        self.stop_event = threading.Event()
+        self.executor = None
+        self.executor_lock = threading.Lock()
+        self.event_source = None
+        self.inventory = None
+        self.pending = {}
+        self.region_cache = {}
+        self.rendered = None
+        self.fragments = {}
+        self.flight = None
+        self.flight_lock = threading.Lock()
+        self.collection_lock = threading.RLock()
+        self.scheduler = RefreshScheduler()
+        self.snapshot = None
+        self.resource_data = {name: {} for name in self.resources}
+        self.api_stats = {}
+        self.region_freshness = {}
+        self.error_types = collections.Counter()
+
+    def get_executor(self) -> Executor:
+        """
+        Returns the long-lived worker pool used to fan out AWS calls, creating it on first use.
+
+        The pool is reused across collections so no processes or threads are spawned per scrape.
+
+        Returns:
+        Executor: A ThreadPoolExecutor or ProcessPoolExecutor depending on the executor setting.
+
+        """
+        with self.executor_lock:
+            if self.executor is None:
+                workers = self.pool_size()
+                if self.executor_kind == "process":
+                    # every task carries a copy of the rate limiter, they must share the buckets
+                    self.rate_limiter.share()
+                if self.executor_kind == "process" and Log.listener is not None:
+                    # workers log through the parent's listener instead of the log file
+                    self.executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        initializer=Log.init_worker,
+                        initargs=(Log.worker_queue(), logging.getLogger().level),
+                    )
+                else:
+                    self.executor = self.executors[self.executor_kind](max_workers=workers)
+                logging.debug("created %s pool with %s workers", self.executor_kind, workers)
+            return self.executor
+
+    def submit(self, func: Callable[..., dict], **kwargs) -> Any:
+        """
+        Submits an AWS call to the worker pool, counting it until it is done.
+
+        Returns:
+        Future: The future of the call.
+
+        """
+        with self.executor_lock:
+            self.queued += 1
+        future = self.get_executor().submit(func, **kwargs)
+        future.add_done_callback(self.task_done)
+        return future
+
+    def task_done(self, future: Any) -> None:
+        with self.executor_lock:
+            self.queued -= 1
+
+    def pool_size(self) -> int:
+        size = self.workers or min(self.max_workers, 2 * len(self.targets())) or 1
+        if self.engine == "async":
+            # every in-flight coroutine holds a worker, a smaller pool would cap concurrency
+            size = max(size, self.concurrency)
+        return size
+
+    def targets(self) -> list:
+        """
+        Returns the (account, region) pairs collected by this replica, the ones of its shard.
+        """
+        return [
+            (account, region)
+            for account in self.accounts
+            for region in self.regions
+            if self.ring.shard((account, region)) == self.shard_index
+        ]
+
+    def client(self, module: str, region: str, account: str = "") -> Any:
+        # the account is only passed when set so plain (module, region_name) getters keep working
+        if account:
+            return self.get_client(module, region_name=region, account=account)
+        return self.get_client(module, region_name=region)
+
+    def shutdown(self) -> None:
+        """
+        Stops the background refresher and shuts down the worker pool, waiting for in-flight calls.
+
+        Returns:
+        None
+
+        """
+        self.stop_refresher()
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+            self.rate_limiter.unshare()
+
+    def is_excluded(self, tags: Dict[str, str]) -> bool:
+        return self.exclude_matcher.any(tags)
+
+    def is_not_excluded(self, tags: Dict[str, str]) -> bool:
+        return not self.is_excluded(tags=tags)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def label_name(key: str) -> str:
+        """
+        Converts a tag key into a valid prometheus label name, e.g. "aws:Stack-Name" -> "tag_aws_stack_name".
+        """
+        return re.sub(r"[^a-z0-9_]", "_", f"tag_{key}".lower())
+
+    @staticmethod
+    def label_schema(rows: list) -> tuple:
+        """
+        Builds the label columns of a per-resource metric and its rows as value tuples.
+
+        Resources may have different tag sets: the columns are the union of every row's keys
+        in order of first appearance and missing labels are filled with empty strings.
+
+        Args:
+            rows (list): The label rows, one dictionary per resource, or a ResourceTable.
+
+        Returns:
+        tuple: (columns, values), a tuple of label names and a list of tuples in column order.
+
+        """
+        if not isinstance(rows, ResourceTable):
+            rows = ResourceTable(rows)
+        return rows.schema()
+
+    def tag_labels(self, tags: Dict[str, str]) -> Dict[str, str]:
+        return {self.label_name(k): v.lower() for k, v in tags.items() if self.is_label_tag(k)}
+
+    def is_label_tag(self, key: str) -> bool:
+        return self.label_tags is None or key.lower() in self.label_tags
+
+    def is_included(self, tags: Dict[str, str]) -> bool:
+        return self.include_matcher.all(tags)
+
+    def tag_filters(self) -> list:
+        """
+        Builds the AWS filters that narrow describe_* responses to the include_tags allow-list.
+
+        AWS filters are case sensitive and cannot negate, so by default only the tag keys are
+        pushed to AWS and values are matched client side; exclude_tags is always client side.
+        Keys with regex values are never pushed with their values, AWS only understands globs.
+
+        Returns:
+        list: Filters to append to a describe_* call.
+
+        """
+        filters = []
+        for key, value in self.include_tags.items():
+            values = [f"{item}" for item in value]
+            if not self.tag_values_server_side or any(
+                item.startswith(TagMatcher.regex_prefix) for item in values
+            ):
+                values = ["*"]
+            filters.append({"Name": f"tag:{key}", "Values": values})
+        return filters
+
+    def keep(self, tags: Dict[str, str], counts: dict) -> bool:
+        """
+        Applies the client side include and exclude filters, counting what each one drops.
+
+        Args:
+            self: The current instance.
+            tags (dict): The resource tags.
+            counts (dict): Filter counters, updated in place.
+
+        Returns:
+        bool: True if the resource should be reported.
+
+        """
+        counts["fetched"] += 1
+        if not self.is_included(tags=tags):
+            counts["include"] += 1
+            return False
+        if self.is_excluded(tags=tags):
+            counts["exclude"] += 1
+            return False
+        return True
+
+    def new_stats(self, account: str, region: str, api: str) -> dict:
+        return {
+            "account": account,
+            "region": region,
+            "api": api,
+            "throttles": 0,
+            "retry_seconds": 0.0,
+            "pages": 0,
+            "items": 0,
+            "bytes": 0,
+            "latency": [],
+            "error": "",
+        }
+
+    @staticmethod
+    def error_type(error: Exception) -> str:
+        """
+        Returns the AWS error code of a ClientError, otherwise the exception class name.
+        """
+        if isinstance(error, ClientError):
+            return error.response.get("Error", {}).get("Code", "") or type(error).__name__
+        return type(error).__name__
+
+    def paginate(
+        self, client: Any, operation: str, key: str, stats: dict, **kwargs
+    ) -> Iterator[dict]:
+        """
+        Streams the items of a paginated describe_* call one page at a time. Operations that
+        cannot be paginated are called once.
+
+        Every page request takes a token from the (account, region, API) rate limiter. A page
+        still throttled after the botocore retries is retried from its pagination token after
+        a jittered exponential backoff. The latency, size and item count of every page are
+        recorded in stats.
+
+        Args:
+            self: The current instance.
+            client (Any): The boto3 EC2 client.
+            operation (str): The paginated operation, e.g. "describe_volumes".
+            key (str): The response key holding the items, e.g. "Volumes".
+            stats (dict): Call statistics from new_stats(), updated in place.
+            **kwargs: Extra arguments passed to the operation, e.g. Filters.
+
+        Yields:
+        dict: The items of every page, in order. Only one page is held in memory at a time.
+
+        """
+        bucket = (stats["account"], stats["region"], operation)
+        config = {"PageSize": self.page_size}
+        if client.can_paginate(operation):
+            paginate = client.get_paginator(operation).paginate
+        else:
+
+            def paginate(PaginationConfig: dict, **kwargs) -> Iterator[dict]:
+                # a single call, retried like a page
+                yield getattr(client, operation)(**kwargs)
+
+        pages = iter(paginate(PaginationConfig=config, **kwargs))
+        attempt = 0
+        while True:
+            stats["retry_seconds"] += self.rate_limiter.acquire(bucket)
+            started = time.monotonic()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            except ClientError as error:
+                code = error.response.get("Error", {}).get("Code", "")
+                if code not in self.throttling_errors or attempt >= self.backoff_retries:
+                    raise
+                attempt += 1
+                delay = random.uniform(0, min(self.max_backoff, self.backoff_base * 2**attempt))
+                stats["throttles"] += 1
+                stats["retry_seconds"] += delay
+                logging.warning(
+                    "%s throttled in %s, retrying in %.2fs", operation, stats["region"], delay
+                )
+                time.sleep(delay)
+                pages = iter(paginate(PaginationConfig=config, **kwargs))
+                continue
+            attempt = 0
+            headers = page.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+            stats["latency"].append(time.monotonic() - started)
+            stats["pages"] += 1
+            stats["items"] += len(page[key])
+            stats["bytes"] += int(headers.get("content-length", 0))
+            if page.get("NextToken"):
+                config = {"PageSize": self.page_size, "StartingToken": page["NextToken"]}
+            yield from page[key]
+
+    def iter_stopped_ec2(
+        self,
+        client: Any,
+        region: str,
+        counts: dict,
+        filters: Optional[list] = None,
+        stats: Optional[dict] = None,
+    ) -> Iterator[dict]:
+        """
+        Streams label rows for the stopped, non excluded EC2 instances of a region.
+
+        Args:
+            self: The current instance.
+            client (Any): The boto3 EC2 client for the region.
+            region (str): The AWS region to query.
+            counts (dict): Filter counters, updated in place as instances are streamed.
+            filters (list): Extra AWS filters, e.g. to describe only some instance ids.
+            stats (dict): Call statistics, updated in place (default: discarded).
+
+        Yields:
+        dict: One row per instance, see get_stopped_ec2().
+
+        """
+        filter = [{"Name": "instance-state-name", "Values": ["stopped"]}] + self.tag_filters()
+        filter += filters or []
+        stats = stats or self.new_stats("", region, "describe_instances")
+        pages = self.paginate(client, "describe_instances", "Reservations", stats, Filters=filter)
+        for reserve in pages:
+            for instance in reserve["Instances"]:
+                tags: Dict[str, str] = {
+                    tag["Key"]: tag["Value"] for tag in instance.get("Tags", [])
+                }
+                if self.keep(tags=tags, counts=counts):
+                    item = {
+                        "name": tags.get("Name", ""),
+                        "instanceid": instance["InstanceId"],
+                        "region": region,
+                    }
+                    yield {**item, **self.tag_labels(tags)}
+
+    def iter_unattached_volumes(
+        self,
+        client: Any,
+        region: str,
+        states: dict,
+        counts: dict,
+        filters: Optional[list] = None,
+        stats: Optional[dict] = None,
+        known: Optional[dict] = None,
+    ) -> Iterator[dict]:
+        """
+        Streams label rows for the unattached or errored, non excluded EBS volumes of a region.
+
+        Args:
+            self: The current instance.
+            client (Any): The boto3 EC2 client for the region.
+            region (str): The AWS region to query.
+            states (dict): Volume state counters, updated in place as volumes are streamed.
+            counts (dict): Filter counters, updated in place as volumes are streamed.
+            filters (list): Extra AWS filters, e.g. to describe only some volume ids.
+            stats (dict): Call statistics, updated in place (default: discarded).
+            known (dict): The state of every volume streamed by volume id, excluded ones
+                included, updated in place (default: discarded).
+
+        Yields:
+        dict: One row per volume, see get_unattached_volumes().
+
+        """
+        filter = [{"Name": "status", "Values": ["available", "error"]}] + self.tag_filters()
+        filter += filters or []
+        stats = stats or self.new_stats("", region, "describe_volumes")
+        known = {} if known is None else known
+        for volume in self.paginate(client, "describe_volumes", "Volumes", stats, Filters=filter):
+            tags: Dict[str, str] = {
+                tag["Key"]: tag["Value"] for tag in volume.get("Tags", [])
+            }
+            state = (
+                "unattached" if volume["State"] == "available" else volume["State"]
+            )
+            states[state] += 1
+            known[volume["VolumeId"]] = state
+
+            if self.keep(tags=tags, counts=counts):
+                item = {
+                    "name": tags.get("Name", ""),
+                    "availabilityzone": volume["AvailabilityZone"],
+                    "size": f'{volume["Size"]}GB',
+                    "volumeid": volume["VolumeId"],
+                    "volumetype": volume["VolumeType"],
+                    "state": state,
+                    "region": region,
+                }
+                yield {**item, **self.tag_labels(tags)}
+
+    def iter_attached_volumes(
+        self, client: Any, region: str, instance_ids: list, stats: dict
+    ) -> Iterator[dict]:
+        """
+        Streams the size and type of the volumes attached to the given instances.
+
+        Args:
+            self: The current instance.
+            client (Any): The boto3 EC2 client for the region.
+            region (str): The AWS region to query.
+            instance_ids (list): The instances whose volumes are described.
+            stats (dict): Call statistics, updated in place.
+
+        Yields:
+        dict: One row per attachment with instanceid, region, size and volumetype.
+
+        """
+        wanted = set(instance_ids)
+        # AWS accepts at most 200 values per filter
+        for start in range(0, len(instance_ids), 200):
+            filters = [{"Name": "attachment.instance-id", "Values": instance_ids[start:start + 200]}]
+            for volume in self.paginate(client, "describe_volumes", "Volumes", stats, Filters=filters):
+                for attachment in volume.get("Attachments", []):
+                    if attachment.get("InstanceId") in wanted:
+                        yield {
+                            "instanceid": attachment["InstanceId"],
+                            "region": region,
+                            "size": f'{volume["Size"]}GB',
+                            "volumetype": volume["VolumeType"],
+                        }
+
+    @staticmethod
+    def with_account(rows: Iterator[dict], account: str) -> Iterator[dict]:
+        """
+        Adds the account label to streamed rows. Rows of the default account are left unlabelled.
+        """
+        if not account:
+            return rows
+        return ({**row, "account": account} for row in rows)
+
+    def get_stopped_ec2(self, region: str, ids: Optional[list] = None, account: str = "") -> dict:
+        """
+        Retrieves all stopped EC2 instances for a given AWS region.
+
+        Args:
+            self: The current instance.
+            region (str): The AWS region to query.
+            ids (list): Only describe these instance ids (default: all instances).
+            account (str): The account to query, "" for the default credentials (default: "").
+
+        Returns:
+            dict: A dictionary containing two keys:
+                - 'response' (ResourceTable): The rows of the stopped EC2 instances.
+                  Each row includes the following keys:
+                    - 'name' (str): The name of the instance.
+                    - 'region' (str): The AWS region where the instance is located.
+                    - 'instanceid' (str): The ID of the EC2 instance.
+                - 'errorcount' (int): The count of errors that occurred during the retrieval process.
+                - 'region' (str): The AWS region.
+                - 'account' (str): The account.
+                - 'filtered' (dict): Instances fetched from AWS and dropped by the include and exclude filters.
+                - 'stats' (dict): API call statistics, see new_stats().
+                - 'storage' (ResourceTable): Volumes attached to the instances, only described when pricing is set.
+                - 'storage_stats' (dict): API call statistics of describing the attached volumes.
+
+        Raises:
+            None
+
+        """
+        logging.debug("get_stopped_ec2 for region %s", region)
+        result = ResourceTable()
+        storage = ResourceTable()
+        counts = {"fetched": 0, "include": 0, "exclude": 0}
+        stats = self.new_stats(account, region, "describe_instances")
+        storage_stats = self.new_stats(account, region, "describe_volumes")
+        try:
+            client = self.client("ec2", region, account)
+            filters = [{"Name": "instance-id", "Values": ids}] if ids else None
+            rows = self.iter_stopped_ec2(client, region, counts, filters, stats)
+            result.extend(self.with_account(rows, account))
+            if self.pricing is not None and result:
+                _, instance_ids = result.schema(["instanceid"])
+                volumes = self.iter_attached_volumes(
+                    client, region, [instance_id for instance_id, in instance_ids], storage_stats
+                )
+                storage.extend(self.with_account(volumes, account))
+            return {
+                "response": result.compact(),
+                "errorcount": 0,
+                "region": region,
+                "account": account,
+                "filtered": counts,
+                "stats": stats,
+                "storage": storage.compact(),
+                "storage_stats": storage_stats,
+            }
+
+        except Exception as error:
+            kind, _, traceback = sys.exc_info()
+            logging.error(
+                f"error retrieving stopped ec2 instances from AWS: Error={error}, ErrorType={kind.__name__}, TracebackInfo={traceback.tb_frame.f_code}, ErrorLineNumber={traceback.tb_lineno}"
+            )
+            stats["error"] = self.error_type(error)
+            return {
+                "response": result,
+                "errorcount": 1,
+                "region": region,
+                "account": account,
+                "filtered": counts,
+                "stats": stats,
+                "storage": storage,
+                "storage_stats": storage_stats,
+            }
+
+    def get_unattached_volumes(
+        self, region: str, ids: Optional[list] = None, account: str = ""
+    ) -> dict:
+        """
+        Retrieves unattached volumes in the specified AWS region.
+
+        Args:
+            self: The current instance.
+            region (str): The AWS region where the volumes are located.
+            ids (list): Only describe these volume ids (default: all volumes).
+            account (str): The account to query, "" for the default credentials (default: "").
+
+        Returns:
+            dict: A dictionary containing two keys:
+                - 'errorcount' (int): The count of errors that occurred during the retrieval process.
+                - 'region' (str): The AWS region.
+                - 'account' (str): The account.
+                - 'response' (dict): A dictionary containing the actual response.
+                    - 'states' (dict): A dictionary containing the count of volumes in different states.
+                    Possible states are 'unattached' and 'error'.
+                    - 'known' (dict): The state of every volume counted in 'states', by volume id.
+                    - 'result' (ResourceTable): The rows of the unattached volumes, each row
+                    with the following keys:
+                        - 'name' (str): The name of the volume.
+                        - 'availabilityzone' (str): The availability zone of the volume.
+                        - 'size' (str): The size of the volume in the format '{size}GB'.
+                        - 'volumeid' (str): The ID of the volume.
+                        - 'volumetype' (str): The type of the volume.
+                        - 'state' (str): The state of the volume, which can be 'unattached' or an 'error' state.
+                        - 'region' (str): The AWS region where the volume is located.
+                - 'filtered' (dict): Volumes fetched from AWS and dropped by the include and exclude filters.
+                - 'stats' (dict): API call statistics, see new_stats().
+
+        Raises:
+            None
+
+        """
+        logging.debug("get_unattached_volumes for region %s", region)
+        result = ResourceTable()
+        states = {"unattached": 0, "error": 0}
+        known: Dict[str, str] = {}
+        counts = {"fetched": 0, "include": 0, "exclude": 0}
+        stats = self.new_stats(account, region, "describe_volumes")
+        try:
+            client = self.client("ec2", region, account)
+            filters = [{"Name": "volume-id", "Values": ids}] if ids else None
+            rows = self.iter_unattached_volumes(client, region, states, counts, filters, stats, known)
+            result.extend(self.with_account(rows, account))
+            response = {"states": states, "known": known, "result": result.compact()}
+            return {
+                "response": response,
+                "errorcount": 0,
+                "region": region,
+                "account": account,
+                "filtered": counts,
+                "stats": stats,
+            }
+        except Exception as error:
+            kind, _, traceback = sys.exc_info()
+            logging.error(
+                f"error retrieving volume details from AWS: Error={error}, ErrorType={kind.__name__}, TracebackInfo={traceback.tb_frame.f_code}, ErrorLineNumber={traceback.tb_lineno}"
+            )
+            stats["error"] = self.error_type(error)
+
+            response = {"states": states, "known": known, "result": ResourceTable()}
+            return {
+                "response": response,
+                "errorcount": 1,
+                "region": region,
+                "account": account,
+                "filtered": counts,
+                "stats": stats,
+            }
+
+    def get_resources(self, name: str, region: str, account: str = "") -> dict:
+        """
+        Retrieves the wasted resources of an additional source in a region.
+
+        Args:
+            self: The current instance.
+            name (str): The ResourceCollector name.
+            region (str): The AWS region to query.
+            account (str): The account to query, "" for the default credentials (default: "").
+
+        Returns:
+            dict: The same keys as get_stopped_ec2(), 'response' holding the resource rows.
+
+        """
+        logging.debug("get_resources %s for region %s", name, region)
+        resource = self.resources[name]
+        result = ResourceTable()
+        counts = {"fetched": 0, "include": 0, "exclude": 0}
+        stats = self.new_stats(account, region, name)
+        errorcount = 0
+        try:
+            client = self.client("ec2", region, account)
+            rows = (
+                {**labels, "region": region, **self.tag_labels(tags)}
+                for labels, tags in resource.describe(self, client, region, stats)
+                if self.keep(tags=tags, counts=counts)
+            )
+            result.extend(self.with_account(rows, account))
+        except Exception as error:
+            kind, _, traceback = sys.exc_info()
+            logging.error(
+                f"error retrieving {name} from AWS: Error={error}, ErrorType={kind.__name__}, "
+                f"TracebackInfo={traceback.tb_frame.f_code}, ErrorLineNumber={traceback.tb_lineno}"
+            )
+            stats["error"] = self.error_type(error)
+            errorcount = 1
+        return {
+            "response": result.compact(),
+            "errorcount": errorcount,
+            "region": region,
+            "account": account,
+            "filtered": counts,
+            "stats": stats,
+        }
+
+    def due_resources(self) -> List[str]:
+        """
+        Returns the additional sources whose interval elapsed, marking them as collected.
+        """
+        now = time.time()
+        due = [
+            name
+            for name, resource in self.resources.items()
+            if now - self.resource_collected[name] >= resource.interval
+        ]
+        for name in due:
+            self.resource_collected[name] = now
+        return due
+
+    def merge_resource(self, name: str, response: dict) -> None:
+        """
+        Stores the region response of an additional source, see get_resources().
+
+        Returns:
+        None
+
+        """
+        self.merge_stats(name, response)
+        self.errors += response["errorcount"]
+        response = self.last_known_good(name, response)
+        self.resource_data[name][(response["account"], response["region"])] = response["response"]
+
+    def finish_resources(self, result: dict, targets: Optional[list] = None) -> dict:
+        """
+        Adds the last rows of every additional source to a metrics result and returns it.
+        """
+        for name in self.resources:
+            table = ResourceTable()
+            for target in self.targets() if targets is None else targets:
+                table.extend(self.resource_data[name].get(target, ()))
+            result["resources"][name] = table.compact()
+        return result
+
+    def get_instance_metrics(self, targets: Optional[list] = None) -> dict:
+        """
+        Retrieves metrics related to instances and volumes in different regions.
+
+        Args:
+            self: The current instance.
+            targets (list): Only collect these (account, region) pairs, with every additional
+                source regardless of its interval (default: every configured pair).
+
+        Returns:
+        dict: A dictionary containing the following metrics:
+            - 'stopped_instances' (ResourceTable): Rows of the stopped instances.
+            - 'volumes' (ResourceTable): Rows of the volumes.
+            - 'volume_states' (dict): Dictionary keyed by (account, region) with the following values:
+                - 'unattached' (int): Number of unattached volumes.
+                - 'error' (int): Number of volumes with errors.
+            - 'stopped_instances_count' (dict): Number of stopped instances keyed by (account, region).
+            - 'attached_storage' (ResourceTable): Volumes attached to the stopped instances, when pricing is set.
+            - 'resources' (dict): Rows of every additional source, keyed by ResourceCollector name.
+
+        Raises:
+        Exception: If an error occurs during the retrieval process.
+
+        """
+        if self.engine == "async":
+            return asyncio.run(self.get_instance_metrics_async(targets))
+
+        due = self.due_resources() if targets is None else list(self.resources)
+        targets = self.targets() if targets is None else targets
+        result = self.empty_result(targets)
+        processes = []
+        funcs = self.get_funcs(due=due)
+
+        for account, region in targets:
+            for name, func in funcs.items():
+                logging.debug("calling func for region %s", region)
+                processes.append(
+                    {
+                        "name": name,
+                        "process": self.submit(func, region=region, account=account),
+                    }
+                )
+
+        for p in processes:
+            self.merge_response(result, p["name"], p["process"].result())
+        return self.finish_resources(result)
+
+    async def get_instance_metrics_async(self, targets: Optional[list] = None) -> dict:
+        """
+        Retrieves metrics related to instances and volumes in different regions using asyncio.
+
+        Every region and API call runs as a coroutine bridged onto the worker pool, bounded by
+        a global concurrency limit and a per-region limit, so a collection takes roughly as long
+        as the slowest region.
+
+        Args:
+            self: The current instance.
+            targets (list): Only collect these (account, region) pairs, see get_instance_metrics().
+
+        Returns:
+        dict: The same metrics as get_instance_metrics().
+
+        """
+        due = self.due_resources() if targets is None else list(self.resources)
+        targets = self.targets() if targets is None else targets
+        result = self.empty_result(targets)
+        limit = asyncio.Semaphore(self.concurrency or self.pool_size())
+        region_limits = {
+            target: asyncio.Semaphore(self.region_concurrency) for target in targets
+        }
+
+        async def call(name: str, func: Callable[..., dict], account: str, region: str) -> tuple:
+            async with limit, region_limits[(account, region)]:
+                logging.debug("calling func for region %s", region)
+                response = await asyncio.wrap_future(
+                    self.submit(func, region=region, account=account)
+                )
+                return name, response
+
+        funcs = self.get_funcs(due=due)
+        calls = [
+            call(name, func, account, region)
+            for account, region in targets
+            for name, func in funcs.items()
+        ]
+        for name, response in await asyncio.gather(*calls):
+            self.merge_response(result, name, response)
+        return self.finish_resources(result)
+
+    def get_funcs(self, due: Iterable[str] = ()) -> Dict[str, Callable[..., dict]]:
+        """
+        Returns the functions called per account and region, by name: the stopped instances,
+        the unattached volumes and the given additional sources.
+        """
+        funcs = {"ec2": self.get_stopped_ec2, "volume": self.get_unattached_volumes}
+        for name in due:
+            funcs[name] = functools.partial(self.get_resources, name)
+        return funcs
+
+    def merge_response(self, result: dict, name: str, response: dict) -> None:
+        """
+        Merges a single region response from get_stopped_ec2 or get_unattached_volumes into result.
+
+        Args:
+            self: The current instance.
+            result (dict): The metrics being assembled, as returned by empty_result().
+            name (str): The function name the response came from, "ec2" or "volume".
+            response (dict): The region response.
+
+        Returns:
+        None
+
+        """
+        if name in self.resources:
+            self.merge_resource(name, response)
+            return
+        self.add_response(result, name, self.accept_response(name, response))
+
+    def accept_response(self, name: str, response: dict) -> dict:
+        """
+        Accounts the stats and errors of a region response, "ec2" or "volume", and returns the
+        response to report, see last_known_good().
+        """
+        self.merge_stats(name, response)
+        self.errors += response["errorcount"]
+        return self.last_known_good(name, response)
+
+    @staticmethod
+    def add_response(result: dict, name: str, response: dict) -> None:
+        """
+        Adds the rows and totals of a region response, "ec2" or "volume", to result.
+        """
+        target = (response["account"], response["region"])
+        if name == "ec2":
+            result["stopped_instances"].extend(response["response"])
+            result["attached_storage"].extend(response["storage"])
+            result["stopped_instances_count"][target] = len(response["response"])
+        else:
+            response_obj = response["response"]
+            result["volumes"].extend(response_obj["result"])
+            result["volume_states"][target] = response_obj["states"]
+
+    def last_known_good(self, name: str, response: dict) -> dict:
+        """
+        Caches successful region responses and substitutes the cached one for a failed response.
+
+        The cached response is served until it is older than max_stale_age, so a failing region
+        keeps reporting its last known resources instead of dropping to zero.
+
+        Args:
+            self: The current instance.
+            name (str): The function name the response came from, "ec2" or "volume".
+            response (dict): The region response.
+
+        Returns:
+        dict: The response to report, either the given one or the last successful one.
+
+        """
+        key = (response["account"], response["region"], name)
+        now = time.time()
+        if response["errorcount"] == 0:
+            self.region_cache[key] = (response, now)
+            self.region_freshness[key] = (now, False)
+            return response
+        cached = self.region_cache.get(key)
+        if cached is None or now - cached[1] > self.max_stale_age:
+            self.region_cache.pop(key, None)
+            self.region_freshness[key] = (now, True)
+            return response
+        logging.warning(
+            "serving %ss old %s data for region %s", int(now - cached[1]), name, response["region"]
+        )
+        self.region_freshness[key] = (cached[1], True)
+        return cached[0]
+
+    def merge_stats(self, name: str, response: dict) -> None:
+        """
+        Accumulates the filter counters and API call statistics of a region response.
+
+        Args:
+            self: The current instance.
+            name (str): The function name the response came from, "ec2" or "volume".
+            response (dict): The region response.
+
+        Returns:
+        None
+
+        """
+        for stage, count in response["filtered"].items():
+            self.filtered[name][stage] += count
+        self.merge_api_stats(response["stats"])
+        if response.get("storage_stats", {}).get("pages"):
+            self.merge_api_stats(response["storage_stats"])
+
+    def merge_api_stats(self, stats: dict) -> None:
+        """
+        Accumulates API call statistics returned by a worker, see new_stats().
+        """
+        key = (stats["account"], stats["region"], stats["api"])
+        if key not in self.api_stats:
+            self.api_stats[key] = {
+                "throttles": 0,
+                "retry_seconds": 0.0,
+                "pages": 0,
+                "items": 0,
+                "bytes": 0,
+                "latency": Histogram(self.request_buckets),
+            }
+        totals = self.api_stats[key]
+        for field in ("throttles", "retry_seconds", "pages", "items", "bytes"):
+            totals[field] += stats[field]
+        for seconds in stats["latency"]:
+            totals["latency"].observe(seconds)
+        if stats["error"]:
+            self.error_types[key + (stats["error"],)] += 1
+
+    def get_incremental_metrics(self) -> dict:
+        """
+        Retrieves metrics from the in-memory inventory, updated from the event source.
+
+        A full collection rebuilds the inventory on the first call and every reconcile_interval
+        seconds. In between, the resources named by change events are described again by id,
+        so API calls scale with the number of changes instead of the size of the account.
+
+        Args:
+            self: The current instance.
+
+        Returns:
+        dict: The same metrics as get_instance_metrics().
+
+        """
+        events = self.event_source.poll()
+        if self.inventory is None or time.time() - self.reconciled >= self.reconcile_interval:
+            self.reconcile()
+            return self.inventory_result()
+
+        for event in events:
+            account = self.account_ids.get(event.get("account", ""), "") if self.account_ids else ""
+            if (account, event["region"]) in self.inventory["ec2"]:
+                key = (event["resource"], account, event["region"])
+                self.pending.setdefault(key, set()).add(event["id"])
+        changes, self.pending = self.pending, {}
+        funcs = self.get_funcs()
+        processes = []
+        try:
+            resources = [
+                (name, self.submit(func, region=region, account=account))
+                for name, func in self.get_funcs(due=self.due_resources()).items()
+                if name in self.resources
+                for account, region in self.targets()
+            ]
+            for (name, account, region), ids in changes.items():
+                ids = sorted(ids)
+                # AWS accepts at most 200 values per filter
+                for start in range(0, len(ids), 200):
+                    chunk = ids[start:start + 200]
+                    process = self.submit(funcs[name], region=region, ids=chunk, account=account)
+                    processes.append((name, chunk, process))
+            for name, ids, process in processes:
+                self.apply_changes(name, ids, process.result())
+            for name, process in resources:
+                self.merge_resource(name, process.result())
+        except BaseException:
+            # describing a resource again is idempotent, retry every change on the next refresh
+            for key, ids in changes.items():
+                self.pending.setdefault(key, set()).update(ids)
+            raise
+        logging.debug("applied %s change events", len(events))
+        return self.inventory_result()
+
+    def reconcile(self) -> None:
+        """
+        Rebuilds the inventory from a full collection across every region.
+
+        Returns:
+        None
+
+        """
+        logging.info("reconciling inventory with a full collection")
+        self.inventory = self.build_inventory(self.get_instance_metrics(), self.targets())
+        self.pending = {}
+        self.reconciled = time.time()
+
+    def build_inventory(self, data: dict, targets: list) -> dict:
+        """
+        Indexes collected metrics by (account, region) and resource id.
+
+        The state of every counted volume, excluded ones included, comes from the volume
+        responses reported for the collection, see last_known_good().
+
+        Args:
+            self: The current instance.
+            data (dict): Metrics of the targets, as returned by get_instance_metrics().
+            targets (list): The (account, region) pairs data was collected from.
+
+        Returns:
+        dict: The inventory of the targets.
+
+        """
+        inventory: dict = {
+            "ec2": {target: {} for target in targets},
+            "volume": {target: {} for target in targets},
+            "storage": {target: {} for target in targets},
+            "states": data["volume_states"],
+            "known": {target: {} for target in targets},
+        }
+        for target in targets:
+            cached = self.region_cache.get(target + ("volume",))
+            if cached is not None:
+                inventory["known"][target].update(cached[0]["response"]["known"])
+        for row in data["stopped_instances"]:
+            inventory["ec2"][(row.get("account", ""), row["region"])][row["instanceid"]] = row
+        for row in data["attached_storage"]:
+            storage = inventory["storage"][(row.get("account", ""), row["region"])]
+            storage.setdefault(row["instanceid"], []).append(row)
+        for row in data["volumes"]:
+            inventory["volume"][(row.get("account", ""), row["region"])][row["volumeid"]] = row
+        return inventory
+
+    def apply_changes(self, name: str, ids: list, response: dict) -> None:
+        """
+        Replaces the inventory entries of the given resource ids with a fresh describe response.
+
+        Ids missing from the response are no longer stopped or unattached and are dropped.
+        Failed calls are retried on the next refresh. The last known state of every volume,
+        excluded ones included, is subtracted from the state totals before the new one is added.
+
+        Args:
+            self: The current instance.
+            name (str): The resource kind, "ec2" or "volume".
+            ids (list): The resource ids that were described.
+            response (dict): The response of get_stopped_ec2 or get_unattached_volumes.
+
+        Returns:
+        None
+
+        """
+        account, region = response["account"], response["region"]
+        self.merge_stats(name, response)
+        if response["errorcount"]:
+            self.errors += response["errorcount"]
+            self.pending.setdefault((name, account, region), set()).update(ids)
+            return
+
+        rows = self.inventory[name][(account, region)]
+        if name == "ec2":
+            storage = self.inventory["storage"][(account, region)]
+            for resource_id in ids:
+                rows.pop(resource_id, None)
+                storage.pop(resource_id, None)
+            for row in response["response"]:
+                rows[row["instanceid"]] = row
+            for row in response["storage"]:
+                storage.setdefault(row["instanceid"], []).append(row)
+            return
+
+        states = self.inventory["states"][(account, region)]
+        known = self.inventory["known"][(account, region)]
+        for resource_id in ids:
+            rows.pop(resource_id, None)
+            state = known.pop(resource_id, None)
+            if state is not None:
+                states[state] -= 1
+        for resource_id, state in response["response"]["known"].items():
+            previous = known.get(resource_id)
+            if previous is not None:
+                states[previous] -= 1
+            known[resource_id] = state
+            states[state] += 1
+        for row in response["response"]["result"]:
+            rows[row["volumeid"]] = row
+
+    def inventory_result(self) -> dict:
+        """
+        Flattens the inventory into the result shape of get_instance_metrics().
+
+        Returns:
+        dict: The metrics held in the inventory.
+
+        """
+        result = self.empty_result()
+        for target in self.targets():
+            instances = self.inventory["ec2"][target]
+            result["stopped_instances"].extend(instances.values())
+            for volumes in self.inventory["storage"][target].values():
+                result["attached_storage"].extend(volumes)
+            result["stopped_instances_count"][target] = len(instances)
+            result["volumes"].extend(self.inventory["volume"][target].values())
+            result["volume_states"][target] = dict(self.inventory["states"][target])
+        return self.finish_resources(result)
+
+    def empty_result(self, targets: Optional[list] = None) -> dict:
+        """
+        Returns a metrics result with zeroed totals for every configured account and region.
+
+        Args:
+            targets (list): The (account, region) pairs to zero (default: every configured pair).
+
+        Returns:
+        dict: A dictionary with the same shape as get_instance_metrics().
+
+        """
+        targets = self.targets() if targets is None else targets
+        return {
+            "stopped_instances": ResourceTable(),
+            "volumes": ResourceTable(),
+            "attached_storage": ResourceTable(),
+            "resources": {name: ResourceTable() for name in self.resources},
+            "volume_states": {target: {"unattached": 0, "error": 0} for target in targets},
+            "stopped_instances_count": {target: 0 for target in targets},
+        }
+
+    def refresh(self) -> dict:
+        """
+        Collects fresh metrics from AWS and stores them as the current snapshot.
+
+        Args:
+            self: The current instance.
+
+        Returns:
+        dict: The freshly collected metrics, as returned by get_instance_metrics().
+
+        """
+        with self.collection_lock:
+            logging.info("Collecting metrics...")
+            started = time.monotonic()
+            if self.event_source is not None:
+                data = self.get_incremental_metrics()
+            else:
+                data = self.get_instance_metrics()
+            self.collection_duration.observe(time.monotonic() - started)
+            self.store_snapshot(data)
+            return data
+
+    def store_snapshot(self, data: dict, targets: Optional[list] = None) -> None:
+        """
+        Makes collected metrics the current snapshot, persisting it if the collection had no errors.
+
+        Args:
+            self: The current instance.
+            data (dict): Metrics as returned by get_instance_metrics().
+            targets (list): The (account, region) pairs whose data changed, only their
+                fragments are rendered again in staggered mode (default: every pair).
+
+        Returns:
+        None
+
+        """
+        data["stopped_instances"].compact()
+        data["volumes"].compact()
+        data["attached_storage"].compact()
+        # snapshots are served many times, render them once
+        rendered = None
+        if self.refresh_interval > 0:
+            if self.fragmented():
+                targets = self.targets() if targets is None else targets
+                rendered = self.render_targets({target: None for target in targets})
+            else:
+                rendered = self.render(data)
+        with self.snapshot_lock:
+            self.snapshot = data
+            self.snapshot_time = time.time()
+            self.rendered = rendered
+            self.restored = False
+
+        if self.errors == 0:
+            logging.info("metrics successfully collected")
+            if self.snapshot_path:
+                self.save_snapshot(data, self.snapshot_time)
+        else:
+            logging.info("error(s) were encountered while collecting metrics")
+            self.errors = 0
+
+    def reconfigure(
+        self,
+        regions: Optional[list] = None,
+        exclude_tags: Optional[dict] = None,
+        include_tags: Optional[dict] = None,
+    ) -> list:
+        """
+        Swaps the collected regions and tag filters without restarting the exporter.
+
+        The swap waits for a running collection and is atomic for later ones. Cached clients
+        and the data of unchanged regions are kept, removed regions are dropped from the
+        snapshot and only added regions are collected, right away when a snapshot is served.
+        A change of the tag filters invalidates every region and triggers a full collection.
+
+        Args:
+            self: The current instance.
+            regions (list): The new regions (default: unchanged).
+            exclude_tags (dict): The new exclude_tags config (default: unchanged).
+            include_tags (dict): The new include_tags config (default: unchanged).
+
+        Returns:
+        list: The (account, region) pairs collected because of the change.
+
+        """
+        regions = self.regions if regions is None else list(regions)
+        exclude_tags = self.exclude_tags if exclude_tags is None else exclude_tags
+        include_tags = self.include_tags if include_tags is None else include_tags
+        # compiled before anything is swapped, so an invalid pattern changes nothing
+        exclude_matcher, include_matcher = TagMatcher(exclude_tags), TagMatcher(include_tags)
+        with self.collection_lock:
+            previous = set(self.targets())
+            filters_changed = (exclude_tags, include_tags) != (self.exclude_tags, self.include_tags)
+            self.regions = regions
+            self.exclude_tags, self.exclude_matcher = exclude_tags, exclude_matcher
+            self.include_tags, self.include_matcher = include_tags, include_matcher
+            targets = self.targets()
+            removed = previous - set(targets)
+            new = [target for target in targets if target not in previous]
+            added = targets if filters_changed else new
+            logging.info(
+                "reconfigured: %s regions added, %s removed%s",
+                len(new),
+                len(removed),
+                ", tag filters changed" if filters_changed else "",
+            )
+            for cache in (self.region_cache, self.region_freshness):
+                for key in list(cache):
+                    if filters_changed or key[:2] in removed:
+                        del cache[key]
+            for data in self.resource_data.values():
+                for target in list(data):
+                    if filters_changed or target in removed:
+                        del data[target]
+            if filters_changed:
+                # the rows of every source were dropped, collect them again whatever their interval
+                self.resource_collected = dict.fromkeys(self.resources, 0.0)
+            self.pending = {key: ids for key, ids in self.pending.items() if key[1:] not in removed}
+
+            if self.refresh_interval <= 0 and self.event_source is None:
+                # every scrape collects every region anyway
+                return []
+            if self.schedule == "staggered" and len(self.scheduler):
+                items = self.schedule_items()
+                self.scheduler.remove(set(self.scheduler.intervals) - set(items))
+                if filters_changed:
+                    self.refresh()
+                else:
+                    keys = [key for key in items if key[:2] in set(added)]
+                    if keys:
+                        self.refresh_items(keys, full=True)
+                    else:
+                        self.store_snapshot(self.compose_result(), targets=[])
+                self.scheduler.add(items, time.time())
+                return added
+            if filters_changed:
+                self.inventory = None
+                self.refresh()
+                return added
+            if self.inventory is not None:
+                for section in ("ec2", "volume", "storage", "states", "known"):
+                    for target in removed:
+                        self.inventory[section].pop(target, None)
+            with self.snapshot_lock:
+                data = self.snapshot
+            if data is None:
+                return []
+            partial = self.get_instance_metrics(added) if added else self.empty_result([])
+            if self.inventory is not None:
+                for section, values in self.build_inventory(partial, added).items():
+                    self.inventory[section].update(values)
+            self.store_snapshot(self.replace_targets(data, partial, added))
+            return added
+
+    def replace_targets(self, data: dict, partial: dict, targets: list) -> dict:
+        """
+        Returns data with the rows and totals of targets taken from partial, dropping the
+        accounts and regions that are no longer configured.
+
+        Args:
+            self: The current instance.
+            data (dict): The current snapshot, as returned by get_instance_metrics().
+            partial (dict): Metrics of the given targets only.
+            targets (list): The (account, region) pairs replaced.
+
+        Returns:
+        dict: The merged metrics.
+
+        """
+        kept = set(self.targets()) - set(targets)
+        result = self.empty_result()
+        for key in ("stopped_instances", "volumes", "attached_storage"):
+            result[key].extend(
+                row for row in data[key] if (row.get("account", ""), row["region"]) in kept
+            )
+            result[key].extend(partial[key])
+        for key in ("volume_states", "stopped_instances_count"):
+            for target in result[key]:
+                source = partial if target in targets else data
+                if target in source[key]:
+                    result[key][target] = source[key][target]
+        return self.finish_resources(result)
+
+    def save_snapshot(self, data: dict, taken: float) -> None:
+        """
+        Writes a snapshot to snapshot_path as JSON lines, atomically replacing the previous one.
+
+        The first line holds the format version and the snapshot time, every following line
+        one total or one resource row.
+
+        Args:
+            self: The current instance.
+            data (dict): Metrics as returned by get_instance_metrics().
+            taken (float): Time the snapshot was taken.
+
+        Returns:
+        None
+
+        """
+        temporary = f"{self.snapshot_path}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as file:
+                file.write(json.dumps({"version": 1, "time": taken}) + "\n")
+                for (account, region), count in data["stopped_instances_count"].items():
+                    file.write(json.dumps({"count": [account, region, count]}) + "\n")
+                for (account, region), states in data["volume_states"].items():
+                    file.write(json.dumps({"states": [account, region, states]}) + "\n")
+                for row in data["stopped_instances"]:
+                    file.write(json.dumps({"ec2": row}) + "\n")
+                for row in data["volumes"]:
+                    file.write(json.dumps({"volume": row}) + "\n")
+                for row in data["attached_storage"]:
+                    file.write(json.dumps({"storage": row}) + "\n")
+                for name, rows in data["resources"].items():
+                    for row in rows:
+                        file.write(json.dumps({"resource": [name, row]}) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.snapshot_path)
+        except OSError as error:
+            logging.error(f"error persisting metrics snapshot: Error={error}")
+
+    def load_snapshot(self) -> bool:
+        """
+        Restores the snapshot persisted at snapshot_path, if any.
+
+        The restored snapshot is reported stale until the first refresh replaces it. Data of
+        accounts and regions that are no longer configured is dropped.
+
+        Returns:
+        bool: True if a snapshot was restored.
+
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        data = self.empty_result()
+        targets = set(self.targets())
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as file:
+                header = json.loads(file.readline())
+                if header.get("version") != 1:
+                    logging.warning("ignoring snapshot %s with unknown version", self.snapshot_path)
+                    return False
+                for line in file:
+                    item = json.loads(line)
+                    if "count" in item or "states" in item:
+                        key = "stopped_instances_count" if "count" in item else "volume_states"
+                        account, region, value = item.get("count") or item["states"]
+                        if (account, region) in targets:
+                            data[key][(account, region)] = value
+                        continue
+                    if "resource" in item:
+                        name, row = item["resource"]
+                        target = (row.get("account", ""), row["region"])
+                        if name in data["resources"] and target in targets:
+                            data["resources"][name].append(row)
+                        continue
+                    if "ec2" in item:
+                        key, row = "stopped_instances", item["ec2"]
+                    elif "storage" in item:
+                        key, row = "attached_storage", item["storage"]
+                    else:
+                        key, row = "volumes", item["volume"]
+                    if (row.get("account", ""), row["region"]) in targets:
+                        data[key].append(row)
+        except (OSError, ValueError, KeyError) as error:
+            logging.error(f"error restoring metrics snapshot: Error={error}")
+            return False
+        rendered = self.render(data) if self.refresh_interval > 0 else None
+        with self.snapshot_lock:
+            self.snapshot = data
+            self.snapshot_time = header["time"]
+            self.rendered = rendered
+            self.restored = True
+        logging.info("restored metrics snapshot from %s", self.snapshot_path)
+        return True
+
+    def refresh_loop(self) -> None:
+        """
+        Refreshes the snapshot every refresh_interval seconds until stop_refresher() is called.
+
+        Returns:
+        None
+
+        """
+        if self.schedule == "staggered":
+            self.staggered_loop()
+            return
+        while not self.stop_event.is_set():
+            started = time.time()
+            try:
+                self.refresh()
+            except Exception as error:
+                logging.error(f"error refreshing metrics snapshot: Error={error}")
+            elapsed = time.time() - started
+            self.stop_event.wait(max(0.0, self.refresh_interval - elapsed))
+
+    def staggered_loop(self) -> None:
+        """
+        Refreshes every (account, region, source) on its own interval until stop_refresher()
+        is called.
+
+        A full collection builds the first snapshot. Afterwards the refreshes are taken from the
+        scheduler's priority queue as they fall due, spread across their intervals, and only the
+        metrics of the refreshed accounts and regions are rendered again, see refresh_items().
+
+        Returns:
+        None
+
+        """
+        try:
+            self.refresh()
+        except Exception as error:
+            logging.error(f"error refreshing metrics snapshot: Error={error}")
+        self.scheduler.add(self.schedule_items(), time.time())
+        while True:
+            self.scheduler.wait(self.stop_event)
+            if self.stop_event.is_set():
+                return
+            keys = self.scheduler.pop_due(time.time())
+            if not keys:
+                # only entries of removed keys were due
+                continue
+            try:
+                self.refresh_items(keys)
+            except Exception as error:
+                logging.error(f"error refreshing metrics snapshot: Error={error}")
+
+    def schedule_items(self) -> dict:
+        """
+        Returns the staggered refresh interval of every (account, region, source).
+
+        The interval of "ec2" and "volume" is the region's interval if one is configured,
+        else the type's interval, else refresh_interval. Additional sources keep their own.
+
+        Returns:
+        dict: Interval in seconds by (account, region, source name).
+
+        """
+        items = {}
+        for name in ("ec2", "volume"):
+            for account, region in self.targets():
+                items[(account, region, name)] = (
+                    self.region_intervals.get(region)
+                    or self.type_intervals.get(name)
+                    or self.refresh_interval
+                )
+        for name, resource in self.resources.items():
+            for account, region in self.targets():
+                items[(account, region, name)] = resource.interval
+        return items
+
+    def refresh_items(self, keys: list, full: bool = False) -> Optional[dict]:
+        """
+        Refreshes the given (account, region, source) items and updates the served metrics.
+
+        Only the metric fragments of the refreshed accounts and regions are rendered again.
+        The snapshot served by collect() and persisted to snapshot_path is recomposed from
+        every region at most once per refresh_interval, a full render of every resource on
+        each of the many small batches would multiply the CPU the staggering saves.
+
+        Every item is rescheduled once the batch is done, even if it failed.
+
+        Args:
+            self: The current instance.
+            keys (list): The items to refresh.
+            full (bool): Recompose the snapshot regardless of its age (default: False).
+
+        Returns:
+        dict: The recomposed metrics, see compose_result(), or None if only the rendered
+        metrics were updated.
+
+        """
+        try:
+            with self.collection_lock:
+                started = time.monotonic()
+                funcs = self.get_funcs(due=self.resources)
+                calls = [
+                    (name, self.submit(funcs[name], region=region, account=account))
+                    for account, region, name in keys
+                ]
+                for name, call in calls:
+                    if name in self.resources:
+                        self.merge_resource(name, call.result())
+                    else:
+                        self.accept_response(name, call.result())
+                self.collection_duration.observe(time.monotonic() - started)
+                logging.debug("refreshed %s scheduled items", len(keys))
+                if not full and time.time() - self.snapshot_time < self.refresh_interval:
+                    if self.fragmented():
+                        changed: Dict[tuple, set] = {}
+                        for account, region, name in keys:
+                            changed.setdefault((account, region), set()).add(name)
+                        rendered = self.render_targets(changed)
+                    else:
+                        rendered = self.render(self.compose_result())
+                    with self.snapshot_lock:
+                        self.rendered = rendered
+                    return None
+                data = self.compose_result()
+                self.store_snapshot(data, list(dict.fromkeys(key[:2] for key in keys)))
+                return data
+        finally:
+            now = time.time()
+            for key in keys:
+                self.scheduler.reschedule(key, now)
+
+    def compose_result(self, targets: Optional[list] = None) -> dict:
+        """
+        Builds a metrics result from the last reported response of every account, region and
+        source, as kept by last_known_good().
+
+        Args:
+            targets (list): Only include these (account, region) pairs (default: every configured pair).
+
+        Returns:
+        dict: The same metrics as get_instance_metrics().
+
+        """
+        targets = self.targets() if targets is None else targets
+        result = self.empty_result(targets)
+        for target in targets:
+            for name in ("ec2", "volume"):
+                cached = self.region_cache.get(target + (name,))
+                if cached is not None:
+                    self.add_response(result, name, cached[0])
+        return self.finish_resources(result, targets)
+
+    def fragmented(self) -> bool:
+        """
+        Checks whether the metrics are rendered per account and region, see render_targets().
+
+        Aggregated counts and the max_series limit span every region, so they are always
+        rendered from the whole result.
+        """
+        return self.schedule == "staggered" and not self.aggregate and not self.max_series
+
+    def render_targets(self, targets: dict) -> dict:
+        """
+        Renders the metrics of the given (account, region) pairs into their cached fragments
+        and assembles the exposition of every pair from the fragments.
+
+        Every fragment holds the sample lines of one metric family for one pair, plain and as a
+        gzip member, so assembling only joins bytes: each family's header followed by its
+        samples from every pair. Only the families of the given sources are rendered again.
+
+        Args:
+            self: The current instance.
+            targets (dict): The sources to render again by (account, region) pair, None for
+                every source of the pair.
+
+        Returns:
+        dict: (body, gzipped body) keyed by format, see render().
+
+        """
+        owners = {
+            **self.family_sources,
+            **{resource.metric: name for name, resource in self.resources.items()},
+        }
+
+        def owner(name: str) -> str:
+            return owners.get(name[: -len("_total")] if name.endswith("_total") else name, "")
+
+        for target, sources in targets.items():
+            families = [
+                family
+                for family in self.compose_metrics(self.compose_result([target]))
+                if sources is None or owner(family.name) in sources
+            ]
+            for fmt in self.exposition_formats:
+                fragments = self.fragments.setdefault(target, {}).setdefault(fmt, {})
+                for name in list(fragments):
+                    if sources is None or owner(name) in sources:
+                        del fragments[name]
+                for family in families:
+                    fragments[family.name] = self.render_fragment(fmt, family)
+        configured = set(self.targets())
+        for target in [target for target in self.fragments if target not in configured]:
+            del self.fragments[target]
+
+        rendered = {}
+        for fmt in self.exposition_formats:
+            headers: Dict[str, tuple] = {}
+            samples: Dict[str, list] = collections.defaultdict(list)
+            for target in self.targets():
+                for name, (header, body) in self.fragments.get(target, {}).get(fmt, {}).items():
+                    headers.setdefault(name, header)
+                    if body[0]:
+                        samples[name].append(body)
+            parts = [part for name, header in headers.items() for part in [header, *samples[name]]]
+            rendered[fmt] = (
+                b"".join(body for body, _ in parts),
+                b"".join(compressed for _, compressed in parts),
+            )
+        return rendered
+
+    def render_fragment(self, fmt: str, family: Any) -> tuple:
+        """
+        Renders a metric family, splitting its HELP and TYPE header from its sample lines.
+
+        Returns:
+        tuple: ((header, gzipped header), (samples, gzipped samples)).
+
+        """
+        body = self.exposition_formats[fmt](types.SimpleNamespace(collect=lambda: [family]))
+        if fmt == "openmetrics":
+            body = body[: -len(b"# EOF\n")]
+        end = 0
+        while body.startswith(b"#", end):
+            end = body.index(b"\n", end) + 1
+        header, body = body[:end], body[end:]
+        return (
+            (header, gzip.compress(header, compresslevel=6)),
+            (body, gzip.compress(body, compresslevel=6) if body else b""),
+        )
+
+    def start_refresher(self) -> None:
+        """
+        Starts the background refresher thread when a refresh_interval is configured.
+
+        A persisted snapshot is restored first and served until the first refresh completes.
+
+        Returns:
+        None
+
+        """
+        if self.refresh_interval <= 0 or self.refresher is not None:
+            return
+        if self.snapshot is None:
+            self.load_snapshot()
+        self.stop_event.clear()
+        self.refresher = threading.Thread(
+            target=self.refresh_loop, name="sau-refresher", daemon=True
+        )
+        self.refresher.start()
+        logging.info(
+            "background refresher started with interval %ss", self.refresh_interval
+        )
+
+    def stop_refresher(self) -> None:
+        """
+        Stops the background refresher thread and waits for it to exit.
+
+        Returns:
+        None
+
+        """
+        self.stop_event.set()
+        self.scheduler.wake()
+        if self.refresher is not None:
+            self.refresher.join()
+            self.refresher = None
+
+    def get_snapshot(self) -> tuple:
+        """
+        Returns the current snapshot and its age in seconds.
+
+        Returns:
+        tuple: (data, age). data is an empty result and age is -1 if no snapshot has been taken yet.
+
+        """
+        with self.snapshot_lock:
+            data, taken = self.snapshot, self.snapshot_time
+        if data is None:
+            return self.empty_result(), -1.0
+        return data, time.time() - taken
+
+    def is_stale(self, age: float) -> bool:
+        """
+        Checks whether a snapshot of the given age has missed at least one refresh.
+
+        Args:
+            age (float): Age of the snapshot in seconds, -1 if there is none.
+
+        Returns:
+        bool: True if there is no snapshot, it is older than two refresh intervals or it was
+        restored from disk and not refreshed yet.
+
+        """
+        return self.restored or age < 0 or age > 2 * self.refresh_interval
+
+    def current_data(self) -> dict:
+        """
+        Returns the last background snapshot when a refresh_interval is configured,
+        otherwise metrics freshly collected from AWS.
+        """
+        if self.refresh_interval > 0:
+            return self.get_snapshot()[0]
+        return self.refresh_once()
+
+    def refresh_once(self) -> dict:
+        """
+        Refreshes the metrics, sharing the result of a refresh already in flight.
+
+        Concurrent scrapes are coalesced onto a single collection, so the number of
+        scrapers does not multiply AWS calls.
+
+        Returns:
+        dict: The collected metrics, as returned by get_instance_metrics().
+
+        """
+        with self.flight_lock:
+            flight, leader = self.flight, self.flight is None
+            if leader:
+                flight = self.flight = Future()
+        if not leader:
+            return flight.result()
+        try:
+            data = self.refresh()
+            flight.set_result(data)
+            return data
+        except Exception as error:
+            flight.set_exception(error)
+            raise
+        finally:
+            with self.flight_lock:
+                self.flight = None
+
+    def render(self, data: dict, formats: Optional[tuple] = None) -> dict:
+        """
+        Renders the metrics composed from data in the given exposition formats.
+
+        OpenMetrics bodies are rendered without their "# EOF" line so more metrics can follow.
+
+        Args:
+            self: The current instance.
+            data (dict): Metrics as returned by get_instance_metrics().
+            formats (tuple): Keys of exposition_formats to render (default: all of them).
+
+        Returns:
+        dict: (body, gzipped body) keyed by format.
+
+        """
+        families = list(self.compose_metrics(data))
+        source = types.SimpleNamespace(collect=lambda: families)
+        rendered = {}
+        for fmt in formats or tuple(self.exposition_formats):
+            body = self.exposition_formats[fmt](source)
+            if fmt == "openmetrics":
+                body = body[: -len(b"# EOF\n")]
+            rendered[fmt] = (body, gzip.compress(body, compresslevel=6))
+        return rendered
+
+    def exposition(self, fmt: str) -> tuple:
+        """
+        Returns the rendered resource metrics, from the snapshot cache when there is one.
+
+        Args:
+            self: The current instance.
+            fmt (str): The exposition format, "text" or "openmetrics".
+
+        Returns:
+        tuple: (body, gzipped body).
+
+        """
+        if self.refresh_interval > 0:
+            with self.snapshot_lock:
+                rendered = self.rendered
+            if rendered is not None:
+                return rendered[fmt]
+        return self.render(self.current_data(), formats=(fmt,))[fmt]
+
+    def collect(self):
+        """
+        Collects various metrics related to EC2 instances and EBS volumes and yields them for monitoring.
+
+        When a refresh_interval is configured the last background snapshot is served,
+        otherwise metrics are collected from AWS on every call.
+
+        Args:
+            self: The current instance.
+
+        Yields:
+        Generator: Yields metric data for monitoring.
+
+        Raises:
+        Exception: If an error occurs during the collection process.
+
+        """
+        yield from self.compose_metrics(self.current_data())
+        yield from self.collect_live()
+
+    def collect_live(self):
+        """
+        Yields the metrics about the exporter itself, which change between snapshots.
+
+        Yields:
+        Generator: Yields metric data for monitoring.
+
+        """
+        if self.refresh_interval > 0:
+            _, age = self.get_snapshot()
+
+            gauge = GaugeMetricFamily(
+                name="sau_snapshot_age_seconds",
+                documentation="Age of the metrics snapshot served by the exporter, -1 if none yet",
+            )
+            gauge.add_metric(labels=[], value=age)
+            yield gauge
+
+            gauge = GaugeMetricFamily(
+                name="sau_snapshot_stale",
+                documentation="1 if the metrics snapshot is missing, restored from disk or older than two refresh intervals",
+            )
+            gauge.add_metric(labels=[], value=int(self.is_stale(age)))
+            yield gauge
+
+        counter = CounterMetricFamily(
+            name="sau_items_filtered",
+            documentation="Resources fetched from AWS (stage=fetched) and dropped by each client side filter stage",
+            labels=["resource", "stage"],
+        )
+        for name, counts in self.filtered.items():
+            for stage, count in counts.items():
+                counter.add_metric(labels=[name, stage], value=count)
+        yield counter
+
+        throttles = CounterMetricFamily(
+            name="sau_aws_throttles",
+            documentation="AWS API requests throttled after botocore retries, per account, region and API",
+            labels=["account", "region", "api"],
+        )
+        retry_seconds = CounterMetricFamily(
+            name="sau_aws_retry_seconds",
+            documentation="Seconds spent waiting on the rate limiter and throttling backoff",
+            labels=["account", "region", "api"],
+        )
+        latency = HistogramMetricFamily(
+            name="sau_aws_request_duration_seconds",
+            documentation="Latency of describe_* page requests, per account, region and API",
+            labels=["account", "region", "api"],
+        )
+        counters = {
+            field: CounterMetricFamily(
+                name=f"sau_aws_{field}",
+                documentation=documentation,
+                labels=["account", "region", "api"],
+            )
+            for field, documentation in (
+                ("pages", "describe_* pages fetched"),
+                ("items", "Items returned by describe_* pages"),
+                ("bytes", "Response bytes decoded from describe_* pages"),
+            )
+        }
+        for key, totals in list(self.api_stats.items()):
+            throttles.add_metric(labels=list(key), value=totals["throttles"])
+            retry_seconds.add_metric(labels=list(key), value=totals["retry_seconds"])
+            totals["latency"].add_to(latency, list(key))
+            for field, counter in counters.items():
+                counter.add_metric(labels=list(key), value=totals[field])
+        yield throttles
+        yield retry_seconds
+        yield latency
+        yield from counters.values()
+
+        counter = CounterMetricFamily(
+            name="sau_collection_errors",
+            documentation="Failed AWS calls per account, region, API and error type",
+            labels=["account", "region", "api", "type"],
+        )
+        for key, count in list(self.error_types.items()):
+            counter.add_metric(labels=list(key), value=count)
+        yield counter
+
+        histogram = HistogramMetricFamily(
+            name="sau_collection_duration_seconds",
+            documentation="Duration of full and incremental collections across every region",
+        )
+        self.collection_duration.add_to(histogram, [])
+        yield histogram
+
+        gauge = GaugeMetricFamily(
+            name="sau_shard_info",
+            documentation="Shard of this replica, always 1",
+            labels=["shard_index", "shard_count"],
+        )
+        gauge.add_metric(labels=[str(self.shard_index), str(self.ring.shard_count)], value=1)
+        yield gauge
+
+        gauge = GaugeMetricFamily(
+            name="sau_shard_targets",
+            documentation="Number of (account, region) pairs collected by this replica",
+        )
+        gauge.add_metric(labels=[], value=len(self.targets()))
+        yield gauge
+
+        gauge = GaugeMetricFamily(
+            name="sau_worker_queue_depth",
+            documentation="AWS calls submitted to the worker pool and not finished yet",
+        )
+        gauge.add_metric(labels=[], value=self.queued)
+        yield gauge
+
+        gauge = GaugeMetricFamily(
+            name="sau_region_data_age_seconds",
+            documentation="Age of the data reported for a region, stale when its last refresh failed",
+            labels=["account", "region", "resource", "stale"],
+        )
+        now = time.time()
+        for (account, region, name), (taken, stale) in list(self.region_freshness.items()):
+            gauge.add_metric(
+                labels=[account, region, name, "true" if stale else "false"], value=now - taken
+            )
+        yield gauge
+
+        counter = CounterMetricFamily(
+            name="sau_series_dropped",
+            documentation="Per-resource series dropped because of labels.max_series",
+            labels=["metric"],
+        )
+        for name, count in self.series_dropped.items():
+            counter.add_metric(labels=[name], value=count)
+        yield counter
+
+    def compose_metrics(self, data: dict):
+        """
+        Composes prometheus metric families from a metrics result.
+
+        Args:
+            self: The current instance.
+            data (dict): Metrics as returned by get_instance_metrics().
+
+        Yields:
+        Generator: Yields metric data for monitoring.
+
+        """
+        # compose metrics for stopped ec2 instances total
+        stopped_count = data["stopped_instances_count"]
+        gauge = GaugeMetricFamily(
+            name=f"sau_ec2_stopped_instances_total",
+            documentation=f"EC2 stopped instances total",
+            labels=["region", "account"],
+        )
+        for (account, region), value in stopped_count.items():
+            gauge.add_metric(labels=[region, account], value=value)
+        yield gauge
+
+        # compose metrics for stopped ec2 instances
+        stopped = data["stopped_instances"]
+        if stopped:
+            yield self.resource_metric(
+                name="sau_ec2_stopped_instances",
+                documentation="EC2 stopped instances",
+                rows=stopped,
+            )
+
+        # compose metrics for ebs volumes total
+        states = data["volume_states"]
+        gauge = GaugeMetricFamily(
+            name=f"sau_ebs_volumes_total",
+            documentation=f"EC2 EBS volumes total unattached or error",
+            labels=["status", "region", "account"],
+        )
+        for (account, region), state_dict in states.items():
+            for status, value in state_dict.items():
+                gauge.add_metric(labels=[status, region, account], value=value)
+        yield gauge
+
+        # compose metrics for ebs volumes
+        volumes = data["volumes"]
+        if volumes:
+            yield self.resource_metric(
+                name="sau_ebs_volumes",
+                documentation="EC2 EBS volumes unattached or error",
+                rows=volumes,
+            )
+
+        # compose metrics for the additional sources
+        for name, rows in data["resources"].items():
+            resource = self.resources[name]
+            gauge = GaugeMetricFamily(
+                name=f"{resource.metric}_total",
+                documentation=f"{resource.documentation} total",
+                labels=["region", "account"],
+            )
+            _, owners = rows.schema(["region", "account"])
+            totals = collections.Counter(owners)
+            for account, region in stopped_count:
+                gauge.add_metric(labels=[region, account], value=totals[(region, account)])
+            yield gauge
+            if rows:
+                yield self.resource_metric(
+                    name=resource.metric, documentation=resource.documentation, rows=rows
+                )
+
+        if self.pricing is None:
+            return
+
+        # compose estimated cost metrics
+        if volumes:
+            yield self.resource_metric(
+                name="sau_ebs_volume_monthly_cost_dollars",
+                documentation="Estimated monthly cost in USD of EBS volumes unattached or error",
+                rows=volumes,
+                values=self.pricing.monthly_costs(volumes),
+            )
+        if stopped:
+            storage = data["attached_storage"]
+            costs: Dict[tuple, float] = collections.defaultdict(float)
+            _, owners = storage.schema(["account", "region", "instanceid"])
+            for owner, cost in zip(owners, self.pricing.monthly_costs(storage)):
+                costs[owner] += cost
+            _, instances = stopped.schema(["account", "region", "instanceid"])
+            yield self.resource_metric(
+                name="sau_ec2_stopped_instance_attached_storage_cost_dollars",
+                documentation="Estimated monthly cost in USD of the EBS volumes attached to stopped EC2 instances",
+                rows=stopped,
+                values=[costs.get(instance, 0.0) for instance in instances],
+            )
+
+    def resource_metric(
+        self, name: str, documentation: str, rows: list, values: Optional[list] = None
+    ) -> GaugeMetricFamily:
         """
-        Configures and sets up the logger with the specified settings.
+        Composes a per-resource metric, bounded by max_series or aggregated by aggregate_by.
 
         Args:
-        - self: The current instance.
+            self: The current instance.
+            name (str): The metric name.
+            documentation (str): The metric help text.
+            rows (ResourceTable): The label rows, one per resource.
+            values (list): The value of every row (default: 1 for every row).
 
         Returns:
-        None
+        GaugeMetricFamily: One series per resource, or in aggregate mode one series per
+        distinct aggregate_by label set with the sum of its row values.
 
         """
-        if self.handler not in {"both", "stdout", "file"}:
-            raise ValueError("logging.handler must be either 'file', 'both' or 'stdout'.")
+        if not isinstance(rows, ResourceTable):
+            rows = ResourceTable(rows)
+        if values is None:
+            values = itertools.repeat(1)
+        if self.aggregate:
+            labels = [label for label in self.aggregate_by if label in rows.positions]
+            counts: Dict[tuple, float] = collections.Counter()
+            for key, value in zip(rows.schema(labels)[1], values):
+                counts[key] += value
+            gauge = GaugeMetricFamily(name=name, documentation=documentation, labels=labels)
+            for key, count in counts.items():
+                gauge.add_metric(labels=key, value=count)
+            return gauge
 
-        handlers = []
+        limit = self.max_series or len(rows)
+        columns, label_values = self.label_schema(rows[:limit])
+        gauge = GaugeMetricFamily(name=name, documentation=documentation, labels=columns)
+        for labels, value in zip(label_values, values):
+            gauge.add_metric(labels=labels, value=value)
+        dropped = len(rows) - len(gauge.samples)
+        if dropped > 0:
+            self.series_dropped[name] += dropped
+            logging.warning("%s: dropped %s series over labels.max_series", name, dropped)
+        return gauge
 
-        if self.handler in {"both", "stdout"}:
-            formatter = logging.Formatter(self.format)
-            stdout_handler = logging.StreamHandler(sys.stdout)
-            stdout_handler.setLevel(self.log_level)
-            stdout_handler.setFormatter(formatter)
-            handlers.append(stdout_handler)
-
-        if self.handler in {"both", "file"}:
-            self.create_file_handler()
-            handlers.append(Log.file_handler)
 
-        logging.basicConfig(
-            format=self.format,
-            level=self.log_level,
-            handlers=handlers,
-        )
+class MetricsServer:
+    """
+    asyncio HTTP server exposing the collector and every collector of a registry.
 
+    /metrics (and /) serve the metrics, /healthz answers as long as the process serves
+    requests and /ready once the collector has data. Requests are served concurrently;
+    scrapes that need a collection share the one in flight, see EC2SAUCollector.refresh_once().
 
-class EC2SAUCollector(Log):
-    """
-    Collector class used to scrape EC2 and EBS volume data.
+    The per-resource metrics are served from the bytes the collector renders once per
+    snapshot, plain or gzip compressed, and only the small metrics about the exporter itself
+    are rendered per request. The format is negotiated from the Accept header: OpenMetrics
+    when the scraper asks for it, the Prometheus text format otherwise.
 
     Attributes:
-    - regions (list): List of AWS regions to collect metrics from.
-    - level (str): The logging level (default: "info").
-    - path (str): The directory where the log file will be stored (default: current directory).
-    - retention (int): Number of backup log files to keep (default: 7).
-
-    Methods:
-    - get_stopped_ec2(region: str) -> list: Retrieves stopped EC2 instances for a given region.
-    - get_unattached_volumes(region: str) -> dict: Retrieves unattached EBS volumes in the specified AWS region.
-    - get_instance_metrics() -> dict: Retrieves metrics related to instances and volumes in different regions.
+    - collector (EC2SAUCollector): The collector whose resource metrics are cached.
+    - registry (CollectorRegistry): Other collectors rendered on every request (default: REGISTRY).
+    - drain_timeout (float): Seconds in-flight requests are given to finish on shutdown (default: 30).
 
     """
 
+    metrics_paths = frozenset({"/", "/metrics"})
+    content_types = {"text": CONTENT_TYPE_LATEST, "openmetrics": openmetrics.CONTENT_TYPE_LATEST}
+
     def __init__(
-        self,
-        exclude_tags: dict,
-        regions: list,
-        client_getter: Callable[[str, str], Any],
-        level: str = "info",
-        path: str = ".",
-        retention: int = 7,
-        handler: str = "both",
+        self, collector: "EC2SAUCollector", registry: Any = REGISTRY, drain_timeout: float = 30.0
     ) -> None:
+        self.collector = collector
+        self.registry = registry
+        self.drain_timeout = drain_timeout
+        self.port = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stopping: Optional[asyncio.Event] = None
+        self.started = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.requests: set = set()
+
+    @staticmethod
+    def negotiate(accept: str) -> str:
+        for media_range in accept.split(","):
+            if media_range.split(";")[0].strip() == "application/openmetrics-text":
+                return "openmetrics"
+        return "text"
+
+    def render(self, accept: str = "", accept_encoding: str = "") -> tuple:
         """
-        Initializes a new EC2SAUCollector instance.
+        Renders a scrape response.
 
         Args:
-        - self: The current instance.
-        - regions (list): List of AWS regions to collect metrics from.
-        - level (str): The logging level (default: "info").
-        - path (str): The directory where the log file will be stored (default: current directory).
-        - retention (int): Number of backup log files to keep (default: 7).
+            self: The current instance.
+            accept (str): The Accept request header.
+            accept_encoding (str): The Accept-Encoding request header.
 
         Returns:
-        None
+        tuple: (body, headers). gzip bodies are the cached gzip member of the resource
+        metrics followed by one for the live metrics, which gzip decoders concatenate.
 
         """
-        Log.__init__(self, level=level, path=path, retention=retention, handler=handler)
-        self.regions = regions
-        self.errors = 0
-        self.exclude_tags = exclude_tags
-        self.get_client = client_getter
-
-    def is_excluded(self, tags: Dict[str, str]) -> bool:
-        skip = False
-        for key, value in self.exclude_tags.items():
-            if tags.get(key, "").lower() in {f"{item}".lower(): True for item in value}:
-                skip = True
-                break
-        return skip
+        fmt = self.negotiate(accept)
+        body, compressed = self.collector.exposition(fmt)
+        families = list(self.registry.collect()) + list(self.collector.collect_live())
+        live = self.collector.exposition_formats[fmt](types.SimpleNamespace(collect=lambda: families))
+        headers = {"Content-Type": self.content_types[fmt]}
+        if "gzip" in accept_encoding:
+            headers["Content-Encoding"] = "gzip"
+            return compressed + gzip.compress(live, compresslevel=6), headers
+        return body + live, headers
 
-    def is_not_excluded(self, tags: Dict[str, str]) -> bool:
-        return not self.is_excluded(tags=tags)
+    def is_ready(self) -> bool:
+        """
+        Returns True once the collector can serve data: always when collecting on every
+        scrape, after the first snapshot otherwise.
+        """
+        return self.collector.refresh_interval <= 0 or self.collector.snapshot is not None
 
-    def get_stopped_ec2(self, region: str) -> dict:
+    async def respond(self, path: str, headers: Dict[str, str]) -> tuple:
         """
-        Retrieves all stopped EC2 instances for a given AWS region.
+        Answers a GET request.
 
         Args:
             self: The current instance.
-            region (str): The AWS region to query.
+            path (str): The request target.
+            headers (dict): The request headers, keyed by lowercase name.
 
         Returns:
-            dict: A dictionary containing two keys:
-                - 'response' (list): A list of dictionaries representing stopped EC2 instances.
-                  Each dictionary includes the following keys:
-                    - 'name' (str): The name of the instance.
-                    - 'region' (str): The AWS region where the instance is located.
-                    - 'instanceid' (str): The ID of the EC2 instance.
-                - 'errorcount' (int): The count of errors that occurred during the retrieval process.
-                - 'region' (str): The AWS region.
+        tuple: (status, headers, body).
 
-        Raises:
-            None
+        """
+        path = path.split("?", 1)[0]
+        plain = {"Content-Type": "text/plain; charset=utf-8"}
+        if path == "/healthz":
+            return 200, plain, b"ok\n"
+        if path == "/ready":
+            if self.is_ready():
+                return 200, plain, b"ready\n"
+            return 503, plain, b"no snapshot yet\n"
+        if path in self.metrics_paths:
+            # rendering may collect from AWS, keep it off the event loop
+            body, metric_headers = await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    self.render,
+                    accept=headers.get("accept", ""),
+                    accept_encoding=headers.get("accept-encoding", ""),
+                ),
+            )
+            return 200, metric_headers, body
+        return 404, plain, b"not found\n"
 
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
         """
-        self.setlogger()
-        logging.debug("get_stopped_ec2 for region %s", region)
-        client = self.get_client("ec2", region_name=region)
-        result = []
-        filter = [{"Name": "instance-state-name", "Values": ["stopped"]}]
+        Serves one HTTP/1.1 request per connection.
+        """
+        task = asyncio.current_task()
+        self.requests.add(task)
+        method = "GET"
         try:
-            response = client.describe_instances(Filters=filter)
-            for reserve in response["Reservations"]:
-                for instance in reserve["Instances"]:
-                    tags: Dict[str, str] = {
-                        tag["Key"]: tag["Value"] for tag in instance.get("Tags", [])
-                    }
-                    if self.is_not_excluded(tags=tags):
-                        item = {
-                            "name": tags.get("Name", ""),
-                            "region": instance["Placement"]["AvailabilityZone"],
-                            "instanceid": instance["InstanceId"],
-                            "region": region,
-                        }
-                        tags = {f"tag_{k}".lower(): v.lower() for k, v in tags.items()}
-                        result.append({**item, **tags})
-            client.close()
-            return {"response": result, "errorcount": 0, "region": region}
-
+            request = await reader.readuntil(b"\r\n\r\n")
+            lines = request.decode("latin-1").split("\r\n")
+            method, path, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                name, sep, value = line.partition(":")
+                if sep:
+                    headers[name.strip().lower()] = value.strip()
+            if method in ("GET", "HEAD"):
+                status, response_headers, body = await self.respond(path, headers)
+            else:
+                status, response_headers, body = 405, {"Allow": "GET, HEAD"}, b""
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status, response_headers, body = 400, {}, b""
         except Exception as error:
-            kind, _, traceback = sys.exc_info()
-            logging.error(
-                f"error retrieving stopped ec2 instances from AWS: Error={error}, ErrorType={kind.__name__}, TracebackInfo={traceback.tb_frame.f_code}, ErrorLineNumber={traceback.tb_lineno}"
-            )
-            return {"response": result, "errorcount": 1, "region": region}
+            logging.error(f"error serving request: Error={error}")
+            status, response_headers, body = 500, {}, b""
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        head += [f"{name}: {value}" for name, value in response_headers.items()]
+        head += [f"Content-Length: {len(body)}", "Connection: close"]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        if method != "HEAD":
+            writer.write(body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self.requests.discard(task)
 
-    def get_unattached_volumes(self, region: str) -> dict:
+    async def serve(self, port: int, addr: str = "0.0.0.0", handle_signals: bool = True) -> None:
         """
-        Retrieves unattached volumes in the specified AWS region.
+        Serves requests until SIGTERM or SIGINT is received or stop() is called.
+
+        In-flight requests are given drain_timeout seconds to finish before returning.
 
         Args:
             self: The current instance.
-            region (str): The AWS region where the volumes are located.
+            port (int): Port to listen on, 0 picks a free one.
+            addr (str): Address to listen on (default: "0.0.0.0").
+            handle_signals (bool): Stop on SIGTERM and SIGINT, only possible in the main thread (default: True).
 
         Returns:
-            dict: A dictionary containing two keys:
-                - 'errorcount' (int): The count of errors that occurred during the retrieval process.
-                - 'region' (str): The AWS region.
-                - 'response' (dict): A dictionary containing the actual response.
-                    - 'states' (dict): A dictionary containing the count of volumes in different states.
-                    Possible states are 'unattached' and 'error'.
-                    - 'result' (list): A list of dictionaries, where each dictionary represents an unattached
-                    volume with the following keys:
-                        - 'name' (str): The name of the volume.
-                        - 'availabilityzone' (str): The availability zone of the volume.
-                        - 'size' (str): The size of the volume in the format '{size}GB'.
-                        - 'volumeid' (str): The ID of the volume.
-                        - 'volumetype' (str): The type of the volume.
-                        - 'state' (str): The state of the volume, which can be 'unattached' or an 'error' state.
-                        - 'region' (str): The AWS region where the volume is located.
+        None
 
-        Raises:
-            None
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        if handle_signals:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                self.loop.add_signal_handler(signum, self.stopping.set)
+        server = await asyncio.start_server(self.handle, addr, port)
+        self.port = server.sockets[0].getsockname()[1]
+        self.started.set()
+        logging.info("serving metrics on %s:%s", addr, self.port)
+        async with server:
+            await self.stopping.wait()
+            logging.info("Shutting down SAU exporter")
+            server.close()
+            if self.requests:
+                await asyncio.wait(set(self.requests), timeout=self.drain_timeout)
 
+    def start(self, port: int, addr: str = "0.0.0.0") -> None:
         """
+        Serves requests from a daemon thread, returning once the server listens.
 
-        self.setlogger()
-        logging.debug("get_unattached_volumes for region %s", region)
-        client = self.get_client("ec2", region_name=region)
-        result = []
-        states = {"unattached": 0, "error": 0}
-        filter = [{"Name": "status", "Values": ["available", "error"]}]
-        try:
-            response = client.describe_volumes(Filters=filter)
-            for volume in response["Volumes"]:
-                tags: Dict[str, str] = {
-                    tag["Key"]: tag["Value"] for tag in volume.get("Tags", [])
-                }
-                state = (
-                    "unattached" if volume["State"] == "available" else volume["State"]
-                )
-                states[state] += 1
+        Returns:
+        None
 
-                if self.is_not_excluded(tags=tags):
-                    item = {
-                        "name": tags.get("Name", ""),
-                        "availabilityzone": volume["AvailabilityZone"],
-                        "size": f'{volume["Size"]}GB',
-                        "volumeid": volume["VolumeId"],
-                        "volumetype": volume["VolumeType"],
-                        "state": state,
-                        "region": region,
-                    }
-                    tags = {f"tag_{k}".lower(): v.lower() for k, v in tags.items()}
-                    result.append({**item, **tags})
+        """
+        self.started.clear()
+        self.thread = threading.Thread(
+            target=asyncio.run,
+            args=(self.serve(port=port, addr=addr, handle_signals=False),),
+            name="sau-http",
+            daemon=True,
+        )
+        self.thread.start()
+        while not self.started.wait(0.1) and self.thread.is_alive():
+            pass
 
-            client.close()
-            response = {"states": states, "result": result}
-            return {"response": response, "errorcount": 0, "region": region}
-        except Exception as error:
-            kind, _, traceback = sys.exc_info()
-            logging.error(
-                f"error retrieving volume details from AWS: Error={error}, ErrorType={kind.__name__}, TracebackInfo={traceback.tb_frame.f_code}, ErrorLineNumber={traceback.tb_lineno}"
-            )
+    def stop(self) -> None:
+        """
+        Stops a server started with start() and waits for in-flight requests.
 
-            response = {"states": states, "result": []}
-            return {"response": response, "errorcount": 1, "region": region}
+        Returns:
+        None
 
-    def get_instance_metrics(self) -> dict:
         """
-        Retrieves metrics related to instances and volumes in different regions.
+        if self.loop is not None and self.stopping is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
 
-        Args:
-            self: The current instance.
 
-        Returns:
-        dict: A dictionary containing the following metrics:
-            - 'stopped_instances' (list): List of stopped instances.
-            - 'volumes' (list): List of volumes.
-            - 'volume_states' (dict): Dictionary with the following values:
-                - 'unattached' (int): Number of unattached volumes.
-                - 'error' (int): Number of volumes with errors.
+class ConfigReloader:
+    """
+    Reloads the config file on SIGHUP or when the file changes, without restarting the exporter.
 
-        Raises:
-        Exception: If an error occurs during the retrieval process.
+    regions, exclude_tags and include_tags are swapped into the collector, see
+    EC2SAUCollector.reconfigure(), and logging.level and logging.repeat_interval into the
+    running logger. Changes to other settings are logged and need a restart. A config file
+    that fails to load or validate is logged and the running config is kept. The reloader is
+    a prometheus collector counting the reloads by result.
 
-        """
-        result = {
-            "stopped_instances": [],
-            "volumes": [],
-            "volume_states": {
-                region: {"unattached": 0, "error": 0} for region in self.regions
-            },
-            "stopped_instances_count": {region: 0 for region in self.regions},
-        }
-        processes = []
-        funcs = {"ec2": self.get_stopped_ec2, "volume": self.get_unattached_volumes}
-        pool = multiprocessing.Pool()
+    Attributes:
+    - filename (str): The config file.
+    - config (dict): The config currently applied, as returned by Util.get_config().
+    - collector (EC2SAUCollector): The collector to reconfigure.
+    - log (Log): The logger settings to update.
+    - watch_interval (float): Seconds between checks of the file modification time. 0 only reloads on SIGHUP (default: 0).
 
-        for region in self.regions:
-            for name, func in funcs.items():
-                logging.debug("calling func for region %s", region)
-                processes.append(
-                    {
-                        "name": name,
-                        "process": pool.apply_async(func=func, kwds={"region": region}),
-                    }
-                )
+    Methods:
+    - reload() -> bool: Reloads the config file now.
+    - request() -> None: Asks the reloader thread to reload, safe to call from a signal handler.
+    - start() -> None: Starts the reloader thread and installs the SIGHUP handler.
+    - stop() -> None: Stops the reloader thread.
 
-        for p in processes:
-            response = p["process"].get()
-            region = response["region"]
-            if p["name"] == "ec2":
-                result["stopped_instances"] += response["response"]
-                result["stopped_instances_count"][region] = len(
-                    result["stopped_instances"]
-                )
-                self.errors += response["errorcount"]
-            else:
-                response_obj = response["response"]
-                self.errors += response["errorcount"]
-                result["volumes"] += response_obj["result"]
-                result["volume_states"][region] = response_obj["states"]
-        pool.close()
-        return result
+    """
 
-    def collect(self):
+    live_settings = ("regions", "exclude_tags", "include_tags")
+    live_logging = ("level", "repeat_interval")
+
+    def __init__(
+        self,
+        filename: str,
+        config: dict,
+        collector: "EC2SAUCollector",
+        log: Log,
+        watch_interval: float = 0,
+    ) -> None:
+        self.filename = filename
+        self.config = config
+        self.collector = collector
+        self.log = log
+        self.watch_interval = watch_interval
+        self.mtime = self.modified()
+        self.requested = threading.Event()
+        self.stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.reloads: Dict[str, int] = {"success": 0, "failure": 0}
+
+    def modified(self) -> float:
+        try:
+            return os.stat(self.filename).st_mtime
+        except OSError:
+            return 0.0
+
+    def reload(self) -> bool:
         """
-        Collects various metrics related to EC2 instances and EBS volumes and yields them for monitoring.
+        Reads the config file and applies the settings that can change at runtime.
 
-        Args:
-            self: The current instance.
+        Returns:
+        bool: True if the file was loaded and applied.
 
-        Yields:
-        Generator: Yields metric data for monitoring.
+        """
+        with self.lock:
+            self.mtime = self.modified()
+            try:
+                if not os.path.exists(self.filename):
+                    raise FileNotFoundError(f"config File not found: {self.filename}")
+                config = Util.get_config(filename=self.filename)
+                self.collector.reconfigure(
+                    regions=config["regions"],
+                    exclude_tags=config["exclude_tags"],
+                    include_tags=config["include_tags"],
+                )
+                self.log.update_logger(
+                    level=config["logging"]["level"],
+                    repeat_interval=config["logging"]["repeat_interval"],
+                )
+            # read_yaml_file exits on a missing file, which would only end the reloader thread
+            except (Exception, SystemExit) as error:
+                logging.error(
+                    f"error reloading config {self.filename}, keeping the running config: Error={error}"
+                )
+                self.reloads["failure"] += 1
+                return False
+            ignored = [
+                key
+                for key in sorted(set(config) | set(self.config))
+                if key not in self.live_settings
+                and key != "logging"
+                and config.get(key) != self.config.get(key)
+            ]
+            ignored += [
+                f"logging.{key}"
+                for key in config["logging"]
+                if key not in self.live_logging
+                and config["logging"][key] != self.config["logging"].get(key)
+            ]
+            if ignored:
+                logging.warning("changes to %s need a restart to take effect", ", ".join(ignored))
+            self.config = config
+            self.reloads["success"] += 1
+            logging.info("reloaded config %s", self.filename)
+            return True
 
-        Raises:
-        Exception: If an error occurs during the collection process.
+    def request(self) -> None:
+        self.requested.set()
 
+    def run(self) -> None:
+        while not self.stopping.is_set():
+            self.requested.wait(self.watch_interval or None)
+            if self.stopping.is_set():
+                return
+            if self.requested.is_set() or self.modified() != self.mtime:
+                self.requested.clear()
+                self.reload()
+
+    def start(self) -> None:
         """
-        logging.info("Collecting metrics...")
-        data = self.get_instance_metrics()
+        Starts the reloader thread and, on platforms that have it, installs the SIGHUP handler.
 
-        # compose metrics for stopped ec2 instances total
-        stopped_count = data["stopped_instances_count"]
-        gauge = GaugeMetricFamily(
-            name=f"sau_ec2_stopped_instances_total",
-            documentation=f"EC2 stopped instances total",
-            labels=["region"],
-        )
-        for key, value in stopped_count.items():
-            gauge.add_metric(labels=[key], value=value)
-        yield gauge
+        Must be called from the main thread.
 
-        # compose metrics for stopped ec2 instances
-        stopped = data["stopped_instances"]
-        if stopped:
-            gauge = GaugeMetricFamily(
-                name=f"sau_ec2_stopped_instances",
-                documentation=f"EC2 stopped instances",
-                labels=list(stopped[0].keys()),
-            )
-            for instance in stopped:
-                gauge.add_metric(labels=list(instance.values()), value=1)
-            yield gauge
+        Returns:
+        None
 
-        # compose metrics for ebs volumes total
-        states = data["volume_states"]
-        gauge = GaugeMetricFamily(
-            name=f"sau_ebs_volumes_total",
-            documentation=f"EC2 EBS volumes total unattached or error",
-            labels=["status", "region"],
-        )
-        for region, state_dict in states.items():
-            for status, value in state_dict.items():
-                gauge.add_metric(labels=[status, region], value=value)
-        yield gauge
+        """
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.request())
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="sau-reloader", daemon=True)
+        self.thread.start()
 
-        # compose metrics for ebs volumes
-        volumes = data["volumes"]
-        if volumes:
-            gauge = GaugeMetricFamily(
-                name=f"sau_ebs_volumes",
-                documentation=f"EC2 EBS volumes unattached or error",
-                labels=list(volumes[0].keys()),
-            )
-            for volume in volumes:
-                gauge.add_metric(labels=list(volume.values()), value=1)
-            yield gauge
+    def stop(self) -> None:
+        self.stopping.set()
+        self.requested.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
 
-        if self.errors == 0:
-            logging.info("metrics successfully collected")
-        else:
-            logging.info("error(s) were encountered while collecting metrics")
-            self.errors = 0
+    def collect(self):
+        counter = CounterMetricFamily(
+            name="sau_config_reloads",
+            documentation="Number of config reloads, by result",
+            labels=["result"],
+        )
+        for result, count in self.reloads.items():
+            counter.add_metric(labels=[result], value=count)
+        yield counter
 
 
 class Util(Log):
@@ -443,9 +4035,6 @@ class Util(Log):
         __init__(self, level: str = "info", path: str = ".", retention: int = 7) -> None:
             Initializes the Util class.
 
-        loop_until_interrupt() -> None:
-            Executes a loop until an interrupt signal is received and then shuts down the SAU exporter.
-
         read_yaml_file(filename: str) -> dict:
             Read a YAML file and return its contents as a dictionary.
 
@@ -458,28 +4047,87 @@ class Util(Log):
     """
 
     default_exporter_port = 9191
-    default_logging = {"retention": 7, "directory": ".", "level": "info", "handler": "both"}
+    default_logging = {
+        "retention": 7,
+        "directory": ".",
+        "level": "info",
+        "handler": "both",
+        "format": "text",
+        "repeat_interval": 60,
+    }
+    default_collection = {
+        "refresh_interval": 0,
+        "executor": "thread",
+        "workers": 0,
+        "engine": "pool",
+        "concurrency": 0,
+        "region_concurrency": 2,
+        "page_size": 500,
+        "tag_values_server_side": False,
+        "max_stale_age": 3600,
+        "snapshot_path": "",
+        "config_watch_interval": 0,
+        "schedule": "batch",
+        "jitter": 0.1,
+        "region_intervals": {},
+        "type_intervals": {},
+    }
+    default_aws = {
+        "client_ttl": 3600,
+        "max_pool_connections": 10,
+        "retry_mode": "standard",
+        "max_attempts": 3,
+        "rate_limit": 0,
+        "burst": 100,
+        "backoff_retries": 3,
+        "backoff_base": 1.0,
+    }
+    default_labels = {
+        "tags": [],
+        "max_series": 0,
+        "aggregate": False,
+        "aggregate_by": list(EC2SAUCollector.default_aggregate_by),
+    }
+    default_events = {
+        "source": "none",
+        "queue_url": "",
+        "region": "",
+        "path": "",
+        "reconcile_interval": 3600,
+    }
+    default_sharding = {
+        "shard_index": 0,
+        "shard_count": 1,
+    }
+    default_cost = {
+        "enabled": False,
+        "prices": {},
+    }
+    default_resources = {
+        "snapshots": {"enabled": False, "interval": 21600},
+        "elastic_ips": {"enabled": False, "interval": 3600},
+        "network_interfaces": {"enabled": False, "interval": 3600},
+        "images": {"enabled": False, "interval": 86400, "max_age_days": 180},
+    }
 
     def __init__(
-        self, level: str = "info", path: str = ".", retention: int = 7, handler: str = "both",
+        self,
+        level: str = "info",
+        path: str = ".",
+        retention: int = 7,
+        handler: str = "both",
+        log_format: str = "text",
+        repeat_interval: float = 0,
     ) -> None:
-        Log.__init__(self, level=level, path=path, retention=retention, handler=handler)
-
-    @staticmethod
-    def loop_until_interrupt() -> None:
-        """
-        Executes a loop until an interrupt signal is received and then shuts down the SAU exporter.
-
-        Returns:
-        None
-
-        """
-        try:
-            while True:
-                time.sleep(100)
-        except KeyboardInterrupt:
-            logging.info("Shutting down SAU exporter")
-            sys.exit(0)
+        Log.__init__(
+            self,
+            level=level,
+            path=path,
+            retention=retention,
+            handler=handler,
+            log_format=log_format,
+            repeat_interval=repeat_interval,
+        )
 
     @staticmethod
     def read_yaml_file(filename: str) -> dict:
@@ -531,9 +4179,45 @@ class Util(Log):
             )
         if not config.get("exporter_port"):
             config["exporter_port"] = 9191
-        Util.default_logging.update(config.get("logging", {}))
-        config["logging"] = Util.default_logging
+        config["logging"] = {**Util.default_logging, **config.get("logging", {})}
         config["exclude_tags"] = config.get("exclude_tags", {})
+        config["include_tags"] = config.get("include_tags", {})
+        config["collection"] = {**Util.default_collection, **config.get("collection", {})}
+        if config["collection"]["refresh_interval"] < 0:
+            raise ValueError("collection.refresh_interval must not be negative")
+        if not 5 <= config["collection"]["page_size"] <= 500:
+            raise ValueError("collection.page_size must be between 5 and 500")
+        if not 0 <= config["collection"]["jitter"] < 1:
+            raise ValueError("collection.jitter must be at least 0 and less than 1")
+        if set(config["collection"]["type_intervals"]) - {"ec2", "volume"}:
+            raise ValueError("collection.type_intervals only accepts 'ec2' and 'volume'")
+        config["aws"] = {**Util.default_aws, **config.get("aws", {})}
+        if config["aws"]["retry_mode"] not in {"legacy", "standard", "adaptive"}:
+            raise ValueError("aws.retry_mode must be either 'legacy', 'standard' or 'adaptive'.")
+        config["events"] = {**Util.default_events, **config.get("events", {})}
+        config["labels"] = {**Util.default_labels, **config.get("labels", {})}
+        config["cost"] = {**Util.default_cost, **config.get("cost", {})}
+        config["sharding"] = {**Util.default_sharding, **config.get("sharding", {})}
+        # replicas of one deployment share a config file and set their shard in the environment
+        for key in ("shard_index", "shard_count"):
+            if os.environ.get(f"SAU_{key.upper()}"):
+                config["sharding"][key] = int(os.environ[f"SAU_{key.upper()}"])
+        if not 0 <= config["sharding"]["shard_index"] < config["sharding"]["shard_count"]:
+            raise ValueError("sharding.shard_index must be at least 0 and below sharding.shard_count")
+        resources = config.get("resources", {})
+        unknown = set(resources) - set(Util.default_resources)
+        if unknown:
+            raise ValueError(f"unknown resources: {', '.join(sorted(unknown))}")
+        config["resources"] = {
+            name: {**default, **resources.get(name, {})}
+            for name, default in Util.default_resources.items()
+        }
+        config["accounts"] = config.get("accounts", [])
+        for account in config["accounts"]:
+            if not account.get("name") or not account.get("role_arn"):
+                raise ValueError("every entry of accounts must have a name and a role_arn")
+        if config["events"]["source"] not in {"none", "sqs", "file"}:
+            raise ValueError("events.source must be either 'none', 'sqs' or 'file'.")
         return config
 
     @staticmethod
@@ -558,6 +4242,29 @@ class Util(Log):
     def get_aws_client(module: str, region_name: str) -> Any:
         return boto3.client(module, region_name=region_name)
 
+    @staticmethod
+    def get_event_source(
+        config: dict, client_getter: Callable[[str, str], Any]
+    ) -> Optional[EventSource]:
+        """
+        Creates the change feed configured in the events section, if any.
+
+        Args:
+        config (dict): The events configuration.
+        client_getter (Callable): Returns boto3 clients for the SQS event source.
+
+        Returns:
+        EventSource: The event source, or None if incremental collection is disabled.
+
+        """
+        if config["source"] == "sqs":
+            return SQSEventSource(
+                queue_url=config["queue_url"], region=config["region"], client_getter=client_getter
+            )
+        if config["source"] == "file":
+            return FileEventSource(path=config["path"])
+        return None
+
 
 if __name__ == "__main__":
     parser = ArgumentParser(
@@ -587,36 +4294,92 @@ if __name__ == "__main__":
         retention=config["logging"]["retention"],
         level=config["logging"]["level"],
         handler=config["logging"].get("handler", "both"),
+        log_format=config["logging"]["format"],
+        repeat_interval=config["logging"]["repeat_interval"],
     )
     util.setlogger()
 
-    install_mp_handler()
-
     logging.info("Starting SAU Exporter")
 
-    # Starts a WSGI server for prometheus metrics as a daemon thread
-    start_http_server(port=config["exporter_port"], addr="0.0.0.0")
-
     logging.info(f"config: {config}")
 
+    client_cache = AWSClientCache(
+        ttl=config["aws"]["client_ttl"],
+        max_pool_connections=config["aws"]["max_pool_connections"],
+        accounts=config["accounts"],
+        retry_mode=config["aws"]["retry_mode"],
+        max_attempts=config["aws"]["max_attempts"],
+    )
+    REGISTRY.register(client_cache)
+
+    collector = EC2SAUCollector(
+        regions=config["regions"],
+        path=config["logging"]["directory"],
+        retention=config["logging"]["retention"],
+        level=config["logging"]["level"],
+        handler=config["logging"].get("handler", "both"),
+        exclude_tags=config["exclude_tags"],
+        include_tags=config["include_tags"],
+        tag_values_server_side=config["collection"]["tag_values_server_side"],
+        client_getter=client_cache,
+        event_source=Util.get_event_source(config["events"], client_getter=client_cache),
+        reconcile_interval=config["events"]["reconcile_interval"],
+        label_tags=config["labels"]["tags"],
+        max_series=config["labels"]["max_series"],
+        aggregate=config["labels"]["aggregate"],
+        aggregate_by=config["labels"]["aggregate_by"],
+        accounts=config["accounts"],
+        rate_limit=config["aws"]["rate_limit"],
+        burst=config["aws"]["burst"],
+        backoff_retries=config["aws"]["backoff_retries"],
+        backoff_base=config["aws"]["backoff_base"],
+        refresh_interval=config["collection"]["refresh_interval"],
+        executor=config["collection"]["executor"],
+        workers=config["collection"]["workers"],
+        engine=config["collection"]["engine"],
+        concurrency=config["collection"]["concurrency"],
+        region_concurrency=config["collection"]["region_concurrency"],
+        page_size=config["collection"]["page_size"],
+        schedule=config["collection"]["schedule"],
+        jitter=config["collection"]["jitter"],
+        region_intervals=config["collection"]["region_intervals"],
+        type_intervals=config["collection"]["type_intervals"],
+        shard_index=config["sharding"]["shard_index"],
+        shard_count=config["sharding"]["shard_count"],
+        max_stale_age=config["collection"]["max_stale_age"],
+        snapshot_path=config["collection"]["snapshot_path"],
+        pricing=Pricing(prices=config["cost"]["prices"]) if config["cost"]["enabled"] else None,
+        resources={
+            name: {key: value for key, value in options.items() if key != "enabled"}
+            for name, options in config["resources"].items()
+            if options["enabled"]
+        },
+    )
+
+    # Serves the collector from its rendered snapshots next to the prometheus registry
+    server = MetricsServer(collector=collector, registry=REGISTRY)
 
+    # Refresh metrics in the background when a refresh interval is configured
+    collector.start_refresher()
 
-    # Add EC2SAUCollector to prometheus registry
-    REGISTRY.register(
-        EC2SAUCollector(
-            regions=config["regions"],
-            path=config["logging"]["directory"],
-            retention=config["logging"]["retention"],
-            level=config["logging"]["level"],
-            handler=config["logging"].get("handler", "both"),
-            exclude_tags=config["exclude_tags"],
-            client_getter=Util.get_aws_client,
-        )
+    # Apply config changes on SIGHUP, or when the file changes if a watch interval is set
+    reloader = ConfigReloader(
+        filename=CONFIG_FILE,
+        config=config,
+        collector=collector,
+        log=util,
+        watch_interval=config["collection"]["config_watch_interval"],
     )
+    REGISTRY.register(reloader)
+    reloader.start()
 
     logging.info(
-        f"SAU Exporter started. Metrics path: http://localhost:{config['exporter_port']}/"
+        f"SAU Exporter started. Metrics path: http://localhost:{config['exporter_port']}/metrics"
     )
 
-    # Keep main thread active
-    Util.loop_until_interrupt()
+    # Serve until SIGTERM or SIGINT, then drain in-flight scrapes and AWS calls
+    asyncio.run(server.serve(port=config["exporter_port"], addr="0.0.0.0"))
+    reloader.stop()
+    collector.shutdown()
+    logging.info("SAU exporter stopped")
+    Log.stop_logging()
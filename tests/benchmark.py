@@ -0,0 +1,314 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) 2023, Emeka Ugwuanyi.
+#
+# Distributed under the terms of the MIT License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+#
+# -----------------------------------------------------------------------------
+
+#!/bin/python3
+"""
+Scale benchmark of the exporter against the synthetic FakeEC2 backend.
+
+Every case (regions x resources per region) runs in a fresh process and reports the scrape
+latency of collect(), the latency of a bare get_instance_metrics() collection, CPU time, peak
+RSS and exposition size of the collector. With --check the results are
+compared to the budgets in benchmark_thresholds.json and the run fails on a regression. The peak
+RSS includes the in-process fake inventory, so only the growth during the scrapes is budgeted.
+Every case also checks the collected counts against the fake, --http through the botocore parser.
+
+    python tests/benchmark.py --regions 1,5,20 --volumes 1000,10000,50000
+    python tests/benchmark.py --regions 5 --volumes 10000 --latency 0.3 --http --check
+    python tests/benchmark.py --tag-matcher 20000 --check
+"""
+import json
+import math
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from queue import Empty
+from typing import List
+
+# caution: path[0] is reserved for script path (or '' in REPL)
+sys.path.insert(1, f"{os.path.dirname(os.path.abspath(__file__))}/../src/")
+
+from prometheus_client import CollectorRegistry, generate_latest
+from fake_ec2 import FakeEC2, FakeEC2Server, client_for
+from sau.__main__ import EC2SAUCollector, TagMatcher
+
+THRESHOLDS = f"{os.path.dirname(os.path.abspath(__file__))}/benchmark_thresholds.json"
+REGIONS = [
+    "us-east-1", "us-east-2", "us-west-1", "us-west-2", "ca-central-1", "sa-east-1", "eu-west-1",
+    "eu-west-2", "eu-west-3", "eu-central-1", "eu-north-1", "eu-south-1", "ap-south-1",
+    "ap-southeast-1", "ap-southeast-2", "ap-northeast-1", "ap-northeast-2", "ap-northeast-3",
+    "ap-east-1", "me-south-1", "af-south-1", "il-central-1",
+]
+
+
+def rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def serve(options: dict, ports: multiprocessing.Queue) -> None:
+    """
+    Serves a FakeEC2 inventory over HTTP until the process is terminated.
+    """
+    regions = options.pop("regions")
+    server = FakeEC2Server(FakeEC2(**options))
+    for region in regions:
+        server.fake.inventory(region)
+    ports.put(server.port)
+    server.httpd.serve_forever()
+
+
+def run_case(case: dict, results: multiprocessing.Queue) -> None:
+    """
+    Measures one case in the current process and puts its result on the queue.
+    """
+    regions = REGIONS[: case["regions"]]
+    options = {
+        "instances": case["instances"],
+        "volumes": case["volumes"],
+        "latency": case["latency"],
+    }
+    server = None
+    if case["http"]:
+        ports: multiprocessing.Queue = multiprocessing.get_context("spawn").Queue()
+        server = multiprocessing.get_context("spawn").Process(
+            target=serve, args=({**options, "regions": regions}, ports), daemon=True
+        )
+        server.start()
+        url, clients, lock = f"http://127.0.0.1:{ports.get(timeout=600)}", {}, threading.Lock()
+
+        def client_getter(module: str, region_name: str, account: str = ""):
+            return client_for(url, module, region_name, clients, lock)
+
+    else:
+        client_getter = FakeEC2(**options)
+        # the inventory is generated before the baseline, it is not the exporter's memory
+        for region in regions:
+            client_getter.inventory(region)
+    collector = EC2SAUCollector(
+        regions=regions,
+        exclude_tags={},
+        client_getter=client_getter,
+        engine=case["engine"],
+        page_size=case["page_size"],
+    )
+    registry = CollectorRegistry()
+    registry.register(collector)
+    baseline = rss_mb()
+    scrapes: List[float] = []
+    cpu = time.process_time()
+    try:
+        for _ in range(case["scrapes"]):
+            started = time.perf_counter()
+            body = generate_latest(registry)
+            scrapes.append(time.perf_counter() - started)
+        cpu = (time.process_time() - cpu) / case["scrapes"]
+        collections = []
+        for _ in range(case["scrapes"]):
+            started = time.perf_counter()
+            collector.get_instance_metrics()
+            collections.append(time.perf_counter() - started)
+        result = {
+            **case,
+            "errors": collector.errors,
+            "cold_scrape_seconds": round(scrapes[0], 3),
+            "scrape_seconds": round(statistics.median(scrapes[1:] or scrapes), 3),
+            "collect_seconds": round(statistics.median(collections), 3),
+            "cpu_seconds": round(cpu, 3),
+            "peak_rss_mb": round(rss_mb(), 1),
+            "rss_growth_mb": round(rss_mb() - baseline, 1),
+            "exposition_bytes": len(body),
+        }
+        # the served inventory is deterministic, a local copy knows what should be collected
+        fake = FakeEC2(**options) if case["http"] else client_getter
+        result["problems"] = verify(collector, fake, regions, case["http"])
+        results.put(result)
+    finally:
+        collector.shutdown()
+        if server is not None:
+            server.terminate()
+
+
+def verify(collector: EC2SAUCollector, fake: FakeEC2, regions: List[str], http: bool) -> List[str]:
+    """
+    Compares the last collection with what the fake serves and returns every difference.
+    """
+    problems = []
+    snapshot = collector.snapshot
+    for region in regions:
+        expected = fake.expected(region)
+        instances = sum(1 for row in snapshot["stopped_instances"] if row["region"] == region)
+        if instances != expected["stopped_instances"]:
+            problems.append(f"{region} has {instances} stopped instances, not {expected['stopped_instances']}")
+        states = snapshot["volume_states"].get(("", region), {})
+        wanted = {"unattached": expected["unattached"], "error": expected["error"]}
+        if states != wanted:
+            problems.append(f"{region} has volume states {states}, not {wanted}")
+    stats = collector.api_stats.get(("", regions[0], "describe_volumes"), {})
+    if http and not stats.get("bytes"):
+        problems.append(f"{regions[0]} describe_volumes recorded no response bytes")
+    return problems
+
+
+def legacy_any(exclude_tags: dict, tags: dict) -> bool:
+    """
+    The exclude_tags check TagMatcher replaced, rebuilding the value set on every call.
+    """
+    for key, value in exclude_tags.items():
+        if tags.get(key, "").lower() in {f"{item}".lower(): True for item in value}:
+            return True
+    return False
+
+
+def tag_matcher_case(count: int) -> dict:
+    """
+    Measures TagMatcher.any() against the legacy check on count tag dictionaries.
+
+    Only exact values are configured, which the legacy check also understands, so both
+    must agree on every dictionary. Both run in the same process, which keeps the speed-up
+    comparable under profilers or tracemalloc.
+
+    """
+    keys = [f"key{i}" for i in range(20)]
+    exclude_tags = {key: [f"value{i}" for i in range(50)] for key in keys}
+    matcher = TagMatcher(exclude_tags)
+    items = [
+        {key: f"VALUE{(n + i) % 200}" for i, key in enumerate(keys[n % 5 : n % 5 + 10])}
+        for n in range(count)
+    ]
+    started = time.perf_counter()
+    legacy = [legacy_any(exclude_tags, tags) for tags in items]
+    legacy_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    compiled = [matcher.any(tags) for tags in items]
+    compiled_seconds = time.perf_counter() - started
+    if compiled != legacy:
+        raise AssertionError("TagMatcher disagrees with the legacy exclude_tags check")
+    return {
+        "tag_dicts": count,
+        "excluded": sum(compiled),
+        "legacy_per_second": round(count / legacy_seconds),
+        "matcher_per_second": round(count / compiled_seconds),
+        "speedup": round(legacy_seconds / compiled_seconds, 1),
+    }
+
+
+def limits(case: dict, thresholds: dict) -> dict:
+    """
+    Returns the budget of every measurement of a case.
+
+    A budget is base + per_resource * resources, scrape latency also gets the simulated
+    latency of the pages of one region as regions are collected in parallel.
+
+    """
+    resources = case["regions"] * (case["instances"] + case["volumes"])
+    pages = sum(math.ceil(case[kind] / case["page_size"]) for kind in ("instances", "volumes"))
+    budgets = {
+        name: budget["base"] + budget["per_resource"] * resources
+        for name, budget in thresholds.items()
+    }
+    for name in ("scrape_seconds", "collect_seconds"):
+        if name in budgets:
+            budgets[name] += case["latency"] * pages
+    return budgets
+
+
+def main() -> int:
+    parser = ArgumentParser(description="SAU exporter scale benchmark")
+    parser.add_argument("--regions", default="1,5,20", help="comma separated region counts")
+    parser.add_argument("--volumes", default="1000,10000", help="comma separated volumes")
+    parser.add_argument("--instances", type=int, default=-1, help="defaults to --volumes")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per API page")
+    parser.add_argument("--http", action="store_true", help="serve the fake through botocore")
+    parser.add_argument("--engine", default="pool", choices=["pool", "async"])
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--scrapes", type=int, default=3, help="scrapes per case, 1st is cold")
+    parser.add_argument("--check", action="store_true", help="fail when a budget is exceeded")
+    parser.add_argument("--thresholds", default=THRESHOLDS)
+    parser.add_argument("--json", default="", help="also write the results to this file")
+    parser.add_argument(
+        "--tag-matcher", type=int, default=0, help="only benchmark tag filtering on N tag dicts"
+    )
+    args = parser.parse_args()
+
+    thresholds: dict = {}
+    if args.check:
+        with open(args.thresholds) as stream:
+            thresholds = json.load(stream)
+
+    if args.tag_matcher:
+        result = tag_matcher_case(args.tag_matcher)
+        print("\t".join(result))
+        print("\t".join(str(value) for value in result.values()))
+        minimum = thresholds.get("tag_matcher", {}).get("min_speedup", 0)
+        if result["speedup"] < minimum:
+            print(f"REGRESSION tag matcher: speedup {result['speedup']} < {minimum}", file=sys.stderr)
+            return 1
+        return 0
+    thresholds = thresholds.get("http" if args.http else "memory", {})
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    failures = []
+    columns = [
+        "regions", "volumes", "cold_scrape_seconds", "scrape_seconds", "collect_seconds",
+        "cpu_seconds",
+        "peak_rss_mb", "rss_growth_mb", "exposition_bytes", "errors",
+    ]
+    print("\t".join(columns))
+    for regions in map(int, args.regions.split(",")):
+        for volumes in map(int, args.volumes.split(",")):
+            case = {
+                "regions": regions,
+                "volumes": volumes,
+                "instances": volumes if args.instances < 0 else args.instances,
+                "latency": args.latency,
+                "http": args.http,
+                "engine": args.engine,
+                "page_size": args.page_size,
+                "scrapes": args.scrapes,
+            }
+            name = f"{regions} regions x {volumes} volumes"
+            queue = context.Queue()
+            process = context.Process(target=run_case, args=(case, queue))
+            process.start()
+            result = None
+            while result is None and process.is_alive():
+                try:
+                    result = queue.get(timeout=1)
+                except Empty:
+                    pass
+            process.join()
+            if result is None:
+                failures.append(f"{name}: exited with {process.exitcode}")
+                continue
+            results.append(result)
+            print("\t".join(str(result[column]) for column in columns), flush=True)
+            for measurement, limit in limits(case, thresholds).items():
+                if result[measurement] > limit:
+                    failures.append(f"{name}: {measurement} {result[measurement]} > {limit:.3f}")
+            if result["errors"]:
+                failures.append(f"{name}: {result['errors']} collection errors")
+            failures.extend(f"{name}: {problem}" for problem in result["problems"])
+
+    if args.json:
+        with open(args.json, "w") as stream:
+            json.dump(results, stream, indent=2)
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
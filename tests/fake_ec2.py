@@ -0,0 +1,457 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) 2023, Emeka Ugwuanyi.
+#
+# Distributed under the terms of the MIT License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+#
+# -----------------------------------------------------------------------------
+
+#!/bin/python3
+"""
+A synthetic EC2 backend for tests and benchmarks.
+
+FakeEC2 generates a deterministic inventory of instances and volumes per region and is callable
+with the client_getter signature of EC2SAUCollector, returning in-process clients that page
+and filter like the EC2 API. FakeEC2Server serves the same inventory over the EC2 query
+protocol on a local port, so real boto3 clients and the botocore XML parser are exercised.
+"""
+import collections
+import fnmatch
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+from xml.sax.saxutils import escape
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+
+class FakeEC2:
+    """
+    Deterministic synthetic EC2 inventory, callable as a client_getter.
+
+    Every region holds instances and volumes generated from the seed and the region name, so
+    two instances with the same arguments describe the same resources. Inventories are
+    generated on first use and indexed by state, id and attachment.
+
+    Attributes:
+    - instances (int): Instances per region (default: 100).
+    - volumes (int): Volumes per region (default: 100).
+    - stopped_ratio (float): Share of stopped instances (default: 0.3).
+    - unattached_ratio (float): Share of unattached volumes, a tenth of them in error (default: 0.3).
+    - tags (int): Extra tag keys per resource on top of Name and env (default: 2).
+    - latency (float): Seconds every page request sleeps (default: 0).
+    - seed (int): Seed of the generator (default: 0).
+
+    Methods:
+    - inventory(region: str) -> dict: Returns the indexed inventory of a region.
+    - expected(region: str) -> dict: Returns the stopped instance and volume state counts.
+    - describe(region: str, operation: str, filters: list) -> list: Returns the matching items.
+
+    """
+
+    keys = {
+        "describe_instances": "Reservations",
+        "describe_volumes": "Volumes",
+        "describe_snapshots": "Snapshots",
+        "describe_addresses": "Addresses",
+        "describe_network_interfaces": "NetworkInterfaces",
+        "describe_images": "Images",
+    }
+    indexed = ("instance-state-name", "instance-id", "status", "volume-id", "attachment.instance-id")
+    volume_types = ("gp2", "gp3", "io1", "io2", "st1", "sc1", "standard")
+    environments = ("development", "stage", "production")
+
+    def __init__(
+        self,
+        instances: int = 100,
+        volumes: int = 100,
+        stopped_ratio: float = 0.3,
+        unattached_ratio: float = 0.3,
+        tags: int = 2,
+        latency: float = 0,
+        seed: int = 0,
+    ) -> None:
+        self.instances = instances
+        self.volumes = volumes
+        self.stopped_ratio = stopped_ratio
+        self.unattached_ratio = unattached_ratio
+        self.tags = tags
+        self.latency = latency
+        self.seed = seed
+        self.inventories: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, module: str, region_name: str, account: str = "") -> "FakeEC2Client":
+        return FakeEC2Client(self, region_name)
+
+    def make_tags(self, rng: random.Random, name: str) -> List[dict]:
+        tags = [
+            {"Key": "Name", "Value": name},
+            {"Key": "env", "Value": rng.choice(self.environments)},
+        ]
+        tags += [{"Key": f"key{n}", "Value": f"value{rng.randrange(10)}"} for n in range(self.tags)]
+        return tags
+
+    def generate(self, region: str) -> dict:
+        rng = random.Random(f"{self.seed}:{region}")
+        prefix = f"{zlib.crc32(region.encode()):08x}"
+        zones = [f"{region}{zone}" for zone in "abc"]
+        instances = []
+        for n in range(self.instances):
+            stopped = rng.random() < self.stopped_ratio
+            instances.append(
+                {
+                    "InstanceId": f"i-{prefix}{n:09x}",
+                    "InstanceType": "t3.medium",
+                    "State": {"Code": 80, "Name": "stopped"}
+                    if stopped
+                    else {"Code": 16, "Name": "running"},
+                    "Placement": {"AvailabilityZone": rng.choice(zones)},
+                    "Tags": self.make_tags(rng, f"instance-{n}"),
+                }
+            )
+        volumes = []
+        for n in range(self.volumes):
+            volume = {
+                "VolumeId": f"vol-{prefix}{n:09x}",
+                "Size": rng.choice((8, 20, 50, 100, 500)),
+                "AvailabilityZone": rng.choice(zones),
+                "VolumeType": rng.choice(self.volume_types),
+                "Attachments": [],
+                "Tags": self.make_tags(rng, f"volume-{n}"),
+            }
+            if rng.random() < self.unattached_ratio:
+                volume["State"] = "error" if rng.random() < 0.1 else "available"
+            else:
+                volume["State"] = "in-use"
+                if instances:
+                    instance_id = rng.choice(instances)["InstanceId"]
+                    attachment = {"InstanceId": instance_id, "VolumeId": volume["VolumeId"]}
+                    volume["Attachments"].append({**attachment, "State": "attached"})
+            volumes.append(volume)
+
+        index: Dict[tuple, list] = collections.defaultdict(list)
+        for instance in instances:
+            index["instance-state-name", instance["State"]["Name"]].append(instance)
+            index["instance-id", instance["InstanceId"]].append(instance)
+        for volume in volumes:
+            index["status", volume["State"]].append(volume)
+            index["volume-id", volume["VolumeId"]].append(volume)
+            for attachment in volume["Attachments"]:
+                index["attachment.instance-id", attachment["InstanceId"]].append(volume)
+        index = dict(index)
+        return {"describe_instances": instances, "describe_volumes": volumes, "index": index}
+
+    def inventory(self, region: str) -> dict:
+        with self.lock:
+            if region not in self.inventories:
+                self.inventories[region] = self.generate(region)
+            return self.inventories[region]
+
+    def expected(self, region: str) -> dict:
+        """
+        Returns what an exporter without tag filters should find in a region.
+
+        Returns:
+        dict: 'stopped_instances', 'unattached' and 'error' counts.
+
+        """
+        index = self.inventory(region)["index"]
+        return {
+            "stopped_instances": len(index.get(("instance-state-name", "stopped"), [])),
+            "unattached": len(index.get(("status", "available"), [])),
+            "error": len(index.get(("status", "error"), [])),
+        }
+
+    @staticmethod
+    def matches(item: dict, name: str, values: list) -> bool:
+        if name.startswith("tag:"):
+            tags = {tag["Key"]: tag["Value"] for tag in item.get("Tags", [])}
+            key = name[4:]
+            return key in tags and any(fnmatch.fnmatchcase(tags[key], value) for value in values)
+        if name == "tag-key":
+            return any(tag["Key"] in values for tag in item.get("Tags", []))
+        if name == "instance-state-name":
+            return item["State"]["Name"] in values
+        if name == "instance-id":
+            return item["InstanceId"] in values
+        if name == "status":
+            return item["State"] in values
+        if name == "volume-id":
+            return item["VolumeId"] in values
+        if name == "attachment.instance-id":
+            return any(attachment["InstanceId"] in values for attachment in item["Attachments"])
+        error = {"Code": "InvalidParameterValue", "Message": f"The filter '{name}' is invalid"}
+        raise ClientError({"Error": error}, "Describe")
+
+    def describe(self, region: str, operation: str, filters: Optional[list] = None) -> list:
+        """
+        Returns the items of an operation in a region that match every filter.
+
+        The candidates come from the index of the first indexed filter, the remaining
+        filters are evaluated item by item.
+
+        """
+        if operation not in ("describe_instances", "describe_volumes"):
+            return []
+        inventory = self.inventory(region)
+        filters = list(filters or [])
+        candidates = inventory[operation]
+        for position, item in enumerate(filters):
+            if item["Name"] in self.indexed:
+                seen = set()
+                candidates = []
+                for value in item["Values"]:
+                    for resource in inventory["index"].get((item["Name"], value), []):
+                        if id(resource) not in seen:
+                            seen.add(id(resource))
+                            candidates.append(resource)
+                del filters[position]
+                break
+        items = [
+            resource
+            for resource in candidates
+            if all(self.matches(resource, item["Name"], item["Values"]) for item in filters)
+        ]
+        # an empty index hit of the other resource type, e.g. a status filter on instances
+        kind = "InstanceId" if operation == "describe_instances" else "VolumeId"
+        return [resource for resource in items if kind in resource]
+
+    def pages(
+        self, region: str, operation: str, filters: Optional[list], size: int, start: int
+    ) -> Iterator[dict]:
+        """
+        Yields the pages of an operation from offset start, each with a NextToken but the last.
+        """
+        items = self.describe(region, operation, filters)
+        key = self.keys[operation]
+        while True:
+            if self.latency:
+                time.sleep(self.latency)
+            page = items[start:start + size]
+            if operation == "describe_instances":
+                page = [
+                    {"ReservationId": f"r-{item['InstanceId'][2:]}", "Instances": [item]}
+                    for item in page
+                ]
+            response = {key: page}
+            start += size
+            if start < len(items):
+                response["NextToken"] = str(start)
+            yield response
+            if start >= len(items):
+                return
+
+
+class FakeEC2Paginator:
+    def __init__(self, client: "FakeEC2Client", operation: str) -> None:
+        self.client = client
+        self.operation = operation
+
+    def paginate(
+        self, PaginationConfig: Optional[dict] = None, Filters: Optional[list] = None, **kwargs
+    ) -> Iterator[dict]:
+        config = PaginationConfig or {}
+        return self.client.fake.pages(
+            self.client.region_name,
+            self.operation,
+            Filters,
+            int(config.get("PageSize", 1000)),
+            int(config.get("StartingToken", 0)),
+        )
+
+
+class FakeEC2Client:
+    """
+    In-process stand-in for a boto3 EC2 client of one region.
+    """
+
+    def __init__(self, fake: FakeEC2, region_name: str) -> None:
+        self.fake = fake
+        self.region_name = region_name
+
+    def can_paginate(self, operation: str) -> bool:
+        return operation in self.fake.keys
+
+    def get_paginator(self, operation: str) -> FakeEC2Paginator:
+        return FakeEC2Paginator(self, operation)
+
+    def describe_instances(self, Filters: Optional[list] = None, **kwargs) -> dict:
+        return next(self.fake.pages(self.region_name, "describe_instances", Filters, 10 ** 9, 0))
+
+    def describe_volumes(self, Filters: Optional[list] = None, **kwargs) -> dict:
+        return next(self.fake.pages(self.region_name, "describe_volumes", Filters, 10 ** 9, 0))
+
+
+class FakeEC2Handler(BaseHTTPRequestHandler):
+    """
+    Answers DescribeInstances and DescribeVolumes in the EC2 query protocol.
+
+    The region is taken from the credential scope of the SigV4 Authorization header.
+    """
+
+    namespace = "http://ec2.amazonaws.com/doc/2016-11-15/"
+    actions = {
+        "DescribeInstances": "describe_instances",
+        "DescribeVolumes": "describe_volumes",
+        "DescribeSnapshots": "describe_snapshots",
+        "DescribeAddresses": "describe_addresses",
+        "DescribeNetworkInterfaces": "describe_network_interfaces",
+        "DescribeImages": "describe_images",
+    }
+    # response element names that are not the lower camel case of the member name
+    names = {
+        "Reservations": "reservationSet",
+        "Instances": "instancesSet",
+        "Tags": "tagSet",
+        "Attachments": "attachmentSet",
+        "Volumes": "volumeSet",
+        "Snapshots": "snapshotSet",
+        "Addresses": "addressesSet",
+        "NetworkInterfaces": "networkInterfaceSet",
+        "Images": "imagesSet",
+    }
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    @classmethod
+    def element(cls, key: str, value: Any) -> str:
+        if isinstance(value, dict) and key == "State":
+            key = "InstanceState"
+        elif key == "State":
+            key = "Status"
+        name = cls.names.get(key, key[0].lower() + key[1:])
+        if isinstance(value, list):
+            body = "".join(f"<item>{cls.members(item)}</item>" for item in value)
+        elif isinstance(value, dict):
+            body = cls.members(value)
+        else:
+            body = escape(str(value))
+        return f"<{name}>{body}</{name}>"
+
+    @classmethod
+    def members(cls, item: dict) -> str:
+        return "".join(cls.element(key, value) for key, value in item.items())
+
+    def reply(self, status: int, body: str) -> None:
+        payload = f'<?xml version="1.0" encoding="UTF-8"?>\n{body}'.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml;charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def error(self, code: str, message: str, request_id: Any) -> None:
+        error = f"<Code>{code}</Code><Message>{escape(message)}</Message>"
+        self.reply(
+            400,
+            f"<Response><Errors><Error>{error}</Error></Errors>"
+            f"<RequestID>{request_id}</RequestID></Response>",
+        )
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        params = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+        authorization = self.headers.get("Authorization", "")
+        # Credential=<key>/<date>/<region>/ec2/aws4_request
+        scope = authorization.partition("Credential=")[2].split("/")
+        region = scope[2] if len(scope) > 2 else "us-east-1"
+        action = params.get("Action", "")
+        request_id = uuid.uuid4()
+        operation = self.actions.get(action)
+        if operation is None:
+            self.error("InvalidAction", f"The action {action} is not valid", request_id)
+            return
+        filters = []
+        position = 1
+        while f"Filter.{position}.Name" in params:
+            values = []
+            while f"Filter.{position}.Value.{len(values) + 1}" in params:
+                values.append(params[f"Filter.{position}.Value.{len(values) + 1}"])
+            filters.append({"Name": params[f"Filter.{position}.Name"], "Values": values})
+            position += 1
+        try:
+            page = next(
+                self.server.fake.pages(
+                    region,
+                    operation,
+                    filters,
+                    int(params.get("MaxResults", 1000)),
+                    int(params.get("NextToken", 0)),
+                )
+            )
+        except ClientError as error:
+            self.error(error.response["Error"]["Code"], error.response["Error"]["Message"], request_id)
+            return
+        body = f"<requestId>{request_id}</requestId>"
+        body += "".join(self.element(key, value) for key, value in page.items())
+        self.reply(200, f'<{action}Response xmlns="{self.namespace}">{body}</{action}Response>')
+
+
+class FakeEC2Server:
+    """
+    Serves a FakeEC2 inventory over HTTP on a local port.
+
+    Attributes:
+    - fake (FakeEC2): The inventory served.
+    - port (int): The port to listen on, 0 picks a free one (default: 0).
+
+    Methods:
+    - start() -> None: Starts serving in a daemon thread.
+    - stop() -> None: Stops serving.
+    - client_getter(module, region_name, account) -> Any: Returns a cached boto3 client.
+
+    """
+
+    def __init__(self, fake: FakeEC2, port: int = 0) -> None:
+        self.fake = fake
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), FakeEC2Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = fake
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.thread: Optional[threading.Thread] = None
+        self.clients: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def client_getter(self, module: str, region_name: str, account: str = "") -> Any:
+        return client_for(self.url, module, region_name, self.clients, self.lock)
+
+
+def client_for(url: str, module: str, region_name: str, clients: dict, lock: threading.Lock) -> Any:
+    """
+    Returns a boto3 client of a fake endpoint, creating and caching it on first use.
+    """
+    with lock:
+        if (module, region_name) not in clients:
+            clients[(module, region_name)] = boto3.session.Session().client(
+                module,
+                region_name=region_name,
+                endpoint_url=url,
+                aws_access_key_id="fake",
+                aws_secret_access_key="fake",
+                config=Config(
+                    retries={"mode": "standard", "max_attempts": 1}, max_pool_connections=50
+                ),
+            )
+        return clients[(module, region_name)]
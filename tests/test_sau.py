@@ -12,20 +12,91 @@ import sys
 import os
 import unittest
 import datetime
-from typing import Any, List
+import tempfile
+import time
+import collections
+import gzip
+import json
+import logging
+import pickle
+import signal
+import urllib.error
+import urllib.request
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Iterator, List
 
 # caution: path[0] is reserved for script path (or '' in REPL)
 sys.path.insert(1, f"{os.path.dirname(os.path.abspath(__file__))}/../src/")
 
-from sau.__main__ import Log, Util, EC2SAUCollector
+from botocore.exceptions import ClientError
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.openmetrics import parser as openmetrics_parser
+from prometheus_client.parser import text_string_to_metric_families
+from fake_ec2 import FakeEC2
+from sau.__main__ import (
+    Log,
+    RateLimiter,
+    Util,
+    Pricing,
+    EC2SAUCollector,
+    AWSClientCache,
+    TagMatcher,
+    EventSource,
+    QueueEventSource,
+    FileEventSource,
+    ResourceCollector,
+    MetricsServer,
+    ResourceTable,
+    RepeatFilter,
+    ConfigReloader,
+    RefreshScheduler,
+    HashRing,
+)
+
+
+class MockPaginator:
+    """Splits a canned describe_* response into pages of PageSize items."""
+
+    keys = {
+        "describe_instances": "Reservations",
+        "describe_volumes": "Volumes",
+        "describe_snapshots": "Snapshots",
+        "describe_network_interfaces": "NetworkInterfaces",
+        "describe_images": "Images",
+    }
+
+    def __init__(self, client: "MockClient", operation: str):
+        self.client = client
+        self.operation = operation
+
+    def paginate(self, PaginationConfig: dict, **kwargs) -> Iterator[dict]:
+        key = self.keys[self.operation]
+        items = getattr(self.client, self.operation)(**kwargs)[key]
+        filters = {item["Name"]: item["Values"] for item in kwargs.get("Filters", [])}
+        if "volume-id" in filters:
+            items = [item for item in items if item["VolumeId"] in filters["volume-id"]]
+        size = PaginationConfig["PageSize"]
+        for start in range(0, len(items), size):
+            self.client.pages += 1
+            yield {key: items[start:start + size]}
 
 
 class MockClient:
     def __init__(self, module: str, region_name: str):
         self.module = module
         self.region_name = region_name
+        self.pages = 0
+        self.filters: List[dict] = []
+
+    def can_paginate(self, operation: str) -> bool:
+        return operation in MockPaginator.keys
+
+    def get_paginator(self, operation: str) -> MockPaginator:
+        return MockPaginator(self, operation)
 
     def describe_instances(self, Filters: List[dict]) -> dict:
+        self.filters = Filters
         return {
             "Reservations": [
                 {
@@ -245,6 +316,7 @@ class MockClient:
         }
 
     def describe_volumes(self, Filters: List[dict]) -> dict:
+        self.filters = Filters
         return {
             "Volumes": [
                 {
@@ -357,6 +429,105 @@ def get_aws_client(module: str, region_name: str) -> Any:
     return MockClient(module, region_name=region_name)
 
 
+class ThrottledClient(MockClient):
+    throttles = 2
+
+    def describe_volumes(self, Filters: List[dict]) -> dict:
+        if self.throttles:
+            self.throttles -= 1
+            raise ClientError(
+                {"Error": {"Code": "RequestLimitExceeded", "Message": "Request limit exceeded."}},
+                "DescribeVolumes",
+            )
+        return super().describe_volumes(Filters)
+
+
+class AttachedStorageClient(MockClient):
+    def describe_volumes(self, Filters: List[dict]) -> dict:
+        filters = {item["Name"]: item["Values"] for item in Filters}
+        if "attachment.instance-id" not in filters:
+            return super().describe_volumes(Filters)
+        return {
+            "Volumes": [
+                {
+                    "Attachments": [{"InstanceId": instance_id, "State": "attached"}],
+                    "Size": 100,
+                    "VolumeId": "vol-root",
+                    "VolumeType": "gp2",
+                }
+                for instance_id in filters["attachment.instance-id"]
+            ]
+        }
+
+
+class WasteClient(MockClient):
+    calls: List[str] = []
+
+    def describe_snapshots(self, OwnerIds: List[str]) -> dict:
+        self.calls.append("describe_snapshots")
+        return {
+            "Snapshots": [
+                {"SnapshotId": "snap-01", "VolumeId": "vol-0c", "VolumeSize": 20, "Tags": []},
+                {
+                    "SnapshotId": "snap-02",
+                    "VolumeId": "vol-gone",
+                    "VolumeSize": 8,
+                    "Tags": [{"Key": "Name", "Value": "old-backup"}],
+                },
+            ]
+        }
+
+    def describe_addresses(self) -> dict:
+        return {
+            "Addresses": [
+                {"AllocationId": "eipalloc-01", "PublicIp": "1.2.3.4"},
+                {
+                    "AllocationId": "eipalloc-02",
+                    "PublicIp": "1.2.3.5",
+                    "AssociationId": "eipassoc-01",
+                },
+            ]
+        }
+
+    def describe_network_interfaces(self, Filters: List[dict]) -> dict:
+        return {
+            "NetworkInterfaces": [
+                {
+                    "NetworkInterfaceId": "eni-01",
+                    "InterfaceType": "interface",
+                    "AvailabilityZone": "us-east-1a",
+                    "TagSet": [{"Key": "env", "Value": "dev"}],
+                },
+                {
+                    "NetworkInterfaceId": "eni-02",
+                    "InterfaceType": "interface",
+                    "AvailabilityZone": "us-east-1b",
+                    "TagSet": [{"Key": "env", "Value": "prod"}],
+                },
+            ]
+        }
+
+    def describe_images(self, Owners: List[str]) -> dict:
+        return {
+            "Images": [
+                {"ImageId": "ami-01", "Name": "base-2019", "CreationDate": "2019-01-01T00:00:00.000Z"},
+                {"ImageId": "ami-02", "Name": "base-new", "CreationDate": "2999-01-01T00:00:00.000Z"},
+            ]
+        }
+
+
+class DeletedVolumeClient(MockClient):
+    def describe_volumes(self, Filters: List[dict]) -> dict:
+        response = super().describe_volumes(Filters)
+        response["Volumes"] = [v for v in response["Volumes"] if v["VolumeId"] != "vol-0c"]
+        return response
+
+
+def log_from_worker(message: str) -> int:
+    logging.error(message)
+    return os.getpid()
+
+
 class TestApp(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -374,6 +545,55 @@ class TestApp(unittest.TestCase):
         self.assertEqual(self.log.path, ".")
         self.assertEqual(self.log.retention, 7)
 
+    def test_log_pipeline(self):
+        root = logging.getLogger()
+        saved = root.handlers[:], root.level
+        with tempfile.TemporaryDirectory() as directory:
+            log = Log(path=directory, handler="file", log_format="json", repeat_interval=60)
+            try:
+                log.setlogger()
+                listener = Log.listener
+                log.setlogger()
+                self.assertIs(Log.listener, listener)
+                self.assertEqual(len(root.handlers), 1)
+                for _ in range(3):
+                    logging.error("describe_volumes failed in us-east-1")
+                logging.info("collection done")
+                with ProcessPoolExecutor(
+                    max_workers=1,
+                    initializer=Log.init_worker,
+                    initargs=(Log.worker_queue(), logging.INFO),
+                ) as executor:
+                    worker = executor.submit(log_from_worker, "from worker").result()
+            finally:
+                Log.stop_logging()
+                Log.file_handler.close()
+                Log.file_handler = None
+                root.handlers[:], _ = saved
+                root.setLevel(saved[1])
+            with open(os.path.join(directory, "sau_exporter.log")) as stream:
+                entries = [json.loads(line) for line in stream]
+        self.assertEqual(
+            [(e["level"], e["message"]) for e in entries],
+            [
+                ("ERROR", "describe_volumes failed in us-east-1"),
+                ("INFO", "collection done"),
+                ("ERROR", "from worker"),
+            ],
+        )
+        self.assertEqual(entries[2]["pid"], worker)
+        self.assertNotEqual(worker, os.getpid())
+
+        # the suppressed repeats are reported once the interval has passed
+        repeat_filter = RepeatFilter(interval=60)
+        passed = []
+        for created in (0, 1, 2, 61):
+            record = logging.LogRecord("sau", logging.ERROR, __file__, 1, "throttled", None, None)
+            record.created = created
+            if repeat_filter.filter(record):
+                passed.append(record.getMessage())
+        self.assertEqual(passed, ["throttled", "throttled (suppressed 2 repeats)"])
+
     def test_sau_collector(self):
         self.assertListEqual(list1=self.regions, list2=self.collector.regions)
         region = self.regions[0]
@@ -396,14 +616,16 @@ class TestApp(unittest.TestCase):
                     "tag_name": "poc-sau02",
                 },
             ],
-            list2=response,
+            list2=list(response),
         )
         response = self.collector.get_unattached_volumes(region=region)
+        self.assertEqual(first=len(response["stats"].pop("latency")), second=1)
         # test unattached volumes
         self.assertDictEqual(
             d1={
                 "response": {
                     "states": {"unattached": 3, "error": 0},
+                    "known": {"vol-0c": "unattached", "vol-0d": "unattached", "vol-0ef": "unattached"},
                     "result": [
                         {
                             "name": "poc-sau-01",
@@ -442,6 +664,19 @@ class TestApp(unittest.TestCase):
                 },
                 "errorcount": 0,
                 "region": "us-east-1",
+                "account": "",
+                "filtered": {"fetched": 3, "include": 0, "exclude": 0},
+                "stats": {
+                    "account": "",
+                    "region": "us-east-1",
+                    "api": "describe_volumes",
+                    "throttles": 0,
+                    "retry_seconds": 0.0,
+                    "pages": 1,
+                    "items": 3,
+                    "bytes": 0,
+                    "error": "",
+                },
             },
             d2=response,
             msg="Unattached volumes dont match",
@@ -550,10 +785,12 @@ class TestApp(unittest.TestCase):
                     },
                 ],
                 "volume_states": {
-                    "us-east-1": {"unattached": 3, "error": 0},
-                    "us-west-1": {"unattached": 3, "error": 0},
+                    ("", "us-east-1"): {"unattached": 3, "error": 0},
+                    ("", "us-west-1"): {"unattached": 3, "error": 0},
                 },
-                "stopped_instances_count": {"us-east-1": 2, "us-west-1": 4},
+                "stopped_instances_count": {("", "us-east-1"): 2, ("", "us-west-1"): 2},
+                "attached_storage": [],
+                "resources": {},
             },
             d2=response,
         )
@@ -586,19 +823,1122 @@ class TestApp(unittest.TestCase):
             )
 
 
+    def test_background_refresh(self):
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"env": ["dev"]},
+            client_getter=get_aws_client,
+            refresh_interval=60,
+        )
+        # no snapshot yet: scrapes must not call AWS and report a stale snapshot
+        names = [metric.name for metric in collector.collect()]
+        self.assertNotIn("sau_ec2_stopped_instances", names)
+        _, age = collector.get_snapshot()
+        self.assertEqual(first=age, second=-1.0)
+        self.assertTrue(collector.is_stale(age))
+
+        collector.start_refresher()
+        for _ in range(50):
+            if collector.snapshot is not None:
+                break
+            time.sleep(0.1)
+        collector.stop_refresher()
+
+        metrics = {metric.name: metric for metric in collector.collect()}
+        self.assertIn("sau_ec2_stopped_instances", metrics)
+        self.assertIn("sau_ebs_volumes", metrics)
+        self.assertEqual(first=metrics["sau_snapshot_stale"].samples[0].value, second=0)
+        self.assertGreaterEqual(metrics["sau_snapshot_age_seconds"].samples[0].value, 0)
+
+    def test_executor_reuse(self):
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"env": ["dev"]},
+            client_getter=get_aws_client,
+            workers=2,
+        )
+        first = collector.get_instance_metrics()
+        executor = collector.executor
+        self.assertIsNotNone(executor)
+        second = collector.get_instance_metrics()
+        self.assertIs(collector.executor, executor)
+        self.assertDictEqual(d1=first, d2=second)
+        # process pool tasks pickle the collector without the collected data
+        collector.refresh()
+        worker = pickle.loads(pickle.dumps(collector))
+        self.assertIsNone(worker.snapshot)
+        self.assertDictEqual(d1=worker.api_stats, d2={})
+        self.assertDictEqual(d1=worker.region_freshness, d2={})
+        self.assertEqual(worker.exclude_tags, collector.exclude_tags)
+        collector.shutdown()
+        self.assertIsNone(collector.executor)
+        with self.assertRaises(ValueError):
+            EC2SAUCollector(
+                regions=self.regions,
+                exclude_tags={},
+                client_getter=get_aws_client,
+                executor="fork",
+            )
+
+    def test_async_engine(self):
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"env": ["dev"]},
+            client_getter=get_aws_client,
+            engine="async",
+            concurrency=1,
+        )
+        self.assertDictEqual(
+            d1=collector.get_instance_metrics(),
+            d2=self.collector.get_instance_metrics(),
+        )
+        collector.shutdown()
+
+        # the worker pool grows to the concurrency limit instead of capping it
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={},
+            client_getter=get_aws_client,
+            engine="async",
+            workers=2,
+            concurrency=8,
+        )
+        self.assertEqual(first=collector.pool_size(), second=8)
+        collector.get_instance_metrics()
+        self.assertEqual(first=collector.executor._max_workers, second=8)
+        collector.shutdown()
+
+    def test_pagination(self):
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"env": ["dev"]},
+            client_getter=get_aws_client,
+            page_size=1,
+        )
+        client = get_aws_client("ec2", region_name=self.regions[0])
+        stats = collector.new_stats("", self.regions[0], "describe_volumes")
+        volumes = collector.paginate(client, "describe_volumes", "Volumes", stats, Filters=[])
+        self.assertEqual(first=next(volumes)["VolumeId"], second="vol-0c")
+        # pages are fetched lazily as the stream is consumed
+        self.assertEqual(first=client.pages, second=1)
+        self.assertListEqual(list1=[v["VolumeId"] for v in volumes], list2=["vol-0d", "vol-0ef"])
+        self.assertEqual(first=client.pages, second=3)
+
+        region = self.regions[0]
+        paged = collector.get_unattached_volumes(region=region)
+        self.assertEqual(first=paged.pop("stats")["pages"], second=3)
+        response = self.collector.get_unattached_volumes(region=region)
+        self.assertEqual(first=response.pop("stats")["pages"], second=1)
+        self.assertDictEqual(d1=paged, d2=response)
+        paged = collector.get_stopped_ec2(region=region)
+        response = self.collector.get_stopped_ec2(region=region)
+        self.assertDictEqual(
+            d1={**paged, "stats": None}, d2={**response, "stats": None}
+        )
+
+    def test_client_cache(self):
+        sessions = []
+
+        class Session:
+            # stands in for boto3.Session, building real sessions and clients is slow under tracemalloc
+            def __init__(self, botocore_session=None):
+                self.botocore_session = botocore_session
+                sessions.append(self)
+
+            def client(self, module, region_name, config):
+                return mock.NonCallableMock(module=module, region_name=region_name, config=config, session=self)
+
+        stub_session = mock.patch("sau.__main__.boto3.Session", new=Session)
+        stub_core = mock.patch("sau.__main__.botocore.session.get_session", side_effect=mock.NonCallableMock)
+        with stub_session, stub_core:
+            cache = AWSClientCache(
+                ttl=3600,
+                max_pool_connections=4,
+                accounts=[{"name": "other", "role_arn": "arn:aws:iam::012345678901:role/sau"}],
+            )
+            expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+            cache.assume_role = lambda account: {
+                "access_key": f"{account}-key",
+                "secret_key": "secret",
+                "token": "token",
+                "expiry_time": expiry.isoformat(),
+            }
+            client = cache("ec2", region_name="us-east-1")
+            self.assertIs(cache("ec2", region_name="us-east-1"), client)
+            self.assertIsNot(cache("ec2", region_name="us-west-1"), client)
+            other = cache("ec2", region_name="us-east-1", account="other")
+            self.assertIsNot(other, client)
+            self.assertEqual(first=other.session.botocore_session._credentials.access_key, second="other-key")
+            self.assertEqual(first=client.config.max_pool_connections, second=4)
+            self.assertEqual(first=len(sessions), second=2)
+            with self.assertRaises(ValueError):
+                cache("ec2", region_name="us-east-1", account="unknown")
+
+            cache.ttl = 0
+            self.assertIsNot(cache("ec2", region_name="us-east-1"), client)
+            self.assertEqual(first=len(sessions), second=3)
+            samples = {
+                sample.labels["region"] + sample.labels["account"]: sample.value
+                for metric in cache.collect()
+                for sample in metric.samples
+                if sample.name == "sau_aws_clients_created_total"
+            }
+            self.assertDictEqual(d1=samples, d2={"us-east-1": 2, "us-west-1": 1, "us-east-1other": 1})
+
+            # process pool tasks unpickle a copy per task, the copies share their clients
+            cache = AWSClientCache()
+            first, second = (pickle.loads(pickle.dumps(cache)) for _ in range(2))
+            client = first("ec2", region_name="us-east-1")
+            self.assertIs(second("ec2", region_name="us-east-1"), client)
+            self.assertEqual(cache.clients, {})
+            self.assertEqual(first=len(sessions), second=4)
+
+    def test_resource_table(self):
+        rows = [
+            {
+                "volumeid": f"vol-{i}",
+                "region": "us-east-1",
+                "state": "unattached",
+                "tag_team": f"t{i % 3}",
+            }
+            for i in range(1000)
+        ] + [{"volumeid": "vol-x", "region": "eu-west-1", "name": ""}]
+        table = ResourceTable(rows)
+        self.assertEqual(first=len(table), second=1001)
+        self.assertListEqual(list1=list(table), list2=rows)
+        self.assertEqual(first=table, second=rows)
+        self.assertEqual(first=table[-1], second=rows[-1])
+        self.assertEqual(first=table[3], second=rows[3])
+        for index in (1001, -1002):
+            with self.assertRaises(IndexError):
+                table[index]
+        with self.assertRaises(IndexError):
+            ResourceTable()[0]
+        # distinct values are stored once: 1001 ids, 7 shared values and the "absent" slot
+        self.assertEqual(first=len(table.strings), second=1009)
+
+        restored = pickle.loads(pickle.dumps(table))
+        self.assertEqual(first=restored, second=table)
+        self.assertLess(len(pickle.dumps(table)), len(pickle.dumps(rows)))
+
+        merged = ResourceTable([{"name": "a", "region": "us-west-1"}])
+        merged.extend(table[:2])
+        merged.extend([{"region": "us-west-2", "tag_env": "dev"}])
+        self.assertListEqual(
+            list1=list(merged),
+            list2=[{"name": "a", "region": "us-west-1"}]
+            + rows[:2]
+            + [{"region": "us-west-2", "tag_env": "dev"}],
+        )
+        _, values = merged.schema(["region", "tag_env", "missing"])
+        self.assertListEqual(
+            list1=values,
+            list2=[
+                ("us-west-1", "", ""),
+                ("us-east-1", "", ""),
+                ("us-east-1", "", ""),
+                ("us-west-2", "dev", ""),
+            ],
+        )
+
+    def test_cost_metrics(self):
+        pricing = Pricing(prices={"us-east-1": {"gp3": 0.1}})
+        self.assertEqual(first=pricing.price("us-east-1", "gp3"), second=0.1)
+        self.assertEqual(first=pricing.price("us-west-1", "gp3"), second=0.096)
+        self.assertEqual(first=pricing.price("me-south-1", "gp2"), second=0.10)
+        self.assertEqual(first=pricing.price("us-east-1", "unknown"), second=0.0)
+
+        collector = EC2SAUCollector(
+            regions=self.regions[:1],
+            exclude_tags={},
+            client_getter=AttachedStorageClient,
+            pricing=pricing,
+        )
+        metrics = {metric.name: metric for metric in collector.collect()}
+        costs = {
+            sample.labels["volumeid"]: sample.value
+            for sample in metrics["sau_ebs_volume_monthly_cost_dollars"].samples
+        }
+        self.assertDictEqual(d1=costs, d2={"vol-0c": 2.0, "vol-0d": 2.0, "vol-0ef": 1.5})
+        storage = metrics["sau_ec2_stopped_instance_attached_storage_cost_dollars"].samples
+        # both instances of the mock share an id, so both own the two root volumes
+        self.assertListEqual(list1=[sample.value for sample in storage], list2=[20.0, 20.0])
+
+        collector.aggregate = True
+        collector.aggregate_by = ["region"]
+        metrics = {metric.name: metric for metric in collector.collect()}
+        total = metrics["sau_ebs_volume_monthly_cost_dollars"].samples
+        self.assertEqual(first=len(total), second=1)
+        self.assertAlmostEqual(first=total[0].value, second=5.5)
+        collector.shutdown()
+
+        # costs are opt-in
+        names = [metric.name for metric in self.collector.collect()]
+        self.assertNotIn("sau_ebs_volume_monthly_cost_dollars", names)
+
+    def test_fake_ec2(self):
+        # the same check over HTTP through the botocore parser runs in benchmark.py --http
+        regions = ["us-east-1", "eu-west-1"]
+        fake = FakeEC2(instances=40, volumes=50)
+        collector = EC2SAUCollector(regions=regions, exclude_tags={}, client_getter=fake, page_size=7)
+        collector.refresh()
+        snapshot = collector.snapshot
+        collector.shutdown()
+        self.assertEqual(collector.errors, 0)
+        for region in regions:
+            expected = fake.expected(region)
+            instances = [r for r in snapshot["stopped_instances"] if r["region"] == region]
+            self.assertEqual(len(instances), expected["stopped_instances"])
+            self.assertDictEqual(
+                snapshot["volume_states"][("", region)],
+                {"unattached": expected["unattached"], "error": expected["error"]},
+            )
+        expected = fake.expected("us-east-1")
+        stats = collector.api_stats[("", "us-east-1", "describe_volumes")]
+        self.assertEqual(stats["items"], expected["unattached"] + expected["error"])
+        self.assertEqual(stats["pages"], -(-stats["items"] // 7))
+
+        # server side tag filters are applied by the fake
+        client = fake("ec2", "us-east-1")
+        filters = [
+            {"Name": "status", "Values": ["available"]},
+            {"Name": "tag:env", "Values": ["stage"]},
+        ]
+        volumes = client.describe_volumes(Filters=filters)["Volumes"]
+        self.assertTrue(volumes)
+        self.assertTrue(all({"Key": "env", "Value": "stage"} in volume["Tags"] for volume in volumes))
+
+    def test_config_reload(self):
+        fake = FakeEC2(instances=20, volumes=20)
+        described = []
+
+        def client_getter(module: str, region_name: str) -> Any:
+            described.append(region_name)
+            return fake(module, region_name)
+
+        collector = EC2SAUCollector(
+            regions=["us-east-1", "us-west-1"],
+            exclude_tags={},
+            client_getter=client_getter,
+            refresh_interval=60,
+        )
+        collector.refresh()
+        before = [row for row in collector.snapshot["volumes"] if row["region"] == "us-east-1"]
+        described.clear()
+
+        # only the added region is collected, the removed one is dropped
+        added = collector.reconfigure(regions=["us-east-1", "eu-west-1"])
+        self.assertEqual(added, [("", "eu-west-1")])
+        self.assertEqual(set(described), {"eu-west-1"})
+        snapshot = collector.snapshot
+        self.assertEqual({row["region"] for row in snapshot["volumes"]}, {"us-east-1", "eu-west-1"})
+        self.assertEqual(
+            [row for row in snapshot["volumes"] if row["region"] == "us-east-1"], before
+        )
+        self.assertEqual(
+            snapshot["volume_states"][("", "eu-west-1")]["unattached"],
+            fake.expected("eu-west-1")["unattached"],
+        )
+        self.assertNotIn(("", "us-west-1"), snapshot["stopped_instances_count"])
+        self.assertIsNotNone(collector.rendered)
+
+        # new tag filters invalidate every region
+        described.clear()
+        collector.reconfigure(exclude_tags={"env": ["production"]})
+        self.assertEqual(set(described), {"us-east-1", "eu-west-1"})
+        self.assertNotIn("production", {row["tag_env"] for row in collector.snapshot["volumes"]})
+        collector.shutdown()
+
+    def test_refresh_scheduler(self):
+        scheduler = RefreshScheduler(jitter=0)
+        scheduler.add({("", region, "ec2"): 100 for region in "abcd"}, now=0)
+        # spread evenly across the interval instead of all due at once
+        self.assertEqual(scheduler.pop_due(24), [])
+        self.assertEqual(scheduler.pop_due(50), [("", "a", "ec2"), ("", "b", "ec2")])
+        scheduler.reschedule(("", "a", "ec2"), now=50)
+        scheduler.remove([("", "c", "ec2")])
+        scheduler.add({("", "c", "ec2"): 10}, now=60, spread=False)
+        self.assertEqual(scheduler.pop_due(100), [("", "c", "ec2"), ("", "d", "ec2")])
+        self.assertEqual(scheduler.pop_due(150), [("", "a", "ec2")])
+        self.assertEqual(len(scheduler), 4)
+
+        fake = FakeEC2(instances=20, volumes=20)
+        described = collections.Counter()
+
+        def client_getter(module: str, region_name: str) -> Any:
+            described[region_name] += 1
+            return fake(module, region_name)
+
+        collector = EC2SAUCollector(
+            regions=["us-east-1", "us-west-1"],
+            exclude_tags={},
+            client_getter=client_getter,
+            refresh_interval=60,
+            schedule="staggered",
+            region_intervals={"us-west-1": 0.05},
+        )
+        collector.start_refresher()
+        try:
+            deadline = time.time() + 10
+            while described["us-west-1"] < 10 and time.time() < deadline:
+                time.sleep(0.01)
+            # us-east-1 was only described by the first, full collection
+            self.assertGreaterEqual(described["us-west-1"], 10)
+            self.assertEqual(described["us-east-1"], 2)
+            snapshot, _ = collector.get_snapshot()
+            self.assertEqual(
+                {row["region"] for row in snapshot["volumes"]}, {"us-east-1", "us-west-1"}
+            )
+            self.assertEqual(
+                snapshot["volume_states"][("", "us-east-1")]["unattached"],
+                fake.expected("us-east-1")["unattached"],
+            )
+            collector.reconfigure(regions=["us-east-1", "eu-west-1"])
+            self.assertEqual(len(collector.scheduler), 4)
+            snapshot, _ = collector.get_snapshot()
+            self.assertEqual(
+                {row["region"] for row in snapshot["volumes"]}, {"us-east-1", "eu-west-1"}
+            )
+        finally:
+            collector.shutdown()
+
+        def series(body: bytes) -> set:
+            # empty labels are the same as missing ones
+            return {
+                (sample.name, frozenset(i for i in sample.labels.items() if i[1]), sample.value)
+                for family in text_string_to_metric_families(body.decode())
+                for sample in family.samples
+            }
+
+        collector = EC2SAUCollector(
+            regions=["us-east-1", "us-west-1", "eu-west-1"],
+            exclude_tags={},
+            client_getter=fake,
+            refresh_interval=60,
+            schedule="staggered",
+        )
+        snapshot = collector.refresh()
+        body, compressed = collector.rendered["text"]
+        # assembled from per-region fragments, the same series as a render of the whole snapshot
+        self.assertEqual(series(body), series(collector.render(snapshot)["text"][0]))
+        self.assertEqual(gzip.decompress(compressed), body)
+        # a batch only renders its region, the snapshot is recomposed once per refresh_interval
+        with mock.patch.object(collector, "compose_metrics", wraps=collector.compose_metrics) as compose:
+            self.assertIsNone(collector.refresh_items([("", "us-west-1", "volume")]))
+        self.assertEqual(compose.call_count, 1)
+        self.assertIs(collector.snapshot, snapshot)
+        self.assertEqual(series(collector.rendered["text"][0]), series(body))
+        collector.snapshot_time -= 60
+        self.assertIsNotNone(collector.refresh_items([("", "us-west-1", "ec2")]))
+        self.assertIsNot(collector.snapshot, snapshot)
+        collector.shutdown()
+
+    def test_sharding(self):
+        regions = [f"region-{n}" for n in range(16)]
+        units = [(account, region) for account in ("a", "b", "c") for region in regions]
+        rings = {count: HashRing(count) for count in (1, 3, 4)}
+        self.assertEqual({rings[1].shard(unit) for unit in units}, {0})
+        owners = {unit: rings[3].shard(unit) for unit in units}
+        self.assertEqual(set(owners.values()), {0, 1, 2})
+        # adding a shard only moves units to the new shard
+        moved = [unit for unit in units if rings[4].shard(unit) != owners[unit]]
+        self.assertTrue(moved)
+        self.assertLess(len(moved), len(units) / 2)
+        self.assertEqual({rings[4].shard(unit) for unit in moved}, {3})
+
+        fake = FakeEC2(instances=10, volumes=10)
+        seen = []
+        for shard_index in range(3):
+            collector = EC2SAUCollector(
+                regions=regions,
+                exclude_tags={},
+                client_getter=fake,
+                shard_index=shard_index,
+                shard_count=3,
+            )
+            registry = CollectorRegistry()
+            registry.register(collector)
+            families = {
+                family.name: family
+                for family in text_string_to_metric_families(
+                    generate_latest(registry).decode()
+                )
+            }
+            collector.shutdown()
+            shard = families["sau_shard_info"].samples[0].labels
+            self.assertEqual(shard, {"shard_index": str(shard_index), "shard_count": "3"})
+            owned = {region for _, region in collector.targets()}
+            self.assertEqual(families["sau_shard_targets"].samples[0].value, len(owned))
+            exposed = {
+                sample.labels["region"] for sample in families["sau_region_data_age_seconds"].samples
+            }
+            self.assertEqual(exposed, owned)
+            seen.extend(owned)
+        self.assertEqual(sorted(seen), sorted(regions))
+
+        with self.assertRaises(ValueError):
+            EC2SAUCollector(
+                regions=regions, exclude_tags={}, client_getter=fake, shard_index=3, shard_count=3
+            )
+        filepath = os.path.dirname(os.path.abspath(__file__))
+        with mock.patch.dict(os.environ, {"SAU_SHARD_INDEX": "1", "SAU_SHARD_COUNT": "2"}):
+            config = Util.get_config(filename=f"{filepath}/../configs/config.yaml")
+        self.assertEqual(config["sharding"], {"shard_index": 1, "shard_count": 2})
+
+    def test_config_reloader(self):
+        root = logging.getLogger()
+        level = root.level
+        collector = EC2SAUCollector(
+            regions=["us-east-1"], exclude_tags={}, client_getter=FakeEC2(), refresh_interval=60
+        )
+        collector.refresh()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "config.yaml")
+            with open(filename, "w") as file:
+                file.write("regions: [us-east-1]\n")
+            reloader = ConfigReloader(
+                filename=filename,
+                config=Util.get_config(filename),
+                collector=collector,
+                log=Log(),
+            )
+            try:
+                with open(filename, "w") as file:
+                    file.write("regions: [us-east-1, eu-west-1]\nexporter_port: 9292\n")
+                    file.write("logging: {level: debug}\n")
+                with self.assertLogs(level="WARNING") as logs:
+                    self.assertTrue(reloader.reload())
+                    self.assertEqual(root.level, logging.DEBUG)
+                self.assertIn("changes to exporter_port need a restart", logs.output[0])
+                self.assertEqual(collector.regions, ["us-east-1", "eu-west-1"])
+
+                # a broken config keeps the running one
+                with open(filename, "w") as file:
+                    file.write("regions: []\n")
+                with self.assertLogs(level="ERROR"):
+                    self.assertFalse(reloader.reload())
+                self.assertEqual(collector.regions, ["us-east-1", "eu-west-1"])
+                # a file removed while being read exits in read_yaml_file
+                with mock.patch.object(Util, "read_yaml_file", side_effect=SystemExit(1)):
+                    with self.assertLogs(level="ERROR"):
+                        self.assertFalse(reloader.reload())
+
+                # SIGHUP reloads from the reloader thread
+                with open(filename, "w") as file:
+                    file.write("regions: [us-east-1]\nexporter_port: 9292\n")
+                reloader.start()
+                os.kill(os.getpid(), signal.SIGHUP)
+                deadline = time.time() + 10
+                while reloader.reloads["success"] < 2 and time.time() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(reloader.reloads, {"success": 2, "failure": 2})
+                self.assertEqual(collector.regions, ["us-east-1"])
+            finally:
+                reloader.stop()
+                signal.signal(signal.SIGHUP, signal.SIG_DFL)
+                root.setLevel(level)
+                collector.shutdown()
+
+    def test_resource_collectors(self):
+        resources = {
+            "snapshots": {},
+            "elastic_ips": {},
+            "network_interfaces": {"interval": 0},
+            "images": {"max_age_days": 30},
+        }
+        collector = EC2SAUCollector(
+            regions=self.regions[:1],
+            exclude_tags={"env": ["dev"]},
+            client_getter=WasteClient,
+            resources=resources,
+        )
+        WasteClient.calls.clear()
+        data = collector.get_instance_metrics()
+        keys = {
+            "snapshots": "snapshotid",
+            "elastic_ips": "allocationid",
+            "network_interfaces": "networkinterfaceid",
+            "images": "imageid",
+        }
+        ids = {name: [row[keys[name]] for row in rows] for name, rows in data["resources"].items()}
+        self.assertDictEqual(
+            d1=ids,
+            d2={
+                "snapshots": ["snap-02"],
+                "elastic_ips": ["eipalloc-01"],
+                "network_interfaces": ["eni-02"],
+                "images": ["ami-01"],
+            },
+        )
+        self.assertEqual(first=collector.filtered["network_interfaces"]["exclude"], second=1)
+
+        # sources are described again only once their interval elapsed
+        data = collector.get_instance_metrics()
+        self.assertEqual(first=WasteClient.calls.count("describe_snapshots"), second=1)
+        self.assertEqual(first=len(data["resources"]["snapshots"]), second=1)
+        self.assertEqual(first=collector.filtered["network_interfaces"]["exclude"], second=2)
+
+        metrics = {metric.name: metric for metric in collector.collect()}
+        self.assertEqual(first=metrics["sau_ebs_orphaned_snapshots_total"].samples[0].value, second=1)
+        snapshot = metrics["sau_ebs_orphaned_snapshots"].samples[0].labels
+        self.assertEqual(first=snapshot["name"], second="old-backup")
+        self.assertEqual(first=snapshot["tag_name"], second="old-backup")
+
+        # a filter change drops the rows of every source, they are collected again right away
+        collector.reconfigure(exclude_tags={"env": ["prod"]})
+        metrics = {metric.name: metric for metric in collector.collect()}
+        self.assertEqual(first=WasteClient.calls.count("describe_snapshots"), second=2)
+        self.assertEqual(first=metrics["sau_ebs_orphaned_snapshots_total"].samples[0].value, second=1)
+        interfaces = metrics["sau_ec2_available_network_interfaces"].samples
+        self.assertEqual(first=[sample.labels["networkinterfaceid"] for sample in interfaces], second=["eni-01"])
+        collector.shutdown()
+
+        with self.assertRaises(ValueError):
+            EC2SAUCollector(
+                regions=self.regions, exclude_tags={}, client_getter=WasteClient, resources={"x": {}}
+            )
+        # a source without describe() fails when created, not during a refresh
+        with self.assertRaises(TypeError):
+            type("NoDescribeCollector", (ResourceCollector,), {})()
+
+    def test_throttling(self):
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={},
+            client_getter=ThrottledClient,
+            backoff_retries=2,
+            backoff_base=0.01,
+        )
+        response = collector.get_unattached_volumes(region="us-east-1")
+        self.assertEqual(first=response["errorcount"], second=0)
+        self.assertEqual(first=len(response["response"]["result"]), second=3)
+        self.assertEqual(first=response["stats"]["throttles"], second=2)
+
+        collector.backoff_retries = 1
+        response = collector.get_unattached_volumes(region="us-east-1")
+        self.assertEqual(first=response["errorcount"], second=1)
+
+        limiter = RateLimiter(rate=100, burst=2)
+        waits = [limiter.acquire(("", "us-east-1", "describe_volumes")) for _ in range(4)]
+        self.assertListEqual(list1=waits[:2], list2=[0.0, 0.0])
+        self.assertGreater(waits[2], 0)
+        self.assertEqual(first=limiter.acquire(("", "us-west-1", "describe_volumes")), second=0.0)
+        self.assertEqual(first=RateLimiter(rate=0, burst=1).acquire(("",)), second=0.0)
+
+        # copies pickled into process pool workers take tokens from the shared buckets
+        limiter = RateLimiter(rate=5, burst=2)
+        limiter.share()
+        try:
+            workers = [pickle.loads(pickle.dumps(limiter)) for _ in range(3)]
+            waits = [worker.acquire(("", "us-east-1", "describe_volumes")) for worker in workers]
+            self.assertListEqual(list1=waits[:2], list2=[0.0, 0.0])
+            self.assertGreater(waits[2], 0)
+        finally:
+            limiter.unshare()
+        self.assertIn(("", "us-east-1", "describe_volumes"), limiter.buckets)
+
+    def test_self_metrics(self):
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={},
+            client_getter=ThrottledClient,
+            backoff_retries=0,
+            page_size=1,
+        )
+        metrics = {metric.name: metric for metric in collector.collect()}
+        samples = {
+            (sample.name, sample.labels.get("api"), sample.labels.get("le")): sample.value
+            for metric in metrics.values()
+            for sample in metric.samples
+            if sample.labels.get("region", "us-east-1") == "us-east-1"
+        }
+        self.assertEqual(
+            first=samples[("sau_aws_request_duration_seconds_count", "describe_instances", None)],
+            second=2,
+        )
+        self.assertEqual(first=samples[("sau_aws_pages_total", "describe_instances", None)], second=2)
+        self.assertEqual(first=samples[("sau_aws_items_total", "describe_instances", None)], second=2)
+        self.assertEqual(
+            first=samples[("sau_collection_errors_total", "describe_volumes", None)], second=1
+        )
+        errors = metrics["sau_collection_errors"].samples
+        self.assertEqual(first=errors[0].labels["type"], second="RequestLimitExceeded")
+        self.assertEqual(first=samples[("sau_collection_duration_seconds_count", None, None)], second=1)
+        self.assertEqual(first=samples[("sau_worker_queue_depth", None, None)], second=0)
+        collector.shutdown()
+
+    def test_exposition(self):
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"env": ["dev"]},
+            client_getter=get_aws_client,
+            refresh_interval=60,
+        )
+        server = MetricsServer(collector=collector, registry=CollectorRegistry())
+        # no snapshot yet: the zeroed totals are rendered on the fly
+        body, _ = server.render()
+        self.assertIn(b"sau_snapshot_stale 1.0", body)
+
+        collector.refresh()
+        self.assertIs(collector.exposition("text"), collector.rendered["text"])
+        body, headers = server.render(accept="text/plain", accept_encoding="gzip")
+        self.assertEqual(first=headers["Content-Encoding"], second="gzip")
+        text = gzip.decompress(body).decode()
+        families = {family.name: family for family in text_string_to_metric_families(text)}
+        self.assertEqual(
+            first=len(families["sau_ebs_volumes"].samples), second=len(collector.snapshot["volumes"])
+        )
+        self.assertIn("sau_snapshot_age_seconds", families)
+
+        body, headers = server.render(accept="application/openmetrics-text; version=1.0.0,text/plain;q=0.5")
+        self.assertTrue(headers["Content-Type"].startswith("application/openmetrics-text"))
+        families = list(openmetrics_parser.text_string_to_metric_families(body.decode()))
+        self.assertEqual(first=body.count(b"# EOF"), second=1)
+        self.assertIn("sau_ec2_stopped_instances", [family.name for family in families])
+
+        collector.shutdown()
+
+    def test_http_server(self):
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"env": ["dev"]},
+            client_getter=get_aws_client,
+            refresh_interval=60,
+        )
+        server = MetricsServer(collector=collector, registry=CollectorRegistry())
+        server.start(port=0, addr="127.0.0.1")
+        url = f"http://127.0.0.1:{server.port}"
+        with urllib.request.urlopen(f"{url}/healthz") as response:
+            self.assertEqual(first=response.status, second=200)
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{url}/ready")
+        self.assertEqual(first=error.exception.code, second=503)
+
+        collector.refresh()
+        with urllib.request.urlopen(f"{url}/ready") as response:
+            self.assertEqual(first=response.status, second=200)
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            self.assertIn(b"sau_ebs_volumes_total", response.read())
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{url}/missing")
+        self.assertEqual(first=error.exception.code, second=404)
+        server.stop()
+        collector.shutdown()
+
+        # concurrent scrapes share one collection
+        collector = EC2SAUCollector(
+            regions=self.regions, exclude_tags={}, client_getter=get_aws_client
+        )
+        refresh, calls = collector.refresh, []
+
+        def slow_refresh():
+            calls.append(1)
+            time.sleep(0.2)
+            return refresh()
+
+        collector.refresh = slow_refresh
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda _: collector.refresh_once(), range(4)))
+        self.assertEqual(first=len(calls), second=1)
+        self.assertTrue(all(result is results[0] for result in results))
+        collector.shutdown()
+
+    def test_snapshot_persistence(self):
+        path = os.path.join(tempfile.mkdtemp(), "snapshot.jsonl")
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"env": ["dev"]},
+            client_getter=get_aws_client,
+            refresh_interval=60,
+            snapshot_path=path,
+        )
+        data = collector.refresh()
+        self.assertFalse(os.path.exists(f"{path}.tmp"))
+
+        restarted = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"env": ["dev"]},
+            client_getter=get_aws_client,
+            refresh_interval=60,
+            snapshot_path=path,
+        )
+        self.assertTrue(restarted.load_snapshot())
+        restored, age = restarted.get_snapshot()
+        self.assertDictEqual(d1=restored, d2=data)
+        self.assertGreaterEqual(age, 0)
+        self.assertTrue(restarted.is_stale(age))
+        self.assertIsNotNone(restarted.rendered)
+
+        restarted.refresh()
+        self.assertFalse(restarted.is_stale(restarted.get_snapshot()[1]))
+
+        # regions no longer configured are dropped
+        narrowed = EC2SAUCollector(
+            regions=self.regions[:1],
+            exclude_tags={},
+            client_getter=get_aws_client,
+            refresh_interval=60,
+            snapshot_path=path,
+        )
+        self.assertTrue(narrowed.load_snapshot())
+        restored, _ = narrowed.get_snapshot()
+        self.assertListEqual(list1=list(restored["volume_states"]), list2=[("", self.regions[0])])
+        self.assertTrue(all(row["region"] == self.regions[0] for row in restored["volumes"]))
+
+    def test_last_known_good(self):
+        clients = {"getter": get_aws_client}
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={},
+            client_getter=lambda module, region_name: clients["getter"](module, region_name),
+            backoff_retries=0,
+        )
+        fresh = collector.get_instance_metrics()
+
+        clients["getter"] = ThrottledClient
+        data = collector.get_instance_metrics()
+        self.assertEqual(first=collector.errors, second=2)
+        self.assertListEqual(list1=list(data["volumes"]), list2=list(fresh["volumes"]))
+        self.assertDictEqual(d1=data["volume_states"], d2=fresh["volume_states"])
+        ages = {
+            (sample.labels["region"], sample.labels["resource"]): sample.labels["stale"]
+            for metric in collector.collect()
+            if metric.name == "sau_region_data_age_seconds"
+            for sample in metric.samples
+        }
+        self.assertEqual(first=ages[("us-east-1", "volume")], second="true")
+        self.assertEqual(first=ages[("us-east-1", "ec2")], second="false")
+
+        # expired data is no longer served
+        collector.max_stale_age = 0
+        time.sleep(0.01)
+        data = collector.get_instance_metrics()
+        self.assertListEqual(list1=list(data["volumes"]), list2=[])
+        collector.shutdown()
+
+    def test_accounts(self):
+        calls = []
+
+        def client_getter(module: str, region_name: str, account: str = "") -> Any:
+            calls.append((account, region_name))
+            return MockClient(module, region_name=region_name)
+
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={},
+            client_getter=client_getter,
+            accounts=[
+                {"name": "prod", "role_arn": "arn:aws:iam::111111111111:role/sau"},
+                {"name": "dev", "role_arn": "arn:aws:iam::222222222222:role/sau"},
+            ],
+        )
+        data = collector.get_instance_metrics()
+        self.assertSetEqual(
+            set1=set(calls),
+            set2={(a, r) for a in ("prod", "dev") for r in self.regions},
+        )
+        self.assertDictEqual(
+            d1=data["stopped_instances_count"],
+            d2={(a, r): 2 for a in ("prod", "dev") for r in self.regions},
+        )
+        self.assertSetEqual(
+            set1={row["account"] for row in data["volumes"]}, set2={"prod", "dev"}
+        )
+        metrics = {metric.name: metric for metric in collector.compose_metrics(data)}
+        self.assertDictEqual(
+            d1=metrics["sau_ebs_volumes_total"].samples[0].labels,
+            d2={"status": "unattached", "region": "us-east-1", "account": "prod"},
+        )
+        self.assertEqual(
+            first=collector.account_ids, second={"111111111111": "prod", "222222222222": "dev"}
+        )
+        collector.shutdown()
+
+    def test_include_tags(self):
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"Name": ["POC-SAU-03"]},
+            include_tags={"environment": ["STAGE"]},
+            client_getter=get_aws_client,
+        )
+        client = get_aws_client("ec2", region_name=self.regions[0])
+        counts = {"fetched": 0, "include": 0, "exclude": 0}
+        states = {"unattached": 0, "error": 0}
+        volumes = list(collector.iter_unattached_volumes(client, self.regions[0], states, counts))
+        self.assertListEqual(list1=[v["volumeid"] for v in volumes], list2=["vol-0d"])
+        self.assertDictEqual(d1=counts, d2={"fetched": 3, "include": 1, "exclude": 1})
+        # only the tag key is pushed to AWS, values are matched case insensitively
+        self.assertIn({"Name": "tag:environment", "Values": ["*"]}, client.filters)
+
+        collector.tag_values_server_side = True
+        self.assertListEqual(
+            list1=collector.tag_filters(),
+            list2=[{"Name": "tag:environment", "Values": ["STAGE"]}],
+        )
+
+        collector.get_instance_metrics()
+        samples = {
+            (sample.labels["resource"], sample.labels["stage"]): sample.value
+            for metric in collector.collect()
+            for sample in metric.samples
+            if sample.name == "sau_items_filtered_total"
+        }
+        self.assertEqual(first=samples[("volume", "exclude")], second=4)
+        self.assertEqual(first=samples[("ec2", "include")], second=4)
+        collector.shutdown()
+
+    def test_tag_matcher(self):
+        matcher = TagMatcher({"env": ["Dev", "test-*", "regex:qa[0-9]+"], "team": ["ops"]})
+        self.assertTrue(matcher.any({"env": "DEV"}))
+        self.assertTrue(matcher.any({"env": "Test-42"}))
+        self.assertTrue(matcher.any({"env": "QA7"}))
+        self.assertFalse(matcher.any({"env": "qa7-prod"}))
+        self.assertFalse(matcher.any({"env": "prod"}))
+        self.assertFalse(matcher.all({"env": "dev"}))
+        self.assertTrue(matcher.all({"env": "dev", "team": "OPS"}))
+        self.assertTrue(TagMatcher({}).all({"env": "dev"}))
+        self.assertFalse(TagMatcher({}).any({"env": "dev"}))
+
+    def test_incremental_collection(self):
+        clients = {"getter": get_aws_client}
+        source = QueueEventSource()
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"env": ["dev"]},
+            client_getter=lambda module, region_name: clients["getter"](module, region_name),
+            event_source=source,
+        )
+        data = collector.refresh()
+        self.assertEqual(first=len(data["volumes"]), second=6)
+
+        # vol-0c is deleted in us-east-1, only that volume is described again
+        clients["getter"] = DeletedVolumeClient
+        source.put(
+            {
+                "detail-type": "EBS Volume Notification",
+                "region": "us-east-1",
+                "resources": ["arn:aws:ec2:us-east-1:012345678901:volume/vol-0c"],
+                "detail": {"event": "deleteVolume", "result": "deleted"},
+            }
+        )
+        source.put({"resource": "volume", "region": "eu-north-1", "id": "vol-0x"})
+        data = collector.refresh()
+        self.assertListEqual(
+            list1=[(v["region"], v["volumeid"]) for v in data["volumes"]],
+            list2=[
+                ("us-east-1", "vol-0d"),
+                ("us-east-1", "vol-0ef"),
+                ("us-west-1", "vol-0c"),
+                ("us-west-1", "vol-0d"),
+                ("us-west-1", "vol-0ef"),
+            ],
+        )
+        self.assertDictEqual(
+            d1=data["volume_states"],
+            d2={
+                ("", "us-east-1"): {"unattached": 2, "error": 0},
+                ("", "us-west-1"): {"unattached": 3, "error": 0},
+            },
+        )
+
+        # a failed refresh keeps the changes it had taken for the next one
+        source.put({"resource": "volume", "region": "us-west-1", "id": "vol-0c"})
+        with mock.patch.object(collector, "apply_changes", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                collector.get_incremental_metrics()
+        self.assertDictEqual(d1=collector.pending, d2={("volume", "", "us-west-1"): {"vol-0c"}})
+
+        # a full reconciliation picks up the deletion in every region
+        collector.reconcile_interval = 0
+        data = collector.refresh()
+        self.assertEqual(first=len(data["volumes"]), second=4)
+        collector.shutdown()
+
+        # replaying an event, also for an excluded volume, leaves the state totals unchanged
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={"environment": ["dev"]},
+            client_getter=get_aws_client,
+            event_source=source,
+        )
+        states = collector.refresh()["volume_states"]
+        self.assertDictEqual(d1=states[("", "us-east-1")], d2={"unattached": 3, "error": 0})
+        for _ in range(2):
+            for volume_id in ("vol-0c", "vol-0d"):
+                source.put({"resource": "volume", "region": "us-east-1", "id": volume_id})
+            data = collector.refresh()
+            self.assertDictEqual(d1=data["volume_states"], d2=states)
+            self.assertEqual(first=len(data["volumes"]), second=4)
+        collector.shutdown()
+
+    def test_event_sources(self):
+        self.assertDictEqual(
+            d1=EventSource.parse(
+                {
+                    "detail-type": "EC2 Instance State-change Notification",
+                    "region": "us-west-1",
+                    "detail": {"instance-id": "i-01", "state": "stopped"},
+                }
+            ),
+            d2={"resource": "ec2", "region": "us-west-1", "id": "i-01", "account": ""},
+        )
+        self.assertIsNone(EventSource.parse({"detail-type": "AWS API Call via CloudTrail"}))
+        with self.assertRaises(TypeError):
+            type("NoPollSource", (EventSource,), {})()
+        with self.assertLogs(level="WARNING"):
+            self.assertIsNone(
+                EventSource.parse({"resource": "instance", "region": "us-west-1", "id": "i-01"})
+            )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/events.jsonl"
+            source = FileEventSource(path=path)
+            self.assertListEqual(list1=source.poll(), list2=[])
+            with open(path, "w") as stream:
+                stream.write('{"resource": "ec2", "region": "us-east-1", "id": "i-01"}\n')
+                stream.write("not json\n")
+                stream.write('{"resource": "volume", "region": "us-east-1", "id": "vol-0c"}')
+            self.assertListEqual(
+                list1=source.poll(),
+                list2=[{"resource": "ec2", "region": "us-east-1", "id": "i-01", "account": ""}],
+            )
+            with open(path, "a") as stream:
+                stream.write("\n")
+            self.assertListEqual(
+                list1=source.poll(),
+                list2=[{"resource": "volume", "region": "us-east-1", "id": "vol-0c", "account": ""}],
+            )
+
+    def test_label_cardinality(self):
+        collector = EC2SAUCollector(
+            regions=self.regions,
+            exclude_tags={},
+            client_getter=get_aws_client,
+            label_tags=["Environment"],
+            max_series=4,
+        )
+        metrics = {metric.name: metric for metric in collector.collect()}
+        volumes = metrics["sau_ebs_volumes"].samples
+        self.assertEqual(first=len(volumes), second=4)
+        self.assertIn("tag_environment", volumes[0].labels)
+        self.assertNotIn("tag_name", volumes[0].labels)
+        dropped = {s.labels["metric"]: s.value for s in metrics["sau_series_dropped"].samples}
+        self.assertDictEqual(
+            d1=dropped, d2={"sau_ec2_stopped_instances": 0, "sau_ebs_volumes": 2}
+        )
+
+        collector.aggregate = True
+        collector.aggregate_by = ["region", "volumetype", "availabilityzone"]
+        metrics = {metric.name: metric for metric in collector.collect()}
+        self.assertListEqual(
+            list1=[(s.labels, s.value) for s in metrics["sau_ebs_volumes"].samples],
+            list2=[
+                ({"region": "us-east-1", "volumetype": "gp3", "availabilityzone": "eu-central-1a"}, 3),
+                ({"region": "us-west-1", "volumetype": "gp3", "availabilityzone": "eu-central-1a"}, 3),
+            ],
+        )
+        self.assertListEqual(
+            list1=[(s.labels, s.value) for s in metrics["sau_ec2_stopped_instances"].samples],
+            list2=[({"region": "us-east-1"}, 2), ({"region": "us-west-1"}, 2)],
+        )
+        collector.shutdown()
+
+    def test_label_schema(self):
+        rows = [
+            {"name": "a", "region": "us-east-1", "tag_env": "dev"},
+            {"name": "b", "region": "us-east-1", "tag_team": "ops"},
+            {"region": "us-west-1", "name": "c"},
+        ]
+        columns, values = EC2SAUCollector.label_schema(rows)
+        self.assertTupleEqual(tuple1=columns, tuple2=("name", "region", "tag_env", "tag_team"))
+        self.assertListEqual(
+            list1=values,
+            list2=[
+                ("a", "us-east-1", "dev", ""),
+                ("b", "us-east-1", "", "ops"),
+                ("c", "us-west-1", "", ""),
+            ],
+        )
+        self.assertEqual(
+            first=EC2SAUCollector.label_name("aws:cloudformation:Stack-Name"),
+            second="tag_aws_cloudformation_stack_name",
+        )
+        metric = self.collector.resource_metric(name="sau_test", documentation="test", rows=rows)
+        self.assertDictEqual(
+            d1=metric.samples[1].labels,
+            d2={"name": "b", "region": "us-east-1", "tag_env": "", "tag_team": "ops"},
+        )
+
     def test_util(self):
         self.assertEqual(first=self.util.default_exporter_port, second=9191)
         self.assertEqual(self.util.level, "info")
         self.assertEqual(self.util.path, ".")
         self.assertEqual(self.util.retention, 7)
         result = {
-            "logging": {"retention": 7, "directory": ".", "level": "info", "handler": "both"},
+            "logging": {
+                "retention": 7,
+                "directory": ".",
+                "level": "info",
+                "handler": "both",
+                "format": "text",
+                "repeat_interval": 60,
+            },
             "exporter_port": 9191,
+            "collection": {
+                "refresh_interval": 0,
+                "executor": "thread",
+                "workers": 0,
+                "engine": "pool",
+                "concurrency": 0,
+                "region_concurrency": 2,
+                "page_size": 500,
+                "tag_values_server_side": False,
+                "max_stale_age": 3600,
+                "snapshot_path": "",
+                "config_watch_interval": 0,
+                "schedule": "batch",
+                "jitter": 0.1,
+                "region_intervals": {},
+                "type_intervals": {},
+            },
+            "aws": {
+                "client_ttl": 3600,
+                "max_pool_connections": 10,
+                "retry_mode": "standard",
+                "max_attempts": 3,
+                "rate_limit": 0,
+                "burst": 100,
+                "backoff_retries": 3,
+                "backoff_base": 1.0,
+            },
+            "labels": {
+                "tags": [],
+                "max_series": 0,
+                "aggregate": False,
+                "aggregate_by": ["region", "availabilityzone", "volumetype", "state"],
+            },
+            "events": {
+                "source": "none",
+                "queue_url": "",
+                "region": "",
+                "path": "",
+                "reconcile_interval": 3600,
+            },
+            "cost": {"enabled": False, "prices": {}},
+            "sharding": {"shard_index": 0, "shard_count": 1},
+            "resources": {
+                "snapshots": {"enabled": False, "interval": 21600},
+                "elastic_ips": {"enabled": False, "interval": 3600},
+                "network_interfaces": {"enabled": False, "interval": 3600},
+                "images": {"enabled": False, "interval": 86400, "max_age_days": 180},
+            },
             "regions": ["eu-central-1", "eu-west-1"],
             "exclude_tags": {
                 "inv_environment_id": ["development"],
                 "inv_cluster_type": ["hansen"],
             },
+            "include_tags": {},
+            "accounts": [],
         }
         filepath = os.path.dirname(os.path.abspath(__file__))
         config_file = f"{filepath}/../configs/config.yaml"